@@ -0,0 +1,170 @@
+"""
+Пакетный запуск программ на EPL без графики.
+
+Компилирует и исполняет все программы из каталогов (или по шаблону)
+в нескольких процессах и выводит отчёт в формате JSON Lines:
+по одной строке на каждую программу.
+
+Пример:
+    python3 batch.py работы/ --timeout 2 --max-steps 100000 -o отчёт.jsonl
+"""
+
+import argparse
+import glob
+import json
+import os
+import signal
+import sys
+import time
+from contextlib import contextmanager
+from multiprocessing import Pool
+
+import compiler
+import interpreter
+from cache import CompileCache
+from functions import BoundsError
+from headless import HeadlessRunner, StepLimitError, TimeLimitError, describe_error
+
+
+def find_files(patterns):
+    """Находит файлы .epl в каталогах или по шаблонам."""
+    files = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            files.extend(sorted(glob.glob(os.path.join(pattern, '**', '*.epl'), recursive=True)))
+        else:
+            files.extend(sorted(glob.glob(pattern, recursive=True)))
+    return files
+
+
+# Сколько секунд сверх timeout программа может исполняться,
+# пока её не прервёт сигнал (если сама проверка времени не сработала).
+KILL_GRACE = 1.0
+
+# Статусы в отчёте для ошибок исполнения, у остальных - runtime_error.
+STATUSES = {
+    BoundsError: 'bounds_error',
+    StepLimitError: 'step_limit',
+    TimeLimitError: 'timeout',
+    RecursionError: 'recursion_error',
+}
+
+# Кэш свой в каждом процессе.
+_cache = CompileCache()
+
+
+def set_cache_dir(directory, optimize=False):
+    global _cache
+    _cache = CompileCache(directory=directory, optimize=optimize)
+
+
+def check_source(source: str, max_steps=None, timeout=None, stack=False, cache=None):
+    """
+    Компилирует и исполняет программу.
+    stack - исполнять на явном стеке (модуль interpreter),
+    cache - CompileCache (по умолчанию - кэш процесса).
+    Возвращает словарь с результатом для отчёта.
+    """
+    cache = cache or _cache
+    result = {'status': 'ok', 'error': None, 'line': None}
+    start = time.perf_counter()
+    try:
+        if stack:
+            code = interpreter.load(source, cache.optimize)
+        else:
+            code = cache.get(source)
+    except compiler.EPLException as e:
+        result.update(status='compile_error', error=e.args[0], line=e.args[1])
+        result['time'] = time.perf_counter() - start
+        return result
+
+    runner = HeadlessRunner(max_steps, timeout)
+    try:
+        runner.run(code)
+    except Exception as e:
+        message, line = describe_error(e)
+        result.update(status=STATUSES.get(type(e), 'runtime_error'), error=message, line=line)
+    result['time'] = time.perf_counter() - start
+
+    state = runner.state()
+    result['state'] = {
+        'x': state['x'],
+        'y': state['y'],
+        'heading': state['heading'],
+        'pen': state['pen'],
+        'steps': state['steps'],
+        'segments': len(state['segments']),
+    }
+    result['texts'] = [[x, y, text] for (x, y), text in state['texts'].items()]
+    return result
+
+
+def _interrupt(signum, frame):
+    raise TimeLimitError('Превышено время исполнения')
+
+
+@contextmanager
+def hard_limit(seconds):
+    """
+    Прерывает код внутри with с TimeLimitError через seconds секунд
+    сигналом SIGALRM, даже если он не вызывает tick (например, компиляция).
+    Без setitimer (Windows) и при seconds=None ничего не делает.
+    """
+    if seconds is None or not hasattr(signal, 'setitimer'):
+        yield
+        return
+    previous = signal.signal(signal.SIGALRM, _interrupt)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def check_file(args):
+    path, max_steps, timeout, stack = args
+    try:
+        with open(path, encoding='utf-8') as f:
+            source = f.read()
+    except (IOError, UnicodeDecodeError) as e:
+        return {'file': path, 'status': 'read_error', 'error': str(e), 'line': None}
+    start = time.perf_counter()
+    try:
+        with hard_limit(None if timeout is None else timeout + KILL_GRACE):
+            return {'file': path, **check_source(source, max_steps, timeout, stack)}
+    except TimeLimitError as e:
+        return {'file': path, 'status': 'timeout', 'error': f'{e.args[0]}: {timeout} с', 'line': None,
+                'time': time.perf_counter() - start}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Пакетный запуск программ на EPL.')
+    parser.add_argument('paths', nargs='+', help='каталоги или шаблоны файлов')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                        help='число процессов')
+    parser.add_argument('--timeout', type=float, default=5.0,
+                        help='время на одну программу в секундах')
+    parser.add_argument('--max-steps', type=int, default=1_000_000,
+                        help='число шагов на одну программу')
+    parser.add_argument('-o', '--output', help='файл для отчёта (по умолчанию - вывод)')
+    parser.add_argument('--cache', help='каталог для кэша скомпилированного кода')
+    parser.add_argument('-O', dest='optimize', action='store_true',
+                        help='оптимизировать программы')
+    parser.add_argument('--stack', action='store_true',
+                        help='исполнять процедуры на явном стеке (для глубокой рекурсии)')
+    args = parser.parse_args(argv)
+
+    tasks = [(path, args.max_steps, args.timeout, args.stack) for path in find_files(args.paths)]
+    out = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    try:
+        with Pool(args.jobs, set_cache_dir, (args.cache, args.optimize)) as pool:
+            for result in pool.imap(check_file, tasks, chunksize=max(1, len(tasks) // (args.jobs * 8))):
+                out.write(json.dumps(result, ensure_ascii=False) + '\n')
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,201 @@
+"""
+Замеры скорости EPL на созданных программах разного размера.
+
+Для каждой программы отдельно замеряются этапы:
+    tokenize - разбор строк на лексемы (compiler.tokenize),
+    translate - перевод на Python (Compiler.translate),
+    compile - компиляция в объект кода (compiler.compile_program),
+    execute - исполнение без графики (headless.HeadlessRunner),
+    render - рисование на Tk в режиме instant (только с --render, нужен экран).
+
+Результаты (лучшее время из нескольких попыток, в секундах) сохраняются
+в JSON. Если есть сохранённые прежде результаты (--baseline), новые
+с ними сравниваются: замедление больше порога (--threshold) - ошибка.
+
+Запуск:
+    python3 bench.py --save bench_baseline.json       # запомнить
+    python3 bench.py --baseline bench_baseline.json   # сравнить
+"""
+
+import argparse
+import json
+import platform
+import sys
+import time
+
+import compiler
+from headless import HeadlessRunner
+
+# Время меньше этого не сравнивается: в нём больше шума, чем замедления.
+MIN_TIME = 0.001
+
+
+def name(i):
+    """Имя процедуры из букв по номеру: А, Б, ..., ЯЯ, ..."""
+    letters = 'АБВГДЕЖЗИКЛМНОПРСТУФХЦЧШЭЮЯ'
+    result = ''
+    i += 1
+    while i:
+        i, k = divmod(i - 1, len(letters))
+        result = letters[k] + result
+    return 'П' + result
+
+
+def straight(n):
+    """n строк простых шагов."""
+    return '\n'.join(['ОПУСТИТЬ'] + ['ВВЕРХ ВПРАВО ВНИЗ ВЛЕВО'] * n) + '\n'
+
+
+def if_chain(n):
+    """Одна проверка ЕСЛИ с n ветками ИНАЧЕ ЕСЛИ, исполняется n раз."""
+    lines = ['ПИШИ Я', f'ПОВТОРИ {n}', "  ЕСЛИ 'А': ВВЕРХ ВНИЗ"]
+    lines += [f"  ИНАЧЕ ЕСЛИ '{i}': ВВЕРХ ВНИЗ" for i in range(n)]
+    lines += ['  ИНАЧЕ: ВПРАВО ВЛЕВО', '  КОНЕЦ', 'КОНЕЦ']
+    return '\n'.join(lines) + '\n'
+
+
+def nested_loops(n):
+    """n вложенных циклов ПОВТОРИ (тело исполняется 2 ** (n // 2) раз)."""
+    counts = [2 if i % 2 else 1 for i in range(n)]
+    lines = ['  ' * i + f'ПОВТОРИ {k}' for i, k in enumerate(counts)]
+    lines.append('  ' * n + 'ВВЕРХ ВНИЗ')
+    lines += ['  ' * i + 'КОНЕЦ' for i in reversed(range(n))]
+    return '\n'.join(lines) + '\n'
+
+
+def procedures(n):
+    """n процедур ЭТО, каждая вызывает предыдущую через одну."""
+    lines = []
+    for i in range(n):
+        lines.append(f'ЭТО {name(i)}')
+        lines.append('  ВВЕРХ ВНИЗ')
+        if i >= 2 and i % 2:
+            lines.append(f'  {name(i - 2)}')
+        lines.append('КОНЕЦ')
+    lines += [name(i) for i in range(n)]
+    return '\n'.join(lines) + '\n'
+
+
+def board(n):
+    """n раз пишет символы на все клетки поля и стирает их."""
+    lines = [
+        'ЭТО СТРОКАВПРАВО ПОВТОРИ 8 ПИШИ А ВПРАВО КОНЕЦ ПИШИ А КОНЕЦ',
+        'ЭТО СТРОКАВЛЕВО ПОВТОРИ 8 СТЕРЕТЬ ПИШИ Б ВЛЕВО КОНЕЦ ПИШИ Б КОНЕЦ',
+        'ЭТО ПОЛЕ',
+        '  ДОМОЙ ПОВТОРИ 4 ВНИЗ ВЛЕВО КОНЕЦ',
+        '  ПОВТОРИ 4 СТРОКАВПРАВО ВВЕРХ СТРОКАВЛЕВО ВВЕРХ КОНЕЦ СТРОКАВПРАВО',
+        'КОНЕЦ',
+        f'ПОВТОРИ {n} ПОЛЕ КОНЕЦ',
+    ]
+    return '\n'.join(lines) + '\n'
+
+
+# Программы и их размеры. Глубина ограничена самим Python:
+# больше 20 вложенных циклов и около 1000 веток ИНАЧЕ ЕСЛИ он не компилирует.
+PROGRAMS = {
+    'straight': (straight, (100, 1000, 10000)),
+    'if_chain': (if_chain, (10, 100, 500)),
+    'nested_loops': (nested_loops, (5, 10, 20)),
+    'procedures': (procedures, (10, 100, 1000)),
+    'board': (board, (1, 10, 100)),
+}
+
+
+def best(func, repeat):
+    """Лучшее время из repeat вызовов func."""
+    result = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        result = min(result, time.perf_counter() - start)
+    return result
+
+
+def tokenize_all(source):
+    for line in compiler.get_lines(source):
+        compiler.tokenize(line)
+
+
+def execute(code):
+    HeadlessRunner().run(code)
+
+
+def measure(source, repeat=5, stand=None):
+    """Замеряет все этапы для программы source."""
+    code = compiler.compile_program(source)
+    times = {
+        'tokenize': best(lambda: tokenize_all(source), repeat),
+        'translate': best(lambda: compiler.Compiler().translate(source), repeat),
+        'compile': best(lambda: compiler.compile_program(source), repeat),
+        'execute': best(lambda: execute(code), repeat),
+    }
+    if stand is not None:
+        from bench_render import render
+        times['render'] = best(lambda: render(stand, code, 'instant'), repeat)
+    return times
+
+
+def run(repeat=5, render=False, only=None):
+    """Замеряет все программы. Возвращает {'программа/размер/этап': время}."""
+    stand = None
+    if render:
+        import tkinter
+        from bench_render import Stand
+        stand = Stand(tkinter.Tk())
+    results = {}
+    for program, (make, sizes) in PROGRAMS.items():
+        if only and program not in only:
+            continue
+        for size in sizes:
+            for stage, seconds in measure(make(size), repeat, stand).items():
+                results[f'{program}/{size}/{stage}'] = seconds
+                print(f'{program:14} {size:6} {stage:10} {seconds * 1000:10.2f} мс', file=sys.stderr)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    Возвращает список замедлений: (ключ, было, стало) для времён,
+    которые выросли больше чем в 1 + threshold раз.
+    """
+    slower = []
+    for key, seconds in results.items():
+        old = baseline.get(key)
+        if old is None or max(old, seconds) < MIN_TIME:
+            continue
+        if seconds > old * (1 + threshold):
+            slower.append((key, old, seconds))
+    return slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Замеры скорости EPL.')
+    parser.add_argument('--save', help='сохранить результаты в файл JSON')
+    parser.add_argument('--baseline', help='файл JSON с прежними результатами для сравнения')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='допустимое замедление (0.2 - на 20%%)')
+    parser.add_argument('--repeat', type=int, default=5, help='число попыток')
+    parser.add_argument('--render', action='store_true', help='замерять и рисование (нужен экран)')
+    parser.add_argument('--only', nargs='*', choices=PROGRAMS, help='только эти программы')
+    args = parser.parse_args(argv)
+
+    results = run(args.repeat, args.render, args.only)
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump({'python': platform.python_version(), 'results': results}, f, indent=1)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+        slower = compare(results, baseline, args.threshold)
+        for key, old, new in slower:
+            print(f'МЕДЛЕННЕЕ: {key}: {old * 1000:.2f} мс -> {new * 1000:.2f} мс '
+                  f'({new / old - 1:+.0%})')
+        if slower:
+            return 1
+        print('Замедлений нет.')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,117 @@
+"""
+Сравнение скорости рисования в разных режимах (interface.SPEED_MODES)
+на программах из каталога примеры. Нужен экран (Tk).
+
+С ключом --headless экран не нужен: программа исполняется в фоне
+(headless.HeadlessRunner), а её изменения рисуются Interface.apply
+на черепашке и холсте без графики теми же кадрами, что и в редакторе
+(interface.frame_size). Для каждого режима выводится число кадров,
+число перерисовок экрана (при анимации - каждое действие черепашки),
+время самой отрисовки и наименьшее время до конца рисунка в окне:
+кадры идут не чаще, чем раз в FRAME_MS.
+
+Запуск:
+    python3 bench_render.py [файлы .epl]
+    python3 bench_render.py --headless [файлы .epl]
+"""
+
+import glob
+import sys
+import time
+import tkinter
+
+import compiler
+import functions
+from headless import HeadlessCanvas, HeadlessRunner, HeadlessTurtle
+from interface import FRAME_MS, SPEED_MODES, TaggedScreen, TaggedTurtle, Interface, frame_size
+
+
+class Stand:
+    """То, что скомпилированный код видит как self: черепашка и холст."""
+
+    def __init__(self, tk):
+        self.canvas = tkinter.Canvas(tk, width=functions.WIDTH, height=functions.HEIGHT)
+        self.canvas.pack()
+        self.screen = TaggedScreen(self.canvas)
+        self.t = functions.Performer(TaggedTurtle(self.screen))
+
+
+def render(stand, code, mode):
+    """Рисует программу так же, как Interface.go без фонового исполнения."""
+    stand.t.reset()
+    stand.t.up()
+    stand.t.board.clear(stand.canvas)
+    stand.screen.tracer(1 if mode == 'normal' else 0)
+    namespace = {name: getattr(functions, name) for name in dir(functions)
+                 if not name.startswith('_')}
+    namespace['self'] = stand
+    start = time.perf_counter()
+    exec(code, namespace)
+    stand.t.flush()
+    stand.screen.update()
+    return time.perf_counter() - start
+
+
+class HeadlessStand:
+    """То, что Interface.apply видит как self, но без Tk."""
+
+    def __init__(self):
+        self.t = functions.Performer(HeadlessTurtle())
+        self.canvas = HeadlessCanvas()
+        self.items = {}
+
+
+def render_headless(events, mode):
+    """
+    Рисует изменения events кадрами, как Interface.draw.
+    Возвращает (кадры, перерисовки экрана, время отрисовки).
+    """
+    stand = HeadlessStand()
+    size = frame_size(mode)
+    frames = updates = 0
+    start = time.perf_counter()
+    for first in range(0, len(events) + 1, size):
+        batch = events[first:first + size]
+        for event in batch:
+            Interface.apply(stand, event)
+        stand.t.flush()
+        frames += 1
+        if mode == 'normal':
+            updates += sum(name not in ('create_text', 'delete') for name, *_ in batch)
+        else:
+            updates += 1
+    return frames, updates, time.perf_counter() - start
+
+
+def main_headless(files):
+    for path in files:
+        with open(path, encoding='utf-8') as f:
+            code = compiler.compile_program(f.read(), filename=path)
+        events = []
+        HeadlessRunner(listener=events.append).run(code)
+        print(f'{path}: {len(events)} изменений')
+        for mode in SPEED_MODES:
+            frames, updates, seconds = render_headless(events, mode)
+            print(f'    {mode:8} кадров {frames:6}  перерисовок {updates:6}  '
+                  f'отрисовка {seconds * 1000:7.1f} мс  в окне не меньше {frames * FRAME_MS / 1000:6.2f} с')
+
+
+def main():
+    args = sys.argv[1:]
+    headless = '--headless' in args
+    files = [x for x in args if x != '--headless'] or sorted(glob.glob('примеры/*.epl'))
+    if headless:
+        main_headless(files)
+        return
+    stand = Stand(tkinter.Tk())
+    for path in files:
+        with open(path, encoding='utf-8') as f:
+            code = compiler.compile_program(f.read(), filename=path)
+        times = {mode: render(stand, code, mode) for mode in SPEED_MODES}
+        print(path)
+        for mode, seconds in times.items():
+            print(f'    {mode:8} {seconds:8.3f} с  ускорение {times["normal"] / seconds:6.1f}x')
+
+
+if __name__ == '__main__':
+    main()
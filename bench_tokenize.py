@@ -0,0 +1,124 @@
+"""
+Сравнение скорости разбора на лексемы: compiler.tokenize,
+compiler.lex (все лексемы с положением, весь текст за раз)
+и прежний посимвольный автомат (legacy_tokenize).
+
+tokenize построен на lex: оба - один проход finditer по _TOKEN_RE.
+Они делают больше прежнего автомата (строки в кавычках, комментарии,
+строка и столбец каждой лексемы) и на коротких строках медленнее его:
+в CPython один finditer без всякой работы над лексемами лишь немного
+быстрее посимвольного цикла.
+
+Запуск:
+    python3 bench_tokenize.py [число строк]
+"""
+
+import sys
+import time
+
+import compiler
+
+
+def legacy_start_state(x):
+    if x.isspace():
+        return 'WAIT'
+    elif x.isalpha():
+        return 'CMD'
+    elif x.isdigit():
+        return 'NUMBER'
+    elif x == "'":
+        return 'STRING'
+    elif x in '+-*/%:':
+        return 'OPERATOR'
+    else:
+        raise compiler.EPLSyntaxError(f'Синтаксическая ошибка: неверный символ "{x}"')
+
+
+def legacy_tokenize(text):
+    """Посимвольный автомат из EPL 1.1 (для сравнения)."""
+    state = 'WAIT'
+    current_token = ''
+    for x in text:
+        if state == 'WAIT':
+            state = legacy_start_state(x)
+            if state == 'OPERATOR':
+                yield x
+                state = 'WAIT'
+            current_token = x
+        elif state == 'CMD':
+            if not x.isalpha():
+                yield current_token
+                state = legacy_start_state(x)
+                current_token = ''
+                if state == 'OPERATOR':
+                    yield x
+                    state = 'WAIT'
+            else:
+                current_token += x
+        elif state == 'NUMBER':
+            if not x.isdigit():
+                yield current_token
+                state = legacy_start_state(x)
+                if state == 'OPERATOR':
+                    yield x
+                    state = 'WAIT'
+            else:
+                current_token += x
+    if current_token:
+        yield current_token
+
+
+def make_program(lines):
+    """Создаёт программу примерно из lines строк."""
+    block = [
+        'ЭТО КВАДРАТИК',
+        '  ПОВТОРИ 2',
+        '    ВВЕРХ ВПРАВО',
+        '    ВНИЗ ВЛЕВО',
+        '  КОНЕЦ',
+        'КОНЕЦ',
+        'ЕСЛИ НЕ КРАЙ И ПУСТО:',
+        '  ПИШИ А',
+        'ИНАЧЕ ЕСЛИ СИМВОЛ ИЛИ СВОБОДНО:',
+        '  СТЕРЕТЬ',
+        'КОНЕЦ',
+        'ПОКА НЕ КРАЙ: ВПРАВО КОНЕЦ',
+    ]
+    return '\n'.join(block * (lines // len(block) + 1)) + '\n'
+
+
+def measure(func, text, per_line=True, repeat=5):
+    """
+    Лучшее время из repeat попыток.
+    per_line - разбирать по строкам, как в compiler.
+    """
+    lines = text.splitlines() if per_line else [text]
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for line in lines:
+            for _ in func(line):
+                pass
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 12_000
+    text = make_program(lines)
+    size = len(text.encode('utf-8')) / 2 ** 20
+    assert [list(legacy_tokenize(x)) for x in text.splitlines()] == \
+           [list(compiler.tokenize(x)) for x in text.splitlines()]
+
+    print(f'{text.count(chr(10))} строк, {size:.2f} МБ')
+    results = {}
+    for name, func, per_line in (('legacy_tokenize', legacy_tokenize, True),
+                                 ('tokenize', compiler.tokenize, True),
+                                 ('lex', compiler.lex, False)):
+        results[name] = measure(func, text, per_line)
+        print(f'{name:16} {results[name] * 1000:8.1f} мс  {size / results[name]:6.2f} МБ/с')
+    print(f'tokenize / legacy_tokenize: {results["legacy_tokenize"] / results["tokenize"]:.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+"""
+Кэш скомпилированного кода.
+
+Ключ кэша - хэш нормализованного кода на EPL (после get_lines),
+значение - готовый объект кода Python и хэши библиотек, которые
+программа использует (ИСПОЛЬЗУЙ): если какая-то из них изменилась,
+программа компилируется заново. Кэш состоит из двух уровней:
+в памяти (LRU) и, если указан каталог, на диске (файлы .eplc).
+"""
+
+import hashlib
+import marshal
+import os
+from collections import OrderedDict
+from importlib.util import MAGIC_NUMBER
+
+import compiler
+import optimizer
+
+
+def _compiler_stamp():
+    """
+    Метка версии для файлов на диске: меняется при смене
+    версии Python или кода компилятора и оптимизатора.
+    """
+    digest = hashlib.sha256()
+    for module in (compiler, optimizer):
+        with open(module.__file__, 'rb') as f:
+            digest.update(f.read())
+    return MAGIC_NUMBER + digest.digest()[:8]
+
+
+STAMP = _compiler_stamp()
+
+
+def source_key(code: str, optimize=False):
+    """Возвращает хэш нормализованного кода (и ключа -O)."""
+    text = '\n'.join(line.rstrip() for line in compiler.get_lines(code))
+    if optimize:
+        text = '-O\n' + text
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class CompileCache:
+    """
+    maxsize - сколько объектов кода хранить в памяти,
+    directory - каталог для файлов .eplc (None - не использовать диск),
+    optimize - оптимизировать программы (ключ -O).
+    """
+
+    def __init__(self, maxsize=128, directory=None, optimize=False):
+        self.maxsize = maxsize
+        self.directory = directory
+        self.optimize = optimize
+        self.memory = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def get(self, code: str, tokens=None):
+        """
+        Возвращает объект кода для программы code.
+        tokens - лексемы code от compiler.lex, если они уже есть.
+        Ошибки компиляции (EPLException) не кэшируются.
+        """
+        key = source_key(code, self.optimize)
+        entry = self.memory.get(key)
+        if entry is None or not self.fresh(entry):
+            entry = self.load(key)
+        else:
+            self.memory.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+        if entry is None or not self.fresh(entry):
+            self.misses += 1
+            comp = compiler.Compiler(self.optimize)
+            if tokens is None:
+                comp.feed_text(code)
+            else:
+                comp.feed_tokens(tokens)
+            entry = (comp.code_object(), comp.libraries)
+            self.dump(key, entry)
+        else:
+            self.hits += 1
+        self.remember(key, entry)
+        return entry[0]
+
+    def put(self, code: str, pycode, libraries=None):
+        """
+        Кладёт в кэш объект кода pycode, уже скомпилированный для программы code.
+        libraries - Compiler.libraries того компилятора, который его построил.
+        """
+        key = source_key(code, self.optimize)
+        entry = (pycode, libraries or {})
+        self.dump(key, entry)
+        self.remember(key, entry)
+
+    def fresh(self, entry):
+        """Библиотеки, которые использует программа из entry, не изменились."""
+        if not entry[1]:
+            return True
+        import library
+        return library.fresh(entry[1], self.optimize)
+
+    def remember(self, key, entry):
+        self.memory[key] = entry
+        self.memory.move_to_end(key)
+        if len(self.memory) > self.maxsize:
+            self.memory.popitem(last=False)
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.eplc')
+
+    def load(self, key):
+        """
+        Читает с диска (объект кода, хэши библиотек).
+        Если файла нет или он устарел, возвращает None.
+        """
+        if self.directory is None:
+            return None
+        try:
+            with open(self.path(key), 'rb') as f:
+                if f.read(len(STAMP)) != STAMP:
+                    return None
+                pycode, libraries = marshal.load(f)
+                return pycode, libraries
+        except (IOError, EOFError, ValueError, TypeError):
+            return None
+
+    def dump(self, key, entry):
+        if self.directory is None:
+            return
+        tmp = f'{self.path(key)}.{os.getpid()}.tmp'
+        try:
+            with open(tmp, 'wb') as f:
+                f.write(STAMP)
+                marshal.dump(entry, f)
+            os.replace(tmp, self.path(key))
+        except IOError:
+            pass
+
+    def clear(self):
+        """Очищает кэш в памяти."""
+        self.memory.clear()
@@ -1,71 +1,94 @@
 """Компилятор языка EPL версии 1.1."""
 
-from dataclasses import dataclass
+import ast
+import gc
+import re
+from collections import namedtuple
+from contextlib import contextmanager
 from enum import Enum, auto
+from itertools import groupby
+from operator import attrgetter
 
 
 class TokenType(Enum):
-    WAIT = auto()
     CMD = auto()
     NUMBER = auto()
     STRING = auto()
     OPERATOR = auto()
-
-
-def start_state(x):
-    if x.isspace():
-        return TokenType.WAIT
-    elif x.isalpha():
-        return TokenType.CMD
-    elif x.isdigit():
-        return TokenType.NUMBER
-    elif x == "'":
-        return TokenType.STRING
-    elif x in '+-*/%:':
-        return TokenType.OPERATOR
-    else:
-        raise EPLSyntaxError(f'Синтаксическая ошибка: неверный символ "{x}"')
+    SPACE = auto()
+    COMMENT = auto()
+    ERROR = auto()
+
+
+# Модули typing и dataclasses здесь не используются: их импорт
+# дольше, чем импорт всего компилятора (python -X importtime).
+class Token(namedtuple('Token', 'type value line column')):
+    """Лексема. line считается с 1, column - с 0 (как в индексах Tk)."""
+    __slots__ = ()
+
+
+# Все лексемы разбираются одним регулярным выражением.
+# Его используют и компилятор, и подсветка синтаксиса (lexer.EPLLexer).
+# Перевод строки - отдельная лексема, так что строка и столбец
+# считаются без поиска по тексту.
+_TOKEN_RE = re.compile(r"""
+    (?P<SPACE>[^\S\n]+|\n)
+  | (?P<COMMENT>![^\n]*)
+  | (?P<CMD>[^\W\d_]+)
+  | (?P<NUMBER>\d+)
+  | (?P<STRING>'[^'\n]*')
+  | (?P<OPERATOR>[-+*/%:])
+  | (?P<ERROR>'[^'\n]*|.)
+""", re.VERBOSE)
+
+# Тип лексемы по имени группы в _TOKEN_RE.
+_TOKEN_TYPES = {kind.name: kind for kind in TokenType}
+
+
+def lex(text, line=1):
+    """
+    Разбивает text на лексемы с их положением.
+    Лексемы покрывают весь текст, включая пробелы и комментарии,
+    неверные символы возвращаются как TokenType.ERROR.
+    Перевод строки - отдельная лексема TokenType.SPACE.
+    """
+    line_start = 0
+    for match in _TOKEN_RE.finditer(text):
+        value = match[0]
+        yield Token._make((_TOKEN_TYPES[match.lastgroup], value, line, match.start() - line_start))
+        if value == '\n':
+            line += 1
+            line_start = match.end()
+
+
+def check_token(token):
+    """Вызывает ошибку, если token - неверная лексема."""
+    if token.type is TokenType.ERROR:
+        if token.value.startswith("'"):
+            raise EPLSyntaxError('Синтаксическая ошибка: незакрытая строка')
+        raise EPLSyntaxError(f'Синтаксическая ошибка: неверный символ "{token.value}"')
+
+
+def scan(text, line=1):
+    """Разбивает text на значимые лексемы (без пробелов и комментариев)."""
+    for token in lex(text, line):
+        if token.type is TokenType.SPACE or token.type is TokenType.COMMENT:
+            continue
+        check_token(token)
+        yield token
 
 
 def tokenize(text):
-    state = TokenType.WAIT
-    current_token = ''
-    for x in text:
-        if state == TokenType.WAIT:
-            state = start_state(x)
-            if state == TokenType.OPERATOR:
-                yield x
-                state = TokenType.WAIT
-            current_token = x
-        elif state == TokenType.CMD:
-            if not x.isalpha():
-                yield current_token
-                state = start_state(x)
-                current_token = ''
-                if state == TokenType.OPERATOR:
-                    yield x
-                    state = TokenType.WAIT
-            else:
-                current_token += x
-        elif state == TokenType.NUMBER:
-            if not x.isdigit():
-                yield current_token
-                state = start_state(x)
-                if state == TokenType.OPERATOR:
-                    yield x
-                    state = TokenType.WAIT
-            else:
-                current_token += x
-    if current_token:
-        yield current_token
+    """Разбивает text на лексемы. Возвращает список их текстов."""
+    return [token.value for token in scan(text)]
 
 
 # Словарь команд.
 built_in_funcs = {
-    'ВВЕРХ': ['self.t.setheading(90)', 'self.t.forward(50)', 'check_hit_edge(self.t)'],
-    'ВНИЗ': ['self.t.setheading(-90)', 'self.t.forward(50)', 'check_hit_edge(self.t)'],
-    'ВПРАВО': ['self.t.setheading(0)', 'self.t.forward(50)', 'check_hit_edge(self.t)'],
-    'ВЛЕВО': ['self.t.setheading(180)', 'self.t.forward(50)', 'check_hit_edge(self.t)'],
+    'ВВЕРХ': ['move(self.t, 90)'],
+    'ВНИЗ': ['move(self.t, 270)'],
+    'ВПРАВО': ['move(self.t, 0)'],
+    'ВЛЕВО': ['move(self.t, 180)'],
     'ПОДНЯТЬ': ['self.t.up()'],
     'ОПУСТИТЬ': ['self.t.down()'],
     'СБРОС': ['self.t.reset()'],
@@ -75,23 +98,62 @@ built_in_funcs = {
 }
 
 checks = {
-    'КРАЙ': 'check_edge(self.t) ',
-    'СИМВОЛ': 'is_symbol(self.t, "any") ',
-    'ПУСТО': 'not_symbol(self.t) ',
-    'СВОБОДНО': 'empty(self.t) ',
-    'НЕ': 'not ',
-    'И': 'and ',
-    'ИЛИ': 'or ',
+    'КРАЙ': 'check_edge(self.t)',
+    'СИМВОЛ': 'is_symbol(self.t, "any")',
+    'ПУСТО': 'not_symbol(self.t)',
+    'СВОБОДНО': 'empty(self.t)',
+    'НЕ': 'not',
+    'И': 'and',
+    'ИЛИ': 'or',
 }
 
-keywords = ['ЭТО', 'ПОВТОРИ', 'ЕСЛИ', 'НЕ', 'И', 'ИЛИ', 'ИНАЧЕ', 'ПОКА', 'ПИШИ', 'КОНЕЦ']
+keywords = ['ЭТО', 'ПОВТОРИ', 'ЕСЛИ', 'НЕ', 'И', 'ИЛИ', 'ИНАЧЕ', 'ПОКА', 'ПИШИ', 'КОНЕЦ', 'ИСПОЛЬЗУЙ']
+
+
+class Node:
+    """
+    Узел дерева программы. kind - вид узла, arg - его параметр:
+        'cmd' - встроенная команда (arg - её имя из built_in_funcs),
+        'call' - вызов процедуры (arg - имя),
+        'write' - ПИШИ (arg - текст),
+        'func' - описание процедуры (arg - имя),
+        'loop' - ПОВТОРИ (arg - число повторов),
+        'while' - ПОКА (arg - условие от parse_condition),
+        'if' - ЕСЛИ (arg - список [условие, тело, строка] для ЕСЛИ и ИНАЧЕ ЕСЛИ,
+               orelse - тело ИНАЧЕ),
+        'use' - ИСПОЛЬЗУЙ (arg - имя библиотеки, body - её готовое дерево),
+    после оптимизации (модуль optimizer) ещё:
+        'jump' - arg = (направление, число клеток),
+        'walk' - arg = (направления, число повторов).
+    line - номер строки в коде на EPL.
+    """
+    __slots__ = ('kind', 'arg', 'line', 'body', 'orelse')
+
+    def __init__(self, kind, arg=None, line=0, body=None, orelse=None):
+        self.kind = kind
+        self.arg = arg
+        self.line = line
+        self.body = [] if body is None else body
+        self.orelse = orelse
+
+    def __repr__(self):
+        return f'Node({self.kind!r}, {self.arg!r}, {self.line!r}, {self.body!r}, {self.orelse!r})'
 
 
-@dataclass
 class StackCell:
-    name: str
-    status: int
-    code: str
+    """
+    Незакрытая конструкция. status 0 - ещё разбирается её заголовок
+    (слова проверки копятся в words), status 1 - тело, команды
+    которого добавляются в body.
+    """
+    __slots__ = ('name', 'status', 'words', 'body', 'node')
+
+    def __init__(self, name, status, words=None, body=None, node=None):
+        self.name = name
+        self.status = status
+        self.words = [] if words is None else words
+        self.body = body
+        self.node = node
 
 
 class EPLException(Exception):
@@ -110,12 +172,25 @@ class EPLValueError(EPLException):
     pass
 
 
+# Сколько узлов дерева (Node) в одном модуле у Compiler.chunks.
+CHUNK_SIZE = 1000
+
+
 class Compiler:
-    def __init__(self):
-        self.indent = ''
-        self.pycode = []
-        self.stack = [StackCell('main', 1, '')]
-        self.user_funcs = {}
+    """
+    Разбирает код на EPL в дерево из Node (program),
+    затем строит по дереву модуль ast, который компилируется
+    в объект кода. Номера строк в нём - строки кода на EPL.
+    optimize - упрощать дерево перед этим (модуль optimizer, ключ -O).
+    """
+
+    def __init__(self, optimize=False):
+        self.optimize = optimize
+        self.program = []
+        self.stack = [StackCell('main', 1, body=self.program)]
+        self.user_funcs = set()  # только имена: узлы процедур не держатся после chunks
+        self.libraries = {}  # имя -> хэш всех библиотек из ИСПОЛЬЗУЙ (library.Library.digest)
+        self.line = 0
         self.handlers = {
             'func': self.handle_func_name,
             'loop': self.handle_loop_num,
@@ -124,15 +199,16 @@ class Compiler:
             'elif': self.handle_if_while_check,
             'write': self.handle_write_word,
             'else': self.handle_else,
+            'use': self.handle_use_name,
         }
 
         self.keywords_cells = {
-            'ЭТО': ('func', 'def '),
-            'ПОВТОРИ': ('loop', 'for i in range('),
-            'ЕСЛИ': ('if', ''),
-            'ПОКА': ('while', ''),
-            'ПИШИ': ('write', 'write(self.t, '),
-            'ИНАЧЕ': ('else', ''),
+            'ЭТО': 'func',
+            'ПОВТОРИ': 'loop',
+            'ЕСЛИ': 'if',
+            'ПОКА': 'while',
+            'ПИШИ': 'write',
+            'ИСПОЛЬЗУЙ': 'use',
         }
         self.names = {
             'func': 'функция',
@@ -149,112 +225,495 @@ class Compiler:
         принимает - код на языке EPL
         возвращает - код на языке Python.
         """
+        self.feed_text(code)
+        with python_limits():
+            return ast.unparse(self.module())
+
+    def translate_tokens(self, tokens):
+        """
+        То же, что translate, но принимает уже готовые лексемы от lex или scan,
+        чтобы не разбирать текст второй раз после подсветки синтаксиса.
+        """
+        self.feed_tokens(tokens)
+        with python_limits():
+            return ast.unparse(self.module())
+
+    def feed_text(self, code):
+        """
+        Разбирает код на EPL: строку или итерируемый объект
+        со строками (файл, канал).
+        """
+        for i, line in enumerate(get_lines(code), 1):
+            self.feed_line(line, i)
+
+    def feed_line(self, line, i):
+        """Разбирает строку line с номером i (после get_lines)."""
+        self.line = i
+        try:
+            self.feed(tokenize(line))
+        except EPLException as e:
+            raise type(e)(e.args[0], i) from e
+
+    def chunks(self, code, size=CHUNK_SIZE):
+        """
+        Разбирает code (как feed_text) и выдаёт модули ast по мере
+        готовности: в каждом законченные команды верхнего уровня,
+        в которых не меньше size узлов дерева (кроме последнего).
+        После выдачи они забываются, поэтому в памяти остаются только
+        они и незаконченная конструкция - сколько бы строк ни было в code.
+        """
+        nodes = 0
+        counted = 0
         for i, line in enumerate(get_lines(code), 1):
+            self.feed_line(line, i)
+            if len(self.stack) == 1 and counted < len(self.program):
+                nodes += count_nodes(self.program[counted:])
+                counted = len(self.program)
+                if nodes >= size:
+                    yield self.module()
+                    self.program.clear()
+                    nodes = counted = 0
+        yield self.module()
+
+    def feed_tokens(self, tokens):
+        """Разбирает лексемы от lex или scan."""
+        for i, line in groupby(tokens, attrgetter('line')):
+            self.line = i
             try:
-                for t in tokenize(line):
-
-                    if self.stack[-1].status == 0:
-                        self.handlers[self.stack[-1].name](t)
-
-                    elif t in self.keywords_cells:
-                        cell = self.keywords_cells[t]
-                        if t in ('ЕСЛИ', 'ПОКА', 'ИНАЧЕ'):
-                            self.stack.append(StackCell(cell[0], 0, cell[1]))  # смотри метод handle_if_while_check
-                        else:
-                            self.stack.append(StackCell(cell[0], 0, self.indent + cell[1]))
-
-                    elif t in built_in_funcs:
-                        for string in built_in_funcs[t]:
-                            self.pycode.append(self.indent + string)
-
-                    elif t in self.user_funcs:
-                        self.pycode.append(self.indent + self.user_funcs[t])
-
-                    elif t == 'КОНЕЦ':
-                        if self.stack[-1].name == 'main':
-                            raise EPLSyntaxError('Синтаксическая ошибка: конец без начала')
-                        if self.pycode[-1].endswith(':'):
-                            raise EPLSyntaxError(
-                                f'Синтаксическая ошибка: {self.names[self.stack[-1].name]} без тела')
-                        self.stack.pop()
-                        self.indent = self.indent[:-4]
-
-                    else:
-                        raise EPLNameError(f'Не описана процедура с именем "{t}"')
-
-            except EPLSyntaxError as e:
-                raise EPLSyntaxError(e.args[0], i) from e
-            except EPLNameError as e:
-                raise EPLNameError(e.args[0], i) from e
-            except EPLValueError as e:
-                raise EPLValueError(e.args[0], i) from e
-
-        return '\n'.join(self.pycode)
+                self.feed(_token_values(line))
+            except EPLException as e:
+                raise type(e)(e.args[0], i) from e
+
+    def module(self):
+        """Проверяет, что программа закончена, и строит по ней модуль ast."""
+        program = self.tree()
+        with _gc_paused():
+            return ast.Module(self.build(program), [])
+
+    def tree(self):
+        """
+        Проверяет, что программа закончена, и возвращает её дерево
+        (с ключом -O - упрощённое).
+        """
+        for cell in self.stack[1:]:
+            if cell.status == 0:
+                raise EPLSyntaxError('Синтаксическая ошибка: неожиданный конец программы', self.line)
+            if not cell.body:
+                raise EPLSyntaxError(
+                    f'Синтаксическая ошибка: {self.names[cell.name]} без тела', self.line)
+        if self.optimize:
+            import optimizer
+            return optimizer.optimize(self.program)
+        return self.program
+
+    def code_object(self, filename='<epl>'):
+        """Компилирует разобранную программу в объект кода."""
+        with python_limits(), _gc_paused():
+            return compile(self.module(), filename, 'exec')
+
+    def feed(self, tokens):
+        """Обрабатывает лексемы одной строки."""
+        for t in tokens:
+            cell = self.stack[-1]
+            if cell.status == 0:
+                self.handlers[cell.name](t)
+
+            elif t in self.keywords_cells:
+                self.stack.append(StackCell(self.keywords_cells[t], 0))
+
+            elif t == 'ИНАЧЕ':
+                if cell.name != 'if':
+                    raise EPLSyntaxError('Синтаксическая ошибка: иначе без если')
+                if not cell.body:
+                    raise EPLSyntaxError('Синтаксическая ошибка: проверка без тела')
+                cell.name = 'else'
+                cell.status = 0
+
+            elif t in built_in_funcs:
+                cell.body.append(Node('cmd', t, self.line))
+
+            elif t in self.user_funcs:
+                cell.body.append(Node('call', t, self.line))
+
+            elif t == 'КОНЕЦ':
+                if cell.name == 'main':
+                    raise EPLSyntaxError('Синтаксическая ошибка: конец без начала')
+                if not cell.body:
+                    raise EPLSyntaxError(
+                        f'Синтаксическая ошибка: {self.names[cell.name]} без тела')
+                self.stack.pop()
+
+            else:
+                raise EPLNameError(f'Не описана процедура с именем "{t}"')
+
+    def open_block(self, node, body):
+        """Добавляет node в тело объемлющей конструкции, дальше команды идут в body."""
+        self.stack[-2].body.append(node)
+        self.stack[-1].status = 1
+        self.stack[-1].node = node
+        self.stack[-1].body = body
 
     def handle_func_name(self, token: str):
+        if len(self.stack) > 2:
+            raise EPLSyntaxError('ЭТО может стоять только вне процедур, циклов и проверок.')
         if token in built_in_funcs or token in keywords:
             raise EPLNameError(f'Ошибка имени: имя "{token}" уже используется.')
         elif not token.isidentifier():
             raise EPLNameError(f'Не верное имя функции "{token}".')
-        self.stack[-1].status = 1
-        self.stack[-1].code += token + '(self):'
-        self.pycode.append(self.stack[-1].code)
-        self.user_funcs[token] = token + '(self)'
-        self.indent += '    '
+        node = Node('func', token, self.line)
+        self.open_block(node, node.body)
+        self.user_funcs.add(token)
 
     def handle_loop_num(self, token):
         if not token.isdigit():
             raise EPLValueError('Цикл должен принимать целое не отрицательное число')
-        self.stack[-1].status = 1
-        self.stack[-1].code += str(int(token)) + '):'
-        self.pycode.append(self.stack[-1].code)
-        self.indent += '    '
+        node = Node('loop', int(token), self.line)
+        self.open_block(node, node.body)
 
     def handle_if_while_check(self, token):
-        if token in checks:
-            self.stack[-1].code += checks[token]
-        elif token == ':':
-            try:
-                compile(self.stack[-1].code, 'f', 'eval')
-            except SyntaxError:
-                raise EPLSyntaxError('Неверная проверка.')
-            self.stack[-1].status = 1
-            self.stack[-1].code += ':'
-            if self.stack[-1].name == 'elif':
-                self.pycode.append(f'{self.indent[:-4]}elif ' + self.stack[-1].code)
+        cell = self.stack[-1]
+        if token == ':':
+            condition = parse_condition(cell.words)
+            if cell.name == 'elif':
+                branch = [condition, [], self.line]
+                cell.node.arg.append(branch)
+                cell.name = 'if'
+                cell.status = 1
+                cell.body = branch[1]
+            elif cell.name == 'if':
+                branch = [condition, [], self.line]
+                self.open_block(Node('if', [branch], self.line), branch[1])
             else:
-                self.pycode.append(f'{self.indent}{self.stack[-1].name} ' + self.stack[-1].code)
-                self.indent += '    '
-        elif token.isdigit() or token.isalpha():
-            if token in keywords:
-                raise EPLSyntaxError(f'Неверное использование ключевого слова {token}.')
-            self.stack[-1].code += f'is_symbol(self.t, "{token}") '
+                node = Node('while', condition, self.line)
+                self.open_block(node, node.body)
+        elif token in keywords and token not in checks:
+            raise EPLSyntaxError(f'Неверное использование ключевого слова {token}.')
+        else:
+            cell.words.append(token)
 
     def handle_else(self, token):
+        cell = self.stack[-1]
         if token == ':':
-            self.stack[-1].status = 1
-            self.pycode.append(f'{self.indent[:-4]}else:')
+            cell.node.orelse = cell.body = []
+            cell.status = 1
         elif token == 'ЕСЛИ':
-            self.stack[-1].name = 'elif'
+            cell.name = 'elif'
+            cell.words = []
 
     def handle_write_word(self, token):
         if token in keywords:
             raise EPLSyntaxError(f'Неверное использование ключевого слова {token}.')
-        self.stack[-1].status = 1
-        self.stack[-1].code += f'"{token}", self.canvas)'
-        self.pycode.append(self.stack[-1].code)
+        if token.startswith("'"):
+            token = token[1:-1]
         self.stack.pop()
-
-
-def get_lines(code: str):
-    """Очищает код от комментариев."""
-    for x in code.upper().splitlines():
+        self.stack[-1].body.append(Node('write', token, self.line))
+
+    def handle_use_name(self, token):
+        if len(self.stack) > 2:
+            raise EPLSyntaxError('ИСПОЛЬЗУЙ может стоять только вне процедур и циклов.')
+        if token in keywords or not token.isidentifier():
+            raise EPLNameError(f'Неверное имя библиотеки "{token}".')
+        import library
+        lib = library.load(token, self.optimize)
+        self.stack.pop()
+        self.stack[-1].body.append(Node('use', token, self.line, lib.tree))
+        self.user_funcs.update(lib.procedures)
+        self.libraries.update(lib.uses)
+        self.libraries[token] = lib.digest
+
+    def build(self, nodes):
+        """Строит список операторов ast для узлов nodes."""
+        statements = []
+        for node in nodes:
+            kind = node.kind
+            loc = _location(node.line)
+            if kind == 'cmd':
+                statements.append(build_command(node.arg, loc))
+                continue
+            if kind == 'call':
+                statement = ast.Expr(_call(node.arg, loc, _name('self', loc)), **loc)
+            elif kind == 'write':
+                statement = ast.Expr(_call('write', loc, _self_attr('t', loc), ast.Constant(node.arg, **loc),
+                                           _self_attr('canvas', loc)), **loc)
+            elif kind == 'use':
+                statement = ast.Expr(_call('use', loc, ast.Constant(node.arg, **loc),
+                                           ast.Constant(self.optimize, **loc), _call('globals', loc)), **loc)
+            elif kind == 'jump' or kind == 'walk':
+                statement = ast.Expr(_call(kind, loc, _self_attr('t', loc),
+                                           *[ast.Constant(x, **loc) for x in node.arg]), **loc)
+            elif kind == 'func':
+                args = ast.arguments(posonlyargs=[], args=[ast.arg('self', **loc)], kwonlyargs=[],
+                                     kw_defaults=[], defaults=[])
+                statement = ast.FunctionDef(name=node.arg, args=args, body=self.build_body(node.body, loc),
+                                            decorator_list=[], **loc)
+            elif kind == 'loop':
+                statement = ast.For(ast.Name('i', _STORE, **loc),
+                                    _call('range', loc, ast.Constant(node.arg, **loc)),
+                                    self.build_body(node.body, loc), [], **loc)
+            elif kind == 'while':
+                statement = ast.While(build_condition(node.arg, loc),
+                                      self.build(node.body) or [ast.Pass(**loc)], [], **loc)
+            else:
+                orelse = [] if node.orelse is None else self.build(node.orelse)
+                for condition, body, line in reversed(node.arg):
+                    loc = _location(line)
+                    statement = ast.If(build_condition(condition, loc),
+                                       self.build(body) or [ast.Pass(**loc)], orelse, **loc)
+                    orelse = [statement]
+            statements.append(statement)
+        return statements
+
+    def build_body(self, nodes, loc):
+        """
+        Тело цикла или процедуры. Если оно может пройти без единого
+        действия и проверки, в его начало ставится self.t.tick(): иначе
+        такой цикл нельзя было бы прервать ни по числу шагов, ни по времени.
+        """
+        body = self.build(nodes)
+        if not acts(nodes):
+            body.insert(0, ast.Expr(ast.Call(ast.Attribute(_self_attr('t', loc), 'tick', _LOAD, **loc),
+                                             [], [], **loc), **loc))
+        return body
+
+
+def count_nodes(nodes):
+    """Число узлов в nodes вместе с вложенными."""
+    total = 0
+    for node in nodes:
+        total += 1
+        if node.kind == 'if':
+            for branch in node.arg:
+                total += count_nodes(branch[1])
+            if node.orelse is not None:
+                total += count_nodes(node.orelse)
+        elif node.body and node.kind != 'use':
+            total += count_nodes(node.body)
+    return total
+
+
+def acts(nodes):
+    """
+    Исполнение узлов nodes наверняка вызывает tick исполнителя: в них
+    есть действие, проверка или вызов процедуры (тело процедуры само
+    это гарантирует). Шаги считаются действием: шагов в одну сторону
+    подряд не больше ширины поля, а поворот вызывает tick.
+    """
+    for node in nodes:
+        kind = node.kind
+        if kind == 'loop':
+            if node.arg and acts(node.body):
+                return True
+        elif kind != 'func' and kind != 'use':
+            return True
+    return False
+
+
+def parse_condition(words):
+    """
+    Разбирает проверку - слова между ЕСЛИ (ПОКА) и двоеточием.
+    НЕ связывает сильнее И, а И - сильнее ИЛИ. Возвращает дерево
+    из кортежей ('НЕ', x), ('И', x, y, ...), ('ИЛИ', x, y, ...),
+    ('СИМВОЛ', текст) и имён проверок ('КРАЙ' и т. п.).
+    """
+    pos = 0
+
+    def peek():
+        return words[pos] if pos < len(words) else None
+
+    def operation(word, operand):
+        nonlocal pos
+        values = [operand()]
+        while peek() == word:
+            pos += 1
+            values.append(operand())
+        return values[0] if len(values) == 1 else (word, *values)
+
+    def or_test():
+        return operation('ИЛИ', and_test)
+
+    def and_test():
+        return operation('И', not_test)
+
+    def not_test():
+        nonlocal pos
+        word = peek()
+        if word == 'НЕ':
+            pos += 1
+            return 'НЕ', not_test()
+        if word is None or word in checks and word not in _CHECK_FUNCS:
+            raise EPLSyntaxError('Неверная проверка.')
+        pos += 1
+        if word in _CHECK_FUNCS:
+            return word
+        if word.startswith("'"):
+            word = word[1:-1]
+        elif not word.isalnum():
+            raise EPLSyntaxError('Неверная проверка.')
+        return 'СИМВОЛ', word
+
+    condition = or_test()
+    if pos != len(words):
+        raise EPLSyntaxError('Неверная проверка.')
+    return condition
+
+
+def build_condition(condition, loc):
+    """Строит выражение ast для дерева проверки от parse_condition."""
+    if isinstance(condition, str):
+        if condition == 'СИМВОЛ':  # любой символ
+            return build_condition(('СИМВОЛ', 'any'), loc)
+        return _call(_CHECK_FUNCS[condition], loc, _self_attr('t', loc))
+    op, *args = condition
+    if op == 'СИМВОЛ':
+        return _call('is_symbol', loc, _self_attr('t', loc), ast.Constant(args[0], **loc))
+    if op == 'НЕ':
+        return ast.UnaryOp(_NOT, build_condition(args[0], loc), **loc)
+    return ast.BoolOp(_AND if op == 'И' else _OR, [build_condition(x, loc) for x in args], **loc)
+
+
+_LOAD = ast.Load()
+_STORE = ast.Store()
+_OR = ast.Or()
+_AND = ast.And()
+_NOT = ast.Not()
+
+
+@contextmanager
+def python_limits():
+    """
+    Переводит ошибки Python, которые случаются при компиляции слишком
+    глубоко вложенной программы (SyntaxError "too many statically nested
+    blocks", RecursionError на длинной цепочке ИНАЧЕ ЕСЛИ), в EPLSyntaxError.
+    """
+    try:
+        yield
+    except SyntaxError as e:
+        raise EPLSyntaxError('Синтаксическая ошибка: слишком глубокая вложенность', e.lineno) from e
+    except RecursionError as e:
+        raise EPLSyntaxError('Синтаксическая ошибка: слишком глубокая вложенность', None) from e
+
+
+@contextmanager
+def _gc_paused():
+    """
+    Дерево ast - сотни тысяч мелких объектов без циклов:
+    сборщик мусора, пока оно строится, только тратит время.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def _location(line):
+    """Положение узла ast: строка line кода на EPL."""
+    return {'lineno': line, 'col_offset': 0, 'end_lineno': line, 'end_col_offset': 0}
+
+
+def _name(name, loc):
+    return ast.Name(name, _LOAD, **loc)
+
+
+def _self_attr(name, loc):
+    return ast.Attribute(_name('self', loc), name, _LOAD, **loc)
+
+
+def _call(func, loc, *args):
+    return ast.Call(_name(func, loc), list(args), [], **loc)
+
+
+# Встроенные команды и проверки: тот же код, что в built_in_funcs и checks.
+_MOVES = {'ВВЕРХ': 90, 'ВНИЗ': 270, 'ВПРАВО': 0, 'ВЛЕВО': 180}
+_METHODS = {'ПОДНЯТЬ': 'up', 'ОПУСТИТЬ': 'down', 'СБРОС': 'reset', 'ОЧИСТИТЬ': 'clear', 'ДОМОЙ': 'home'}
+_CHECK_FUNCS = {'КРАЙ': 'check_edge', 'СИМВОЛ': 'is_symbol', 'ПУСТО': 'not_symbol', 'СВОБОДНО': 'empty'}
+
+
+def build_command(name, loc):
+    """Строит оператор ast для встроенной команды name."""
+    turtle = _self_attr('t', loc)
+    if name in _MOVES:
+        call = _call('move', loc, turtle, ast.Constant(_MOVES[name], **loc))
+    elif name in _METHODS:
+        call = ast.Call(ast.Attribute(turtle, _METHODS[name], _LOAD, **loc), [], [], **loc)
+    else:
+        call = _call('del_text', loc, turtle, _self_attr('canvas', loc))
+    return ast.Expr(call, **loc)
+
+
+def _token_values(tokens):
+    for token in tokens:
+        if token.type is TokenType.SPACE or token.type is TokenType.COMMENT:
+            continue
+        check_token(token)
+        yield token.value.upper()
+
+
+# Код до комментария: '!' внутри строки комментарий не начинает.
+_CODE_RE = re.compile(r"(?:[^'!]|'[^']*(?:'|$))*")
+
+
+def split_lines(code):
+    """
+    Выдаёт строки code по одной, без перевода строки. code - строка
+    или итерируемый объект со строками (файл, канал): в отличие от
+    splitlines, копия всего текста не нужна.
+    """
+    if not isinstance(code, str):
+        for line in code:
+            yield line.rstrip('\r\n')
+        return
+    start = 0
+    end = code.find('\n')
+    while end >= 0:
+        yield code[start:end].rstrip('\r')
+        start = end + 1
+        end = code.find('\n', start)
+    if start < len(code):
+        yield code[start:]
+
+
+def get_lines(code):
+    """Очищает код от комментариев. code - как у split_lines."""
+    for x in split_lines(code):
+        x = x.upper()
         if '!' in x:
-            x = x[:x.index('!')]
+            x = _CODE_RE.match(x).group()
         yield x
 
 
-def compilation(code: str):
-    """Компилирует code."""
-    comp = Compiler()
+def compilation(code: str, optimize=False):
+    """Переводит code на Python (текст - для просмотра и тестов)."""
+    comp = Compiler(optimize)
     return comp.translate(code)
+
+
+def compile_program(code, optimize=False, filename='<epl>'):
+    """Компилирует code в объект кода Python."""
+    comp = Compiler(optimize)
+    comp.feed_text(code)
+    return comp.code_object(filename)
+
+
+def compile_stream(code, optimize=False, filename='<epl>'):
+    """
+    Компилирует code (строку, файл, канал) по частям: выдаёт объекты
+    кода, которые исполняются по порядку в одном пространстве имён.
+    """
+    comp = Compiler(optimize)
+    with python_limits():
+        for module in comp.chunks(code):
+            with _gc_paused():
+                yield compile(module, filename, 'exec')
+
+
+def translate_stream(code, optimize=False):
+    """Переводит code на Python по частям, выдаёт куски текста."""
+    comp = Compiler(optimize)
+    with python_limits():
+        for module in comp.chunks(code):
+            if module.body:
+                yield ast.unparse(module) + '\n'
+
@@ -0,0 +1,120 @@
+"""
+EPL из командной строки, без графики:
+    python3 -m epl run программа.epl      - исполнить и вывести конечное состояние (JSON)
+    python3 -m epl compile программа.epl  - вывести код на Python
+    python3 -m epl check программа.epl    - только проверить ошибки компиляции
+    python3 -m epl gui                    - открыть редактор (как main.py)
+
+Модули загружаются внутри команд: check и compile не импортируют
+ни Tk, ни turtle, ни pygments, ни исполнитель, поэтому запускаются
+быстро (проверить: python3 -X importtime -m epl check программа.epl).
+"""
+
+import argparse
+import sys
+
+
+def _read(path):
+    with open(path, encoding='utf-8') as f:
+        return f.read()
+
+
+def _report(path, line, message):
+    print(f'{path}:{line}: {message}' if line else f'{path}: {message}', file=sys.stderr)
+
+
+def check(args):
+    import compiler
+    try:
+        compiler.compile_program(_read(args.path), args.optimize, args.path)
+    except compiler.EPLException as e:
+        _report(args.path, e.args[1], e.args[0])
+        return 1
+    return 0
+
+
+def compile_(args):
+    import compiler
+    try:
+        text = compiler.compilation(_read(args.path), args.optimize)
+    except compiler.EPLException as e:
+        _report(args.path, e.args[1], e.args[0])
+        return 1
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    return 0
+
+
+def run(args):
+    import json
+
+    import compiler
+    from headless import HeadlessRunner, describe_error
+
+    source = _read(args.path)
+    try:
+        if args.stack:
+            import interpreter
+            code = interpreter.load(source, args.optimize)
+        else:
+            code = compiler.compile_program(source, args.optimize, args.path)
+    except compiler.EPLException as e:
+        _report(args.path, e.args[1], e.args[0])
+        return 1
+    runner = HeadlessRunner(args.max_steps, args.timeout)
+    status = 0
+    try:
+        runner.run(code)
+    except Exception as e:
+        message, line = describe_error(e, args.path)
+        _report(args.path, line, message)
+        status = 1
+    state = runner.state()
+    state['segments'] = len(state['segments'])
+    state['texts'] = [[x, y, text] for (x, y), text in state['texts'].items()]
+    json.dump(state, sys.stdout, ensure_ascii=False)
+    sys.stdout.write('\n')
+    return status
+
+
+def gui(args):
+    from interface import Interface
+    Interface(args.speed, args.optimize, args.stack)
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='epl', description='EPL - простой язык программирования.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    def command(name, function, help, path=True):
+        sub = commands.add_parser(name, help=help)
+        if path:
+            sub.add_argument('path', help='файл с программой')
+        sub.add_argument('-O', dest='optimize', action='store_true', help='оптимизировать программу')
+        sub.set_defaults(function=function)
+        return sub
+
+    sub = command('run', run, 'исполнить без графики')
+    sub.add_argument('--timeout', type=float, default=None, help='время в секундах')
+    sub.add_argument('--max-steps', type=int, default=None, help='число шагов')
+    sub.add_argument('--stack', action='store_true',
+                     help='исполнять процедуры на явном стеке (для глубокой рекурсии)')
+    sub = command('compile', compile_, 'вывести код на Python')
+    sub.add_argument('-o', '--output', help='файл для кода (по умолчанию - вывод)')
+    command('check', check, 'проверить ошибки компиляции')
+    sub = command('gui', gui, 'открыть редактор', path=False)
+    sub.add_argument('--speed', choices=('normal', 'frames', 'instant'), default='normal',
+                     help='скорость рисования')
+    sub.add_argument('--stack', action='store_true',
+                     help='исполнять процедуры на явном стеке (для глубокой рекурсии)')
+
+    args = parser.parse_args(argv)
+    return args.function(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
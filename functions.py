@@ -4,88 +4,265 @@
 скомпилированного модулем compiler.
 """
 
-from tkinter import filedialog
-
-
-texts = {}
-
 WIDTH = 400
 HEIGHT = 400
 
+# Размер клетки, наибольшие номера клеток от центра поля
+# и смещение на одну клетку в каждом направлении.
+STEP = 50
+MAX_COL = int(WIDTH / 2 // STEP)
+MAX_ROW = int(HEIGHT / 2 // STEP)
+DIRECTIONS = {0: (1, 0), 90: (0, 1), 180: (-1, 0), 270: (0, -1)}
+
+# Теги элементов холста, созданных программой: по тегу все надписи
+# (или все линии) удаляются одним вызовом canvas.delete.
+TEXT_TAG = 'epl_text'
+LINE_TAG = 'epl_line'
+
 
 class BoundsError(Exception):
     pass
 
 
-def check_hit_edge(t):
-    """Проверяет столкновение черепашки с краем."""
-    if t.xcor() > WIDTH / 2:
-        t.backward(50)
-        raise BoundsError('Не могу!')
-    elif t.xcor() < -WIDTH / 2:
-        t.backward(50)
-        raise BoundsError('Не могу!')
-    elif t.ycor() > HEIGHT / 2:
-        t.backward(50)
-        raise BoundsError('Не могу!')
-    elif t.ycor() < -HEIGHT / 2:
-        t.backward(50)
+def _no_tick():
+    pass
+
+
+class Board:
+    """
+    Символы на клетках поля. Клетка (col, row) хранится под одним
+    целым числом row * width + col, поэтому поиск символа - одно
+    обращение к словарю, а память нужна только под занятые клетки.
+    """
+    __slots__ = ('width', 'texts', 'items')
+
+    def __init__(self, max_col=MAX_COL):
+        self.width = 2 * max_col + 1
+        self.texts = {}  # клетка -> текст
+        self.items = {}  # клетка -> номер надписи на холсте
+
+    def get(self, col, row):
+        """Возвращает текст на клетке или None."""
+        return self.texts.get(row * self.width + col)
+
+    def write(self, col, row, text, canvas):
+        cell = row * self.width + col
+        if cell in self.items:
+            canvas.delete(self.items[cell])
+        self.items[cell] = canvas.create_text(col * STEP, -row * STEP, text=text, tags=TEXT_TAG)
+        self.texts[cell] = text
+
+    def erase(self, col, row, canvas):
+        """Стирает символ с клетки. Возвращает False, если клетка пуста."""
+        cell = row * self.width + col
+        if cell in self.items:
+            canvas.delete(self.items.pop(cell))
+            del self.texts[cell]
+            return True
+        return False
+
+    def clear(self, canvas):
+        """Удаляет все символы с поля и с холста."""
+        if self.items:
+            canvas.delete(TEXT_TAG)
+        self.texts = {}
+        self.items = {}
+
+    def symbols(self):
+        """Возвращает (col, row, текст) для всех символов."""
+        for cell, text in self.texts.items():
+            row, col = divmod(cell, self.width)
+            if col > self.width // 2:
+                row += 1
+                col -= self.width
+            yield col, row, text
+
+
+class Performer:
+    """
+    Исполнитель: черепашка вместе с её клеткой на поле, направлением
+    и пером. Это состояние хранится здесь, поэтому проверкам не нужно
+    спрашивать черепашку (и Tk). Для скомпилированного кода исполнитель
+    выглядит как черепашка: self.t.
+    board - поле с символами, его могут делить несколько исполнителей.
+    tick - вызывается при каждой проверке условия (и при действиях,
+    которые не доходят до черепашки и холста), чтобы исполнение можно
+    было прервать даже в цикле, который не двигает черепашку.
+
+    Движения по прямой копятся в pending и передаются черепашке одним
+    forward при повороте, смене пера и т. п. (flush), поэтому прямая
+    из нескольких шагов рисуется одной линией. Край проверяется по
+    клетке исполнителя до каждого шага, как и без этого.
+    """
+
+    def __init__(self, turtle, board=None):
+        self.turtle = turtle
+        self.board = Board() if board is None else board
+        self.tick = _no_tick
+        self.col = 0
+        self.row = 0
+        self.angle = 0
+        self.pen = turtle.isdown()
+        self.pending = 0
+
+    def flush(self):
+        """Передаёт черепашке отложенное движение."""
+        if self.pending:
+            distance, self.pending = self.pending, 0
+            self.turtle.forward(distance)
+
+    def reset(self):
+        self.pending = 0
+        self.turtle.reset()
+        self.col = self.row = self.angle = 0
+        self.pen = True
+
+    def clear(self):
+        self.flush()
+        self.turtle.clear()
+
+    def home(self):
+        self.flush()
+        self.turtle.home()
+        self.col = self.row = self.angle = 0
+
+    def up(self):
+        self.flush()
+        self.turtle.up()
+        self.pen = False
+
+    def down(self):
+        self.flush()
+        self.turtle.down()
+        self.pen = True
+
+    def setheading(self, angle):
+        self.flush()
+        self.angle = angle % 360
+        self.turtle.setheading(self.angle)
+
+    def heading(self):
+        return self.angle
+
+    def forward(self, distance):
+        """Сдвигает исполнителя на distance (кратное STEP) в текущем направлении."""
+        self.pending += distance
+        dx, dy = DIRECTIONS[self.angle]
+        self.col += dx * distance // STEP
+        self.row += dy * distance // STEP
+
+    def goto(self, x, y):
+        """Переносит исполнителя в точку (x, y), кратную STEP."""
+        self.flush()
+        self.turtle.goto(x, y)
+        self.col = x // STEP
+        self.row = y // STEP
+
+    def xcor(self):
+        return self.col * STEP
+
+    def ycor(self):
+        return self.row * STEP
+
+
+def move(t, heading):
+    """
+    Поворачивает исполнителя и сдвигает его на одну клетку.
+    Если клетка за краем поля, исполнитель не двигается.
+    """
+    if t.angle != heading:
+        t.setheading(heading)
+    dx, dy = DIRECTIONS[heading]
+    if not (-MAX_COL <= t.col + dx <= MAX_COL and -MAX_ROW <= t.row + dy <= MAX_ROW):
         raise BoundsError('Не могу!')
+    t.forward(STEP)
 
 
-def check_edge(t):
+def jump(t, heading, n):
     """
-    Если черепашка столкнулась с краем
-    возвращает True.
+    То же, что n раз move(t, heading), но с одной проверкой края
+    на всю прямую. Так оптимизатор (ключ -O) заменяет подряд идущие шаги.
+    """
+    if t.angle != heading:
+        t.setheading(heading)
+    dx, dy = DIRECTIONS[heading]
+    if -MAX_COL <= t.col + dx * n <= MAX_COL and -MAX_ROW <= t.row + dy * n <= MAX_ROW:
+        t.forward(n * STEP)
+        return
+    # Дойти шагами до края, где move и остановит исполнение.
+    while True:
+        move(t, heading)
+
+
+def walk(t, headings, n):
     """
-    if t.xcor() > WIDTH / 2 - 30:
-        return True
-    elif t.xcor() < -WIDTH / 2 - 30:
-        return True
-    elif t.ycor() > HEIGHT / 2 - 30:
-        return True
-    elif t.ycor() < -HEIGHT / 2 - 30:
-        return True
+    То же, что n раз сделать move(t, h) для каждого h из headings.
+    Так оптимизатор заменяет цикл ПОВТОРИ из одних шагов.
+    Край проверяется один раз для всего пути: путь за n повторов
+    лежит в прямоугольнике, который задают первый и последний повтор.
+    Если перо поднято, исполнитель сразу переносится в конец пути.
+    """
+    col = row = 0
+    cols = []
+    rows = []
+    for heading in headings:
+        dx, dy = DIRECTIONS[heading]
+        col += dx
+        row += dy
+        cols.append(col)
+        rows.append(row)
+    last_col = col * (n - 1)
+    last_row = row * (n - 1)
+    if not (-MAX_COL <= t.col + min(cols) + min(0, last_col)
+            and t.col + max(cols) + max(0, last_col) <= MAX_COL
+            and -MAX_ROW <= t.row + min(rows) + min(0, last_row)
+            and t.row + max(rows) + max(0, last_row) <= MAX_ROW):
+        for _ in range(n):
+            for heading in headings:
+                move(t, heading)
+    elif t.pen:
+        for _ in range(n):
+            for heading in headings:
+                if t.angle != heading:
+                    t.setheading(heading)
+                t.forward(STEP)
+    else:
+        t.goto((t.col + col * n) * STEP, (t.row + row * n) * STEP)
+        if t.angle != headings[-1]:
+            t.setheading(headings[-1])
 
 
-def reset_texts(canvas):
-    """Удаляет весь текст с поля."""
-    global texts
-    for v in texts.values():
-        canvas.delete(v[0])
-    texts = {}
+def check_edge(t):
+    """
+    Если исполнитель стоит на краю,
+    возвращает True.
+    """
+    t.tick()
+    x = t.col * STEP
+    y = t.row * STEP
+    return x > WIDTH / 2 - 30 or x < -WIDTH / 2 - 30 or y > HEIGHT / 2 - 30 or y < -HEIGHT / 2 - 30
 
 
 def write(t, text, canvas):
-    global texts
-    x = round(t.xcor())
-    y = round(t.ycor())
-    if (x, y) in texts:
-        canvas.delete(texts[x, y][0])
+    t.flush()
     if len(text) >= 12:
         text = text[:9] + '...'
-    s = canvas.create_text(x, -y, text=text)
-    texts[x, y] = (s, text)
+    t.board.write(t.col, t.row, text, canvas)
 
 
 def del_text(t, canvas):
-    x = round(t.xcor())
-    y = round(t.ycor())
-    if (x, y) in texts:
-        canvas.delete(texts[x, y])
-        del texts[x, y]
+    t.flush()
+    if not t.board.erase(t.col, t.row, canvas):
+        # Холст не меняется, но СТЕРЕТЬ - тоже шаг.
+        t.tick()
 
 
 def is_symbol(t, symbol):
-    x = t.xcor()
-    y = t.ycor()
+    t.tick()
+    text = t.board.get(t.col, t.row)
     if symbol == 'any':
-        if (x, y) in texts:
-            return True
-    else:
-        if (x, y) in texts and texts[x, y][-1] == symbol:
-            return True
-    return False
+        return text is not None
+    return text == symbol
 
 
 def empty(t):
@@ -96,8 +273,18 @@ def not_symbol(t):
     return not is_symbol(t, 'any')
 
 
+def use(name, optimize, namespace):
+    """
+    ИСПОЛЬЗУЙ: исполняет готовый объект кода библиотеки name,
+    и её процедуры появляются в namespace.
+    """
+    import library
+    exec(library.load(name, optimize).code, namespace)
+
+
 def save(text):
     """Сохраняет файл."""
+    from tkinter import filedialog
     file = filedialog.asksaveasfile()
     if file:
         file.write(text)
@@ -106,6 +293,7 @@ def save(text):
 
 def open_f(codeinput):
     """Открывает файл."""
+    from tkinter import filedialog
     file = filedialog.askopenfile()
     if file:
         codeinput.delete('1.0', 'end')
@@ -0,0 +1,347 @@
+"""
+Исполнение скомпилированного кода без Tk и turtle.
+
+Модуль содержит модель мира, которая подменяет черепашку
+(RawTurtle) и холст (Canvas): она хранит положение, направление,
+состояние пера, нарисованные отрезки и надписи, но ничего не рисует.
+"""
+
+import math
+import queue
+import threading
+import time
+import types
+
+import compiler
+import functions
+import interpreter
+
+
+class StepLimitError(Exception):
+    pass
+
+
+class TimeLimitError(Exception):
+    pass
+
+
+class StopExecution(Exception):
+    pass
+
+
+def _no_tick(*event):
+    pass
+
+
+# Единичные векторы для направлений, кратных 90 градусам,
+# чтобы координаты оставались целыми.
+_DIRECTIONS = {0: (1, 0), 90: (0, 1), 180: (-1, 0), 270: (0, -1)}
+
+
+class HeadlessTurtle:
+    """
+    Черепашка без графики. Повторяет нужную часть интерфейса RawTurtle.
+    Нарисованное хранится ломаными (lines): отрезок, продолжающий
+    предыдущий, добавляет к ломаной точку, а продолжающий его по той же
+    прямой - только сдвигает последнюю точку.
+    """
+
+    def __init__(self, tick=None):
+        self.tick = tick or _no_tick
+        self.reset()
+
+    def reset(self):
+        self.tick('reset')
+        self.x = 0
+        self.y = 0
+        self.angle = 0
+        self.pen = True
+        self.lines = []
+        self.line = None  # ломаная, которую продолжает следующий отрезок
+
+    def clear(self):
+        self.tick('clear')
+        self.lines = []
+        self.line = None
+
+    def home(self):
+        self.tick('home')
+        self._goto(0, 0)
+        self.angle = 0
+
+    def up(self):
+        self.tick('up')
+        self.pen = False
+        self.line = None
+
+    def down(self):
+        self.tick('down')
+        self.pen = True
+
+    def isdown(self):
+        return self.pen
+
+    def setheading(self, angle):
+        self.tick('setheading', angle)
+        self.angle = angle % 360
+
+    def heading(self):
+        return self.angle
+
+    def forward(self, distance):
+        self.tick('forward', distance)
+        if self.angle in _DIRECTIONS:
+            dx, dy = _DIRECTIONS[self.angle]
+        else:
+            dx = math.cos(math.radians(self.angle))
+            dy = math.sin(math.radians(self.angle))
+        self._goto(self.x + dx * distance, self.y + dy * distance)
+
+    def goto(self, x, y):
+        self.tick('goto', x, y)
+        self._goto(x, y)
+
+    def backward(self, distance):
+        self.forward(-distance)
+
+    def xcor(self):
+        return self.x
+
+    def ycor(self):
+        return self.y
+
+    def position(self):
+        return self.x, self.y
+
+    def _goto(self, x, y):
+        if self.pen and (x, y) != (self.x, self.y):
+            line = self.line
+            if line is None:
+                self.line = line = [(self.x, self.y)]
+                self.lines.append(line)
+            if len(line) > 1 and _same_direction(line[-2], line[-1], (x, y)):
+                line[-1] = (x, y)
+            else:
+                line.append((x, y))
+        self.x = x
+        self.y = y
+
+    @property
+    def segments(self):
+        """Нарисованные отрезки: пары точек."""
+        return [(a, b) for line in self.lines for a, b in zip(line, line[1:])]
+
+    fd = forward
+    bk = back = backward
+    seth = setheading
+    pu = penup = up
+    pd = pendown = down
+    pos = position
+
+
+class HeadlessCanvas:
+    """Холст без графики. Хранит только текстовые элементы и их теги."""
+
+    def __init__(self, tick=None):
+        self.tick = tick or _no_tick
+        self.items = {}
+        self.tags = {}  # тег -> номера элементов
+        self.last_id = 0
+
+    def create_text(self, x, y, text='', tags=(), **options):
+        self.last_id += 1
+        self.tick('create_text', x, y, text, self.last_id)
+        self.items[self.last_id] = (x, y, text)
+        for tag in (tags,) if isinstance(tags, str) else tags:
+            self.tags.setdefault(tag, set()).add(self.last_id)
+        return self.last_id
+
+    def delete(self, *args):
+        items = list(_flatten(args))
+        self.tick('delete', *items)
+        for item in items:
+            if item == 'all':
+                self.items.clear()
+                self.tags.clear()
+            elif isinstance(item, str):
+                for x in self.tags.pop(item, ()):
+                    self.items.pop(x, None)
+            else:
+                self.items.pop(item, None)
+
+
+def _same_direction(a, b, c):
+    """Отрезок b-c продолжает отрезок a-b по той же прямой в ту же сторону."""
+    abx, aby = b[0] - a[0], b[1] - a[1]
+    bcx, bcy = c[0] - b[0], c[1] - b[1]
+    return abx * bcy == aby * bcx and abx * bcx + aby * bcy > 0
+
+
+def _flatten(args):
+    for x in args:
+        if isinstance(x, (tuple, list)):
+            yield from _flatten(x)
+        else:
+            yield x
+
+
+class HeadlessRunner:
+    """
+    Исполняет скомпилированный код на модели мира.
+    max_steps - наибольшее число команд черепашке и холсту,
+    после которого исполнение прерывается с StepLimitError.
+    timeout - наибольшее время исполнения в секундах,
+    после которого исполнение прерывается с TimeLimitError.
+    listener - функция, которая получает каждое изменение мира
+    в виде кортежа (имя метода, *аргументы). Проверки условий тоже
+    считаются шагами, но listener их не получает.
+    """
+
+    def __init__(self, max_steps=None, timeout=None, listener=None):
+        self.max_steps = max_steps
+        self.timeout = timeout
+        self.listener = listener
+        self.stopped = False
+        self.deadline = None
+        self.steps = 0
+        self.t = functions.Performer(HeadlessTurtle(self.tick))
+        self.t.tick = self.tick
+        self.canvas = HeadlessCanvas(self.tick)
+
+    def tick(self, *event):
+        self.steps += 1
+        if self.stopped:
+            raise StopExecution('Остановлено.')
+        if self.max_steps is not None and self.steps > self.max_steps:
+            raise StepLimitError(f'Превышено число шагов: {self.max_steps}')
+        # Время проверяется не на каждом шаге, так как это медленнее самого шага.
+        if self.deadline is not None and not self.steps % 256 and time.monotonic() > self.deadline:
+            raise TimeLimitError(f'Превышено время исполнения: {self.timeout} с')
+        if self.listener is not None and event:
+            self.listener(event)
+
+    def run(self, code):
+        """
+        Исполняет code - текст на Python, объект кода, interpreter.Program
+        или итерируемый объект с ними (от compiler.compile_stream).
+        """
+        self.steps = 0
+        self.deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        self.t.reset()
+        self.t.up()
+        self.t.board.clear(self.canvas)
+        namespace = {name: getattr(functions, name) for name in dir(functions)
+                     if not name.startswith('_')}
+        namespace['self'] = self
+        try:
+            if isinstance(code, (str, types.CodeType, interpreter.Program)):
+                code = [code]
+            for chunk in code:
+                if isinstance(chunk, interpreter.Program):
+                    chunk.run(self)
+                else:
+                    exec(chunk, namespace)
+        finally:
+            # Отложенное движение дорисовывается, даже если исполнение прервано.
+            try:
+                self.t.flush()
+            except (StepLimitError, TimeLimitError, StopExecution):
+                pass
+
+    def state(self):
+        """Возвращает конечное состояние мира."""
+        return {
+            'x': self.t.xcor(),
+            'y': self.t.ycor(),
+            'heading': self.t.angle,
+            'pen': self.t.pen,
+            'steps': self.steps,
+            'segments': list(self.t.turtle.segments),
+            'texts': {(col * functions.STEP, row * functions.STEP): text
+                      for col, row, text in self.t.board.symbols()},
+        }
+
+
+class BackgroundRun(threading.Thread):
+    """
+    Исполняет код в отдельном потоке. Каждое изменение мира
+    кладётся в очередь events, откуда его забирает интерфейс.
+    Когда очередь заполнена, исполнение ждёт, пока её разберут.
+    Ошибка исполнения (любая) сохраняется в error.
+    """
+
+    def __init__(self, code, max_steps=None, maxsize=10_000):
+        super().__init__(daemon=True)
+        self.code = code
+        self.events = queue.Queue(maxsize)
+        self.runner = HeadlessRunner(max_steps, listener=self.send)
+        self.error = None
+
+    def send(self, event):
+        while True:
+            try:
+                self.events.put(event, timeout=0.1)
+                return
+            except queue.Full:
+                if self.runner.stopped:
+                    raise StopExecution('Остановлено.')
+
+    def run(self):
+        try:
+            self.runner.run(self.code)
+        except Exception as e:
+            self.error = e
+
+    def stop(self):
+        self.runner.stopped = True
+
+    def finished(self):
+        """Исполнение закончено и все изменения забраны из очереди."""
+        return not self.is_alive() and self.events.empty()
+
+
+def error_line(error, filename='<epl>'):
+    """
+    Возвращает номер строки кода на EPL, на которой случилась
+    ошибка исполнения error (BoundsError, RecursionError и т. п.), или None.
+    """
+    if hasattr(error, 'epl_line'):
+        return error.epl_line
+    line = None
+    tb = error.__traceback__
+    while tb is not None:
+        if tb.tb_frame.f_code.co_filename == filename:
+            line = tb.tb_lineno
+        tb = tb.tb_next
+    return line
+
+
+def describe_error(error, filename='<epl>'):
+    """
+    Возвращает (сообщение, номер строки кода на EPL или None)
+    для любой ошибки исполнения error.
+    """
+    line = error_line(error, filename)
+    if isinstance(error, RecursionError):
+        return 'Бесконечная рекурсия.', line
+    if isinstance(error, (functions.BoundsError, StepLimitError, TimeLimitError, StopExecution,
+                          compiler.EPLException)):
+        return error.args[0], line
+    return f'Ошибка исполнения: {type(error).__name__}: {error}', line
+
+
+def run_headless(code, max_steps=None, timeout=None, optimize=False, stack=False):
+    """
+    Компилирует и исполняет программу на EPL без графики.
+    code - строка или файл (канал): файл компилируется и исполняется
+    по частям, не читаясь в память целиком.
+    stack - исполнять на явном стеке (модуль interpreter).
+    """
+    runner = HeadlessRunner(max_steps, timeout)
+    if stack:
+        runner.run(interpreter.load(code, optimize))
+    elif isinstance(code, str):
+        runner.run(compiler.compile_program(code, optimize))
+    else:
+        runner.run(compiler.compile_stream(code, optimize))
+    return runner
@@ -1,16 +1,85 @@
 """Графика."""
 
+import queue
 import tkinter
+from collections import defaultdict
+from itertools import islice
+from tkinter import simpledialog, ttk
 from turtle import TurtleScreen, RawTurtle
 from sys import platform
 
 import compiler
+import interpreter
+import profiler
+import recorder
+from cache import CompileCache
 from functions import *
-from lexer import EPLLexer
+from headless import BackgroundRun, StopExecution, describe_error
+from lexer import EPLLexer, LineLexer
+
+# Задержка подсветки после нажатия клавиши в мс:
+# нажатия, пришедшие за это время, подсвечиваются за один раз.
+HIGHLIGHT_DELAY = 50
+
+# Исполнение в фоне: как часто обновляется окно (в мс),
+# сколько изменений рисуется за один кадр и сколько шагов можно сделать.
+FRAME_MS = 20
+DRAW_PER_FRAME = 20
+MAX_STEPS = 1_000_000
+
+# Режимы скорости рисования:
+# normal - каждый шаг анимируется,
+# frames - без анимации, окно обновляется раз в кадр,
+# instant - без анимации, окно обновляется раз в FLUSH_EVERY изменений и в конце.
+SPEED_MODES = {
+    'normal': 'Обычная',
+    'frames': 'По кадрам',
+    'instant': 'Мгновенная',
+}
+FLUSH_EVERY = 5_000
+
+
+def frame_size(speed, draw_per_frame=DRAW_PER_FRAME):
+    """Сколько изменений мира рисуется за один кадр в режиме speed."""
+    return FLUSH_EVERY if speed == 'instant' else draw_per_frame
+
+
+class TaggedScreen(TurtleScreen):
+    """Экран черепашки, который помечает все линии тегом LINE_TAG."""
+
+    def _createline(self):
+        item = super()._createline()
+        self.cv.addtag_withtag(LINE_TAG, item)
+        return item
+
+
+class TaggedTurtle(RawTurtle):
+    """
+    Черепашка, которая стирает свои линии (ОЧИСТИТЬ, СБРОС)
+    одним удалением по тегу, а не по одной.
+    """
+
+    def _clear(self):
+        self.screen.cv.delete(LINE_TAG)
+        self.items = []
+        super()._clear()
+
+
+TAGS = ("Token.Keyword", "Token.Text", "Token.Literal.String",
+        "Token.Comment", "Token.Name.Builtin", "Token.Number",
+        "Token.Operator", "Token.Error")
+
+
+def _sort_key(value):
+    """Числа в таблице сортируются как числа, текст - как текст."""
+    try:
+        return 0, float(value), ''
+    except ValueError:
+        return 1, 0.0, value
 
 
 class Interface:
-    def __init__(self):
+    def __init__(self, speed='normal', optimize=False, stack=False):
         self.tk = tkinter.Tk()
         self.tk.title("EPL 1.1")
         # Окно ввода кода.
@@ -22,17 +91,22 @@ class Interface:
         self.codeinput.tag_configure("Token.Literal.String", foreground='cyan')
         self.codeinput.tag_configure("Token.Comment", foreground="grey")
         self.codeinput.tag_configure("Token.Name.Builtin", foreground="green")
-        self.codeinput.bind('<Key>', lambda event: self.tk.after(20,
-                            self.highlight_syntax))
+        self.line_lexer = LineLexer()
+        self.highlight_job = None
+        self.codeinput.bind('<Key>', self.schedule_highlight)
         # Кнопка запуска.
         self.go_btn = tkinter.Button(self.tk, text='запустить', command=self.go)
         self.go_btn.grid(row=2, column=0)
+        # Кнопка остановки.
+        self.stop_btn = tkinter.Button(self.tk, text='стоп', command=self.stop,
+                                       state=tkinter.DISABLED)
+        self.stop_btn.grid(row=2, column=1)
 
         # Поле для рисования.
         self.canvas = tkinter.Canvas(self.tk, width=WIDTH, height=HEIGHT)
         self.canvas.grid(row=1, column=0)
-        self.screen_draw = TurtleScreen(self.canvas)
-        self.t = RawTurtle(self.screen_draw)
+        self.screen_draw = TaggedScreen(self.canvas)
+        self.t = Performer(TaggedTurtle(self.screen_draw))
 
         self.modifier = 'Command' if platform == 'darwin' else 'Control'
         self.tk.bind(f'<{self.modifier}-n>', self.reset)
@@ -42,16 +116,28 @@ class Interface:
 
         self.tk.bind('<F1>', self.open_doc)
 
+        # Настройки исполнения в фоне.
+        self.background = tkinter.BooleanVar(self.tk, value=True)
+        self.max_steps = MAX_STEPS
+        self.draw_per_frame = DRAW_PER_FRAME
+        self.frame_ms = FRAME_MS
+        self.speed = tkinter.StringVar(self.tk, value=speed)
+        self.stack = tkinter.BooleanVar(self.tk, value=stack)  # исполнять на явном стеке
+        self.background_run = None
+        self.items = {}  # номера надписей в модели мира -> номера на холсте
+        self.trace = None  # запись последнего исполнения в фоне
+        self.replaying = None  # изменения из записи, которые сейчас рисуются
+
         self.create_menu(self.tk)
 
         self.is_compile = False
+        self.cache = CompileCache(optimize=optimize)
 
         tkinter.mainloop()
 
     def reset(self, evt):
-        self.t.reset()
-        self.t.up()
-        reset_texts(self.canvas)
+        self.stop()
+        self.clear_world()
         self.codeinput.delete('1.0', 'end')
 
     def open_file(self, evt):
@@ -92,16 +178,31 @@ class Interface:
         exit_btn = tkinter.Button(tk, text='закрыть', command=tk.destroy)
         exit_btn.grid(row=1, column=0)
 
+    def schedule_highlight(self, evt=None):
+        """Откладывает подсветку, пока идут нажатия клавиш."""
+        if self.highlight_job is not None:
+            self.tk.after_cancel(self.highlight_job)
+        self.highlight_job = self.tk.after(HIGHLIGHT_DELAY, self.highlight_syntax)
+
     def highlight_syntax(self):
-        for tag in ("Token.Keyword", "Token.Text", "Token.Literal.String",
-                    "Token.Comment", "Token.Name.Builtin", "Token.Number"):
-            self.codeinput.tag_remove(tag, "1.0", "end")
-        name_entered = self.codeinput.get("1.0", "end")
-        self.codeinput.mark_set("range_start", "1.0")
-        for start, token, token_text in self.lexer.get_tokens_unprocessed(name_entered):
-            self.codeinput.mark_set("range_end", f"range_start + {len(token_text)}c")
-            self.codeinput.tag_add(str(token), 'range_start', 'range_end')
-            self.codeinput.mark_set("range_start", "range_end")
+        """Подсвечивает строки, изменившиеся с прошлой подсветки."""
+        self.highlight_job = None
+        first, changed = self.line_lexer.update(self.codeinput.get("1.0", "end-1c"))
+        if not changed:
+            return
+        last = first + len(changed) - 1
+        for tag in TAGS:
+            self.codeinput.tag_remove(tag, f"{first}.0", f"{last}.end")
+
+        ranges = defaultdict(list)
+        for line, tokens in enumerate(changed, first):
+            for token in tokens:
+                if token.type is compiler.TokenType.SPACE:
+                    continue
+                end = token.column + len(token.value)
+                ranges[str(self.lexer.token_type(token))] += (f"{line}.{token.column}", f"{line}.{end}")
+        for tag, indices in ranges.items():
+            self.codeinput.tag_add(tag, *indices)
 
     def create_menu(self, master):
         menu = tkinter.Menu()
@@ -130,6 +231,24 @@ class Interface:
         menu.add_cascade(label='Файл', underline=0,
                          menu=file_menu)
 
+        run_menu = tkinter.Menu(menu)
+        run_menu.add_checkbutton(label='В фоне', variable=self.background)
+        run_menu.add_checkbutton(label='Глубокая рекурсия', variable=self.stack)
+        for mode, label in SPEED_MODES.items():
+            run_menu.add_radiobutton(label=f'Скорость: {label}', value=mode, variable=self.speed)
+        run_menu.add_separator()
+        run_menu.add_command(label='Лимит шагов...',
+                             command=lambda: self.ask_setting('max_steps', 'Лимит шагов'))
+        run_menu.add_command(label='Изменений за кадр...',
+                             command=lambda: self.ask_setting('draw_per_frame', 'Изменений за кадр'))
+        run_menu.add_command(label='Кадр, мс...',
+                             command=lambda: self.ask_setting('frame_ms', 'Кадр, мс'))
+        run_menu.add_separator()
+        run_menu.add_command(label='Повторить', command=self.replay)
+        run_menu.add_command(label='Профиль', command=self.show_profile)
+        menu.add_cascade(label='Исполнение', underline=0,
+                         menu=run_menu)
+
         help_menu = tkinter.Menu(menu)
 
         if platform == 'darwin':
@@ -157,33 +276,171 @@ class Interface:
     def compilation(self):
         """Запускает компиляцию."""
         text = self.codeinput.get('1.0', 'end')
+        # Лексемы подсветки сюда не передаются: feed_text с tokenize
+        # разбирает текст в несколько раз быстрее, чем feed_tokens их перебирает.
         try:
-            self.code = compiler.compilation(self.preprocess(repr(text)))
+            if self.stack.get():
+                self.code = interpreter.load(text, self.cache.optimize)
+            else:
+                self.code = self.cache.get(text)
         except (compiler.EPLException) as e:
             self.error(e.args[0], line_num=e.args[1])
             self.is_compile = False
         else:
             self.is_compile = True
 
+    def ask_setting(self, name, title):
+        value = simpledialog.askinteger(title, title, parent=self.tk,
+                                        initialvalue=getattr(self, name), minvalue=1)
+        if value is not None:
+            setattr(self, name, value)
+
     def go(self):
         """Запускает скомпилированную программу."""
+        self.stop()
         self.compilation()
+        self.clear_world()
+
+        if self.is_compile and self.background.get():
+            self.trace = recorder.Trace()
+            self.background_run = BackgroundRun(self.code, self.max_steps)
+            self.background_run.start()
+            self.stop_btn.config(state=tkinter.NORMAL)
+            self.tk.after(self.frame_ms, self.draw, self.background_run)
+        elif self.is_compile:
+            try:
+                if isinstance(self.code, interpreter.Program):
+                    self.code.run(self)
+                else:
+                    exec(self.code, globals(), locals())
+            except SyntaxError:
+                self.error('Ошибка разработчиков.')
+            except (BoundsError, RecursionError) as e:
+                self.error(*describe_error(e))
+            finally:
+                self.t.flush()
+                self.screen_draw.update()
 
+    def clear_world(self):
+        """Очищает поле перед исполнением или повтором."""
         self.t.reset()
         self.t.up()
-        reset_texts(self.canvas)
+        self.t.board.clear(self.canvas)
+        # Надписи прошлого фонового исполнения помечены тем же тегом.
+        self.canvas.delete(TEXT_TAG)
+        self.items = {}
+        self.screen_draw.tracer(1 if self.speed.get() == 'normal' else 0)
 
-        if self.is_compile:
+    def draw(self, run):
+        """Рисует очередные изменения мира из фонового исполнения."""
+        if run is not self.background_run:
+            return
+        count = frame_size(self.speed.get(), self.draw_per_frame)
+        for _ in range(count):
             try:
-                exec(self.code, globals(), locals())
-            except BoundsError:
-                self.error('Не могу!')
-            except SyntaxError:
-                self.error('Ошибка разработчиков.')
-            except RecursionError:
-                self.error('Бесконечная рекурсия.')
+                event = run.events.get_nowait()
+            except queue.Empty:
+                break
+            self.trace.record(event)
+            self.apply(event)
+        self.t.flush()
+        if self.speed.get() != 'normal':
+            self.screen_draw.update()
+        if run.finished():
+            self.finish(run)
+        else:
+            self.tk.after(self.frame_ms, self.draw, run)
+
+    def apply(self, event):
+        """Повторяет изменение модели мира на черепашке и холсте."""
+        name, *args = event
+        if name == 'create_text':
+            x, y, text, item = args
+            self.items[item] = self.canvas.create_text(x, y, text=text, tags=TEXT_TAG)
+        elif name == 'delete':
+            for item in args:
+                if item == TEXT_TAG:
+                    self.canvas.delete(TEXT_TAG)
+                    self.items = {}
+                elif item in self.items:
+                    self.canvas.delete(self.items.pop(item))
+        else:
+            getattr(self.t, name)(*args)
+
+    def replay(self):
+        """Рисует запись последнего исполнения в фоне заново, не исполняя программу."""
+        if self.trace is None or self.background_run is not None:
+            return
+        self.clear_world()
+        self.replaying = self.trace.events()
+        self.tk.after(self.frame_ms, self.draw_replay, self.replaying)
+
+    def draw_replay(self, events):
+        """Рисует очередные изменения из записи."""
+        if events is not self.replaying:
+            return
+        count = frame_size(self.speed.get(), self.draw_per_frame)
+        drawn = 0
+        for event in islice(events, count):
+            self.apply(event)
+            drawn += 1
+        self.t.flush()
+        self.screen_draw.update()
+        if drawn < count:
+            self.replaying = None
+        else:
+            self.tk.after(self.frame_ms, self.draw_replay, events)
+
+    def finish(self, run):
+        self.screen_draw.update()
+        self.background_run = None
+        self.stop_btn.config(state=tkinter.DISABLED)
+        if run.error is not None and not isinstance(run.error, StopExecution):
+            self.error(*describe_error(run.error))
+
+    def show_profile(self):
+        """Исполняет программу без графики под профилировщиком и показывает таблицы."""
+        text = self.codeinput.get('1.0', 'end')
+        try:
+            profile, error = profiler.profile_source(text, self.max_steps, optimize=self.cache.optimize)
+        except compiler.EPLException as e:
+            self.error(e.args[0], line_num=e.args[1])
+            return
+        if error is not None:
+            self.error(error['error'], error['line'])
+        report = profile.report(text)
+
+        window = tkinter.Toplevel(self.tk)
+        window.title('Профиль')
+        fields = ('hits', 'calls', 'moves', 'checks', 'time')
+        titles = {'line': 'Строка', 'text': 'Код', 'name': 'Процедура', 'hits': 'Исполнений',
+                  'calls': 'Вызовов', 'moves': 'Шагов', 'checks': 'Проверок', 'time': 'Время, мс'}
+        for row, (rows, columns) in enumerate(((report['lines'], ('line', 'text') + fields),
+                                               (report['procedures'], ('name',) + fields[1:]))):
+            table = ttk.Treeview(window, columns=columns, show='headings', height=10)
+            for column in columns:
+                table.heading(column, text=titles[column],
+                              command=lambda t=table, c=column: self.sort_table(t, c))
+                table.column(column, width=200 if column in ('text', 'name') else 80)
+            for item in rows:
+                table.insert('', 'end', values=[round(item[c] * 1000, 3) if c == 'time' else item.get(c, '')
+                                                for c in columns])
+            table.grid(row=row, column=0, sticky='nsew')
+        window.columnconfigure(0, weight=1)
+
+    @staticmethod
+    def sort_table(table, column):
+        """Сортирует строки таблицы по столбцу, повторный щелчок - в обратном порядке."""
+        items = [(table.set(item, column), item) for item in table.get_children('')]
+        reverse = getattr(table, 'sorted_by', None) == column
+        items.sort(key=lambda pair: _sort_key(pair[0]), reverse=reverse)
+        for index, (_, item) in enumerate(items):
+            table.move(item, '', index)
+        table.sorted_by = None if reverse else column
 
-    def preprocess(self, code: str):
-        """Превращает текст из Tkinter в нормальный текст."""
-        return '\n'.join(x for x in code[1:-1].replace('\\t',
-                         ' ').upper().split('\\N'))
+    def stop(self):
+        """Останавливает фоновое исполнение и повтор."""
+        self.replaying = None
+        if self.background_run is not None:
+            self.background_run.stop()
+            self.finish(self.background_run)
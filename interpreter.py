@@ -0,0 +1,202 @@
+"""
+Исполнение программ на EPL на явном стеке (ключ --stack).
+
+Обычно процедуры ЭТО становятся функциями Python и вызывают друг
+друга через стек интерпретатора, поэтому глубокая рекурсия упирается
+в sys.getrecursionlimit. Здесь дерево программы (compiler.Node)
+переводится в плоские списки команд, а вызов процедуры кладёт в
+список stack пару (команды, номер следующей команды). Глубина рекурсии
+ограничена только памятью, отведённой под этот список (memory).
+
+Команда - кортеж (код, a, b, строка), строка - номер строки в коде на EPL.
+Сами действия и проверки компилируются тем же компилятором, что и в
+обычном режиме, в функции от self: lambda self: move(self.t, 90).
+"""
+
+import ast
+import sys
+
+import compiler
+import functions
+
+# Коды команд.
+CALL_FN = 0      # a(self)
+NEXT = 1         # конец тела ПОВТОРИ, a - начало тела
+JUMP_IF_NOT = 2  # если не a(self), перейти на b
+JUMP = 3         # перейти на a
+LOOP = 4         # начало ПОВТОРИ a раз, b - команда после цикла
+CALL = 5         # вызов процедуры a
+RETURN = 6       # возврат из процедуры
+DEF = 7          # процедура a - список команд b
+
+# Память под один кадр: пара (команды, номер) и место под неё в списке.
+FRAME_SIZE = sys.getsizeof((None, 0)) + 8
+DEFAULT_MEMORY = 64 * 2 ** 20
+
+NAMESPACE = {name: getattr(functions, name) for name in dir(functions) if not name.startswith('_')}
+
+
+class Program:
+    """
+    Программа для исполнения на явном стеке.
+    memory - сколько байт можно занять под кадры вызовов процедур.
+    """
+
+    def __init__(self, nodes, memory=DEFAULT_MEMORY):
+        self.max_depth = max(1, memory // FRAME_SIZE)
+        self.compiler = compiler.Compiler()
+        self.functions = {}
+        self.main = self.procedure(nodes)
+        del self.compiler, self.functions
+
+    def procedure(self, nodes, line=None):
+        """Код процедуры из узлов nodes. line - строка ЭТО (для главной программы - None)."""
+        code = []
+        if line is not None and not compiler.acts(nodes):
+            code.append((CALL_FN, _tick, None, line))
+        self.emit(nodes, code)
+        code.append((RETURN, None, None, nodes[-1].line if nodes else 0))
+        return code
+
+    def emit(self, nodes, code):
+        """Добавляет в code команды для узлов nodes."""
+        for node in nodes:
+            kind = node.kind
+            line = node.line
+            if kind == 'call':
+                code.append((CALL, node.arg, None, line))
+            elif kind == 'func':
+                code.append((DEF, node.arg, self.procedure(node.body, line), line))
+            elif kind == 'use':
+                # Процедуры библиотеки описываются там, где стоит ИСПОЛЬЗУЙ.
+                self.emit(node.body, code)
+            elif kind == 'loop':
+                start = len(code)
+                code.append(None)
+                if not compiler.acts(node.body):
+                    code.append((CALL_FN, _tick, None, line))
+                self.emit(node.body, code)
+                code.append((NEXT, start + 1, None, line))
+                code[start] = (LOOP, node.arg, len(code), line)
+            elif kind == 'while':
+                start = len(code)
+                code.append(None)
+                self.emit(node.body, code)
+                code.append((JUMP, start, None, line))
+                code[start] = (JUMP_IF_NOT, self.condition(node.arg), len(code), line)
+            elif kind == 'if':
+                jumps = []
+                for condition, body, branch_line in node.arg:
+                    test = len(code)
+                    code.append(None)
+                    self.emit(body, code)
+                    jumps.append(len(code))
+                    code.append(None)
+                    code[test] = (JUMP_IF_NOT, self.condition(condition), len(code), branch_line)
+                if node.orelse is not None:
+                    self.emit(node.orelse, code)
+                for jump in jumps:
+                    code[jump] = (JUMP, len(code), None, line)
+            else:
+                code.append((CALL_FN, self.function(node), None, line))
+
+    def function(self, node):
+        """Функция от self для команды node (cmd, write, jump, walk)."""
+        key = (node.kind, node.arg)
+        if key not in self.functions:
+            statement, = self.compiler.build([node])
+            self.functions[key] = _lambda(statement.value)
+        return self.functions[key]
+
+    def condition(self, condition):
+        """Функция от self для проверки от compiler.parse_condition."""
+        key = ('?', condition)
+        if key not in self.functions:
+            self.functions[key] = _lambda(compiler.build_condition(condition, compiler._location(1)))
+        return self.functions[key]
+
+    def run(self, target):
+        """
+        Исполняет программу. target - то, что код видит как self
+        (у него есть t и canvas). Номер строки, на которой случилась
+        ошибка, записывается в её атрибут epl_line.
+        """
+        for _ in self.steps(target):
+            pass
+
+    def steps(self, target):
+        """
+        Исполняет программу по шагам: генератор, который отдаёт управление
+        после каждого действия и каждой проверки условия. Так несколько
+        программ исполняются по очереди (модуль scheduler).
+        """
+        procedures = {}
+        stack = []
+        counters = []
+        max_depth = self.max_depth
+        code = self.main
+        pc = 0
+        line = 0
+        try:
+            while True:
+                op, a, b, line = code[pc]
+                pc += 1
+                if op == CALL_FN:
+                    a(target)
+                    yield
+                elif op == NEXT:
+                    n = counters[-1] - 1
+                    if n:
+                        counters[-1] = n
+                        pc = a
+                    else:
+                        counters.pop()
+                elif op == JUMP_IF_NOT:
+                    if not a(target):
+                        pc = b
+                    yield
+                elif op == JUMP:
+                    pc = a
+                elif op == LOOP:
+                    if a:
+                        counters.append(a)
+                    else:
+                        pc = b
+                elif op == CALL:
+                    if len(stack) >= max_depth:
+                        raise RecursionError('Бесконечная рекурсия.')
+                    stack.append((code, pc))
+                    code = procedures.get(a)
+                    if code is None:
+                        raise NameError(f"name '{a}' is not defined")
+                    pc = 0
+                elif op == RETURN:
+                    if not stack:
+                        return
+                    code, pc = stack.pop()
+                else:
+                    procedures[a] = b
+        except Exception as e:
+            e.epl_line = line
+            raise
+
+
+def _tick(self):
+    """Для тел без действий и проверок, как compiler.Compiler.build_body."""
+    self.t.tick()
+
+
+def _lambda(expr):
+    """Компилирует выражение ast expr в функцию lambda self: expr."""
+    args = ast.arguments(posonlyargs=[], args=[ast.arg('self')], kwonlyargs=[],
+                         kw_defaults=[], defaults=[])
+    tree = ast.fix_missing_locations(ast.Expression(ast.Lambda(args, expr)))
+    return eval(compile(tree, '<epl>', 'eval'), NAMESPACE)
+
+
+def load(code, optimize=False, memory=DEFAULT_MEMORY):
+    """Разбирает code (как compiler.Compiler.feed_text) в Program."""
+    comp = compiler.Compiler(optimize)
+    comp.feed_text(code)
+    with compiler.python_limits():
+        return Program(comp.tree(), memory)
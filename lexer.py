@@ -1,28 +1,88 @@
-import re
-
-from pygments.lexer import RegexLexer, words
+from pygments.lexer import Lexer
 from pygments.token import *
 
-from compiler import keywords, checks, built_in_funcs
+from compiler import keywords, checks, built_in_funcs, lex, TokenType
 
 
-class EPLLexer(RegexLexer):
+class EPLLexer(Lexer):
+    """
+    Подсветка синтаксиса EPL. Разбирает текст тем же сканером,
+    что и компилятор (compiler.lex), поэтому границы лексем всегда совпадают.
+    """
     name = 'EPL'
 
-    flags = re.IGNORECASE
-
-    tokens = {
-        'root': [
-            (words(built_in_funcs, suffix=r'\b'), Name.Builtin),
-            (words(keywords, suffix=r'\b'), Keyword),
-            (words(checks, suffix=r'\b'), String),
-            (r'\b\d+', Number),
-            (r'\w+', Text),
-            (r'\s+', Text),
-            (r'!.*', Comment),
-        ]
+    token_types = {
+        TokenType.NUMBER: Number,
+        TokenType.STRING: String,
+        TokenType.OPERATOR: Operator,
+        TokenType.SPACE: Text,
+        TokenType.COMMENT: Comment,
+        TokenType.ERROR: Error,
     }
 
+    def get_tokens_unprocessed(self, text, tokens=None):
+        """
+        tokens - уже готовые лексемы от compiler.lex для text,
+        если их нет, text разбирается заново.
+        """
+        start = 0
+        for token in tokens if tokens is not None else lex(text):
+            yield start, self.token_type(token), token.value
+            start += len(token.value)
+
+    def token_type(self, token):
+        if token.type is not TokenType.CMD:
+            return self.token_types[token.type]
+        word = token.value.upper()
+        if word in built_in_funcs:
+            return Name.Builtin
+        elif word in keywords:
+            return Keyword
+        elif word in checks:
+            return String
+        return Text
+
+
+class LineLexer:
+    """
+    Лексемы текста редактора по строкам. При изменении текста
+    заново разбираются только изменившиеся строки.
+    """
+
+    def __init__(self):
+        self.lines = []
+        self.line_tokens = []
+
+    def update(self, text):
+        """
+        Обновляет лексемы для нового text.
+        Возвращает номер первой изменившейся строки (с 1)
+        и списки лексем изменившихся строк.
+        """
+        lines = text.split('\n')
+        old = self.lines
+        limit = min(len(lines), len(old))
+        start = 0
+        while start < limit and lines[start] == old[start]:
+            start += 1
+        tail = 0
+        while tail < limit - start and lines[-1 - tail] == old[-1 - tail]:
+            tail += 1
+
+        changed = [list(lex(x)) for x in lines[start:len(lines) - tail]]
+        self.line_tokens[start:len(old) - tail] = changed
+        self.lines = lines
+        return start + 1, changed
+
+    def text(self):
+        return '\n'.join(self.lines)
+
+    def tokens(self):
+        """Все лексемы текста с верными номерами строк."""
+        for i, tokens in enumerate(self.line_tokens, 1):
+            for token in tokens:
+                yield token._replace(line=i)
+
 
 if __name__ == '__main__':
     code = 'ЕСЛИ НЕ КРАЙ ТО ! Проверка.\n  квадрат \n   ВВЕРХ\nКОНЕЦ'
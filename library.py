@@ -0,0 +1,135 @@
+"""
+Библиотеки процедур: ИСПОЛЬЗУЙ имя.
+
+Библиотека - файл имя.epl, в котором описаны только процедуры ЭТО
+(и, может быть, другие библиотеки через ИСПОЛЬЗУЙ). Файл ищется в
+каталогах PATH: текущий каталог, каталоги из переменной окружения
+EPL_PATH и каталог библиотеки рядом с EPL.
+
+Библиотека компилируется один раз: дерево процедур и объект кода
+хранятся в памяти по хэшу текста (и ключу -O), а файл, который не
+менялся, даже не читается заново. Библиотека помнит хэши библиотек,
+которые она использует, и компилируется заново, если они изменились. Программа, которая использует
+библиотеку, получает готовые имена процедур (Compiler.user_funcs),
+а в её код попадает только вызов use, который исполняет готовый
+объект кода библиотеки. Поэтому время компиляции программы не
+зависит от размера библиотек.
+"""
+
+import hashlib
+import os
+
+import compiler
+
+PATH = ['.', *filter(None, os.environ.get('EPL_PATH', '').split(os.pathsep)),
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), 'библиотеки')]
+
+SUFFIX = '.epl'
+
+
+class Library:
+    """
+    Скомпилированная библиотека: procedures - имена процедур, вместе
+    с процедурами библиотек, которые она использует, tree - дерево
+    (узлы func и use), code - объект кода, который их описывает,
+    digest - хэш текста (и ключа -O), uses - хэши всех библиотек,
+    которые она использует, по именам (Compiler.libraries).
+    """
+
+    def __init__(self, name, path, procedures, tree, code, digest, uses):
+        self.name = name
+        self.path = path
+        self.procedures = procedures
+        self.tree = tree
+        self.code = code
+        self.digest = digest
+        self.uses = uses
+
+
+class Loader:
+    """Находит и компилирует библиотеки, хранит их в памяти."""
+
+    def __init__(self, path=None):
+        self.path = PATH if path is None else path
+        self.files = {}     # (путь, время изменения, размер, -O) -> Library
+        self.contents = {}  # хэш текста и -O -> Library
+        self.loading = set()
+
+    def find(self, name):
+        """Путь к файлу библиотеки name (имя в любом регистре) или None."""
+        for directory in self.path:
+            for variant in (name.lower(), name, name.capitalize()):
+                path = os.path.join(directory, variant + SUFFIX)
+                if os.path.isfile(path):
+                    return path
+        return None
+
+    def load(self, name, optimize=False):
+        """Возвращает библиотеку name. Ошибки - EPLException без номера строки."""
+        path = self.find(name)
+        if path is None:
+            raise compiler.EPLNameError(f'Не найдена библиотека "{name}"')
+        stat = os.stat(path)
+        file_key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size, optimize)
+        library = self.files.get(file_key)
+        if library is not None and self.fresh(library.uses, optimize):
+            return library
+
+        with open(path, encoding='utf-8') as f:
+            text = f.read()
+        key = hashlib.sha256(f'{optimize}\n{text}'.encode('utf-8')).hexdigest()
+        library = self.contents.get(key)
+        if library is None or not self.fresh(library.uses, optimize):
+            library = self.compile(name, path, text, optimize, key)
+            self.contents[key] = library
+        self.files[file_key] = library
+        return library
+
+    def paths(self):
+        """Файлы загруженных библиотек - co_filename их объектов кода."""
+        return {library.path for library in self.files.values()}
+
+    def fresh(self, uses, optimize=False):
+        """Библиотеки uses (имя -> хэш) не изменились и находятся."""
+        try:
+            return all(self.load(name, optimize).digest == digest for name, digest in uses.items())
+        except compiler.EPLException:
+            return False
+
+    def compile(self, name, path, text, optimize, digest):
+        if path in self.loading:
+            raise compiler.EPLNameError(f'Библиотека "{name}" использует саму себя')
+        self.loading.add(path)
+        try:
+            comp = compiler.Compiler(optimize)
+            comp.feed_text(text)
+            tree = comp.tree()
+            for node in tree:
+                if node.kind not in ('func', 'use'):
+                    raise compiler.EPLSyntaxError(
+                        'В библиотеке могут быть только процедуры и ИСПОЛЬЗУЙ', node.line)
+            code = comp.code_object(path)
+        except compiler.EPLException as e:
+            where = f', строка {e.args[1]}' if e.args[1] else ''
+            raise type(e)(f'Библиотека "{name}"{where}: {e.args[0]}') from e
+        finally:
+            self.loading.discard(path)
+        return Library(name, path, comp.user_funcs, tree, code, digest, comp.libraries)
+
+
+default = Loader()
+
+
+def load(name, optimize=False):
+    """Библиотека name из общего для процесса загрузчика."""
+    return default.load(name, optimize)
+
+
+def paths():
+    """Файлы библиотек, загруженных общим загрузчиком."""
+    return default.paths()
+
+
+def fresh(uses, optimize=False):
+    """Библиотеки uses (Compiler.libraries) не изменились с компиляции."""
+    return default.fresh(uses, optimize)
@@ -1,3 +1,15 @@
-from interface import Interface
+import argparse
 
-interface = Interface()
+from interface import Interface, SPEED_MODES
+
+parser = argparse.ArgumentParser(description='EPL - простой язык программирования.')
+parser.add_argument('--speed', choices=SPEED_MODES, default='normal',
+                    help='скорость рисования: normal - с анимацией, '
+                         'frames - по кадрам, instant - мгновенно')
+parser.add_argument('-O', dest='optimize', action='store_true',
+                    help='оптимизировать программы')
+parser.add_argument('--stack', action='store_true',
+                    help='исполнять процедуры на явном стеке (для глубокой рекурсии)')
+args = parser.parse_args()
+
+interface = Interface(args.speed, args.optimize, args.stack)
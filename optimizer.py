@@ -0,0 +1,105 @@
+"""
+Оптимизатор программ на EPL (ключ -O).
+
+Работает с деревом программы из compiler.Node до того, как по нему
+написан код на Python:
+    - подряд идущие шаги в одну сторону на одной строке сливаются
+      в один jump (одна проверка края и одно движение вместо нескольких);
+    - из подряд идущих ПОДНЯТЬ и ОПУСТИТЬ остаётся последняя команда,
+      смена пера прямо перед СБРОС убирается;
+    - ПОВТОРИ 0 (и ПОВТОРИ, тело которого стало пустым) убирается,
+      ПОВТОРИ 1 заменяется своим телом; пустые тела ЕСЛИ и ПОКА
+      остаются пустыми (в коде на Python - pass);
+    - ПОВТОРИ с постоянным числом повторов, тело которого - одни шаги
+      на одной строке, становится одним jump (если шаги в одну сторону)
+      или одним walk.
+Шаги с разных строк не сливаются: ошибка исполнения (выход за край)
+должна указывать ту же строку, что и без оптимизации.
+Лишние повороты убирает сама функция move: она поворачивает черепашку,
+только если направление меняется.
+"""
+
+from compiler import Node
+
+MOVES = {'ВВЕРХ': 90, 'ВНИЗ': 270, 'ВПРАВО': 0, 'ВЛЕВО': 180}
+PEN = ('ПОДНЯТЬ', 'ОПУСТИТЬ')
+
+# Наибольшая длина пути в walk: длиннее - цикл остаётся циклом.
+MAX_WALK = 256
+
+
+def optimize(nodes):
+    """Возвращает упрощённую копию списка узлов nodes."""
+    result = []
+    for node in nodes:
+        if node.kind == 'loop':
+            body = optimize(node.body)
+            if node.arg == 0 or not body:
+                continue
+            if node.arg == 1:
+                for inner in body:
+                    append(result, inner)
+                continue
+            node = loop(node, body)
+        elif node.kind in ('func', 'while'):
+            node = Node(node.kind, node.arg, node.line, optimize(node.body))
+        elif node.kind == 'if':
+            branches = [[condition, optimize(body), line] for condition, body, line in node.arg]
+            orelse = None if node.orelse is None else optimize(node.orelse)
+            node = Node('if', branches, node.line, orelse=orelse)
+        append(result, node)
+    return result
+
+
+def append(result, node):
+    """Добавляет node к result, сливая его с предыдущей командой, если можно."""
+    last = result[-1] if result else None
+    if last is None:
+        result.append(node)
+    elif node.kind == 'cmd' and node.arg in PEN and last.kind == 'cmd' and last.arg in PEN:
+        result[-1] = node
+    elif node.kind == 'cmd' and node.arg == 'СБРОС' and last.kind == 'cmd' and last.arg in PEN:
+        result[-1] = node
+    else:
+        a = straight(last)
+        b = straight(node)
+        if a and b and a[0] == b[0] and last.line == node.line:
+            result[-1] = Node('jump', (a[0], a[1] + b[1]), last.line)
+        else:
+            result.append(node)
+
+
+def straight(node):
+    """Для шага или jump возвращает (направление, число клеток), иначе None."""
+    if node.kind == 'cmd' and node.arg in MOVES:
+        return MOVES[node.arg], 1
+    if node.kind == 'jump':
+        return node.arg
+    return None
+
+
+def path(nodes):
+    """Направления всех шагов, если nodes - одни шаги, иначе None."""
+    headings = []
+    for node in nodes:
+        if node.kind == 'walk':
+            headings.extend(node.arg[0] * node.arg[1])
+        elif straight(node):
+            heading, n = straight(node)
+            headings.extend([heading] * n)
+        else:
+            return None
+        if len(headings) > MAX_WALK:
+            return None
+    return headings
+
+
+def loop(node, body):
+    """Заменяет цикл из одних шагов на jump или walk."""
+    headings = path(body)
+    if not headings or len({inner.line for inner in body}) > 1:
+        return Node('loop', node.arg, node.line, body)
+    line = body[0].line
+    if len(set(headings)) == 1:
+        return Node('jump', (headings[0], len(headings) * node.arg), line)
+    return Node('walk', (tuple(headings), node.arg), line)
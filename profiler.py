@@ -0,0 +1,208 @@
+"""
+Профилировщик программ на EPL.
+
+Считает по строкам кода на EPL и по процедурам ЭТО: сколько раз
+исполнялась строка, сколько было вызовов процедур, шагов исполнителя
+и проверок условий и сколько на это ушло времени. Номера строк в
+скомпилированном коде - это строки кода на EPL (compiler.Compiler.build),
+поэтому sys.settrace сразу даёт нужные номера.
+
+Время строки - собственное (без вызванных из неё процедур),
+время процедуры - полное, вместе со всем, что она вызвала.
+Процедуры библиотек (ИСПОЛЬЗУЙ) попадают в таблицу процедур, а их
+вызовы, шаги, проверки и время - в строку программы, которая их вызвала:
+номера строк в них - строки файла библиотеки.
+Программа исполняется без графики (headless.HeadlessRunner).
+
+Пример:
+    python3 profiler.py программа.epl --sort time > профиль.json
+"""
+
+import argparse
+import json
+import sys
+import time
+from collections import defaultdict
+from dataclasses import asdict, dataclass
+
+import compiler
+import functions
+import library
+from headless import HeadlessRunner, describe_error
+
+MAIN = '(программа)'
+
+
+@dataclass
+class Stats:
+    hits: int = 0    # сколько раз исполнялась строка (для процедуры - 0)
+    calls: int = 0   # вызовы процедур (для процедуры - её вызовы)
+    moves: int = 0   # шаги исполнителя
+    checks: int = 0  # проверки условий
+    time: float = 0.0
+
+
+# Сколько шагов или проверок делает функция из functions,
+# вызванная прямо из кода программы.
+_MOVES = {
+    functions.move.__code__: lambda f: 1,
+    functions.jump.__code__: lambda f: f.f_locals['n'],
+    functions.walk.__code__: lambda f: len(f.f_locals['headings']) * f.f_locals['n'],
+}
+_CHECKS = {f.__code__ for f in (functions.check_edge, functions.is_symbol,
+                                functions.empty, functions.not_symbol)}
+
+
+class Profiler:
+    """Собирает Stats по строкам (lines) и процедурам (procedures)."""
+
+    def __init__(self, filename='<epl>'):
+        self.filename = filename
+        self.lines = defaultdict(Stats)
+        self.procedures = defaultdict(Stats)
+        self.frames = []  # [процедура, строка, время начала] для кадров кода программы
+        self.libraries = set()  # co_filename процедур библиотек
+        self.last = 0.0
+
+    def run(self, code, runner=None):
+        """
+        Исполняет code (объект кода от compiler) под профилировщиком.
+        Ошибки исполнения не перехватываются.
+        """
+        runner = runner or HeadlessRunner()
+        # Библиотеки загружены ещё при компиляции code.
+        self.libraries = library.paths()
+        self.last = time.perf_counter()
+        sys.settrace(self.trace)
+        try:
+            runner.run(code)
+        finally:
+            sys.settrace(None)
+        return runner
+
+    def charge(self):
+        """Относит время с прошлого события к текущей строке."""
+        now = time.perf_counter()
+        # До первой строки модуля его номер строки - 0.
+        if self.frames and self.frames[-1][1]:
+            self.lines[self.frames[-1][1]].time += now - self.last
+        self.last = now
+
+    def trace(self, frame, event, arg):
+        code = frame.f_code
+        if code.co_filename == self.filename:
+            self.charge()
+            name = MAIN if code.co_name == '<module>' else code.co_name
+            if self.frames:
+                self.lines[self.frames[-1][1]].calls += 1
+            self.procedures[name].calls += 1
+            self.frames.append([name, frame.f_lineno, self.last])
+            return self.trace_epl
+        if not self.frames:
+            return None
+        if code.co_filename in self.libraries:
+            if code.co_name == '<module>':
+                return None
+            self.charge()
+            self.lines[self.frames[-1][1]].calls += 1
+            self.procedures[code.co_name].calls += 1
+            self.frames.append([code.co_name, self.frames[-1][1], self.last])
+            return self.trace_library
+        caller = frame.f_back.f_code.co_filename
+        if caller != self.filename and caller not in self.libraries:
+            return None
+        if code in _MOVES:
+            moves = _MOVES[code](frame)
+            self.lines[self.frames[-1][1]].moves += moves
+            self.procedures[self.frames[-1][0]].moves += moves
+        elif code in _CHECKS:
+            self.lines[self.frames[-1][1]].checks += 1
+            self.procedures[self.frames[-1][0]].checks += 1
+        return None
+
+    def trace_epl(self, frame, event, arg):
+        if event == 'line':
+            self.charge()
+            self.frames[-1][1] = frame.f_lineno
+            self.lines[frame.f_lineno].hits += 1
+        elif event == 'return':
+            self.charge()
+            name, _, start = self.frames.pop()
+            self.procedures[name].time += self.last - start
+        return self.trace_epl
+
+    def trace_library(self, frame, event, arg):
+        if event == 'return':
+            self.charge()
+            name, _, start = self.frames.pop()
+            self.procedures[name].time += self.last - start
+        return self.trace_library
+
+    def report(self, source=None, sort='line'):
+        """
+        Возвращает словарь для JSON: списки строк и процедур,
+        отсортированные по полю sort (line - по порядку).
+        source - код на EPL, чтобы показать текст строк.
+        """
+        texts = list(compiler.split_lines(source)) if source is not None else []
+        lines = []
+        for line, stats in self.lines.items():
+            row = {'line': line, **asdict(stats)}
+            if 0 < line <= len(texts):
+                row['text'] = texts[line - 1].strip()
+            lines.append(row)
+        procedures = [{'name': name, **asdict(stats)} for name, stats in self.procedures.items()]
+        if sort == 'line':
+            lines.sort(key=lambda row: row['line'])
+        else:
+            lines.sort(key=lambda row: row[sort], reverse=True)
+            procedures.sort(key=lambda row: row.get(sort, 0), reverse=True)
+        return {'lines': lines, 'procedures': procedures}
+
+
+def profile_source(source, max_steps=None, timeout=None, optimize=False):
+    """
+    Компилирует и профилирует программу.
+    Возвращает (Profiler, описание ошибки или None).
+    """
+    code = compiler.compile_program(source, optimize)
+    profiler = Profiler()
+    error = None
+    try:
+        profiler.run(code, HeadlessRunner(max_steps, timeout))
+    except Exception as e:
+        message, line = describe_error(e)
+        error = {'error': message, 'line': line}
+    return profiler, error
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Профиль программы на EPL по строкам и процедурам.')
+    parser.add_argument('path', help='файл с программой')
+    parser.add_argument('--sort', default='line',
+                        choices=('line', 'hits', 'calls', 'moves', 'checks', 'time'),
+                        help='порядок строк в отчёте')
+    parser.add_argument('--timeout', type=float, default=None, help='время в секундах')
+    parser.add_argument('--max-steps', type=int, default=None, help='число шагов')
+    parser.add_argument('-O', dest='optimize', action='store_true',
+                        help='оптимизировать программу')
+    args = parser.parse_args(argv)
+
+    with open(args.path, encoding='utf-8') as f:
+        source = f.read()
+    try:
+        profiler, error = profile_source(source, args.max_steps, args.timeout, args.optimize)
+    except compiler.EPLException as e:
+        json.dump({'error': e.args[0], 'line': e.args[1]}, sys.stdout, ensure_ascii=False)
+        sys.stdout.write('\n')
+        return 1
+    report = profiler.report(source, args.sort)
+    if error is not None:
+        report.update(error)
+    json.dump(report, sys.stdout, ensure_ascii=False, indent=1)
+    sys.stdout.write('\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,164 @@
+"""
+Растеризация рисунков EPL в массивы NumPy и сравнение с эталоном.
+
+Рисунок - линии исполнителя (HeadlessRunner.state()['segments'])
+и символы ПИШИ на клетках (state()['texts']). Линии становятся
+массивом bool размером height x width (по умолчанию - размер поля
+WIDTH x HEIGHT), символы - массивом строк по клеткам поля.
+Пачка рисунков растеризуется одной операцией в массив n x height x width,
+и метрики (iou, cell_diff, board_equal) считаются сразу для всей пачки.
+
+Нужен numpy.
+
+Пример:
+    python3 raster.py эталон.epl работы/ --size 100 100 > оценки.jsonl
+"""
+
+import argparse
+import json
+import sys
+
+import numpy as np
+
+import compiler
+from batch import find_files
+from functions import HEIGHT, MAX_COL, MAX_ROW, STEP, WIDTH
+from headless import describe_error, run_headless
+
+# Надписи длиннее 12 символов functions.write обрезает.
+TEXT_DTYPE = '<U12'
+
+
+def rasterize_batch(states, width=WIDTH, height=HEIGHT):
+    """
+    Растеризует рисунки states (словари от HeadlessRunner.state()).
+    Возвращает (pixels, boards): bool n x height x width
+    и строки n x (2 * MAX_ROW + 1) x (2 * MAX_COL + 1), верхняя строка - первая.
+    """
+    pixels = np.zeros((len(states), height, width), dtype=bool)
+    boards = np.full((len(states), 2 * MAX_ROW + 1, 2 * MAX_COL + 1), '', dtype=TEXT_DTYPE)
+    index = []
+    segments = []
+    for i, state in enumerate(states):
+        index.extend([i] * len(state['segments']))
+        segments.extend((x0, y0, x1, y1) for (x0, y0), (x1, y1) in state['segments'])
+        for (x, y), text in state['texts'].items():
+            boards[i, MAX_ROW - y // STEP, x // STEP + MAX_COL] = text
+    if not segments:
+        return pixels, boards
+
+    # Координаты мира (ось y вверх, центр поля - 0) в номера пикселей.
+    seg = np.asarray(segments, dtype=float)
+    seg[:, 0::2] = (seg[:, 0::2] + WIDTH / 2) * (width / WIDTH)
+    seg[:, 1::2] = (HEIGHT / 2 - seg[:, 1::2]) * (height / HEIGHT)
+    dx = seg[:, 2] - seg[:, 0]
+    dy = seg[:, 3] - seg[:, 1]
+    # Точки через пиксель вдоль каждого отрезка, все отрезки сразу.
+    counts = np.ceil(np.maximum(np.abs(dx), np.abs(dy))).astype(int) + 1
+    owner = np.repeat(np.arange(len(seg)), counts)
+    starts = np.cumsum(counts) - counts
+    t = (np.arange(counts.sum()) - starts[owner]) / np.maximum(counts - 1, 1)[owner]
+    xs = np.clip(np.rint(seg[owner, 0] + dx[owner] * t).astype(int), 0, width - 1)
+    ys = np.clip(np.rint(seg[owner, 1] + dy[owner] * t).astype(int), 0, height - 1)
+    pixels[np.asarray(index)[owner], ys, xs] = True
+    return pixels, boards
+
+
+def rasterize(state, width=WIDTH, height=HEIGHT):
+    """Растеризует один рисунок: (pixels height x width, board)."""
+    pixels, boards = rasterize_batch([state], width, height)
+    return pixels[0], boards[0]
+
+
+def iou(pixels, reference):
+    """
+    Доля общих пикселей линий (пересечение на объединение) для каждого
+    рисунка пачки pixels и эталона reference. Два пустых рисунка совпадают.
+    """
+    axes = (-2, -1)
+    inter = np.logical_and(pixels, reference).sum(axis=axes)
+    union = np.logical_or(pixels, reference).sum(axis=axes)
+    return np.where(union == 0, 1.0, inter / np.maximum(union, 1))
+
+
+def _cell_starts(size, field):
+    """Первые пиксели клеток поля на оси из size пикселей (field - её длина на поле)."""
+    cells = field // STEP
+    return np.arange(cells) * size // cells
+
+
+def cell_diff(pixels, reference):
+    """
+    Число различающихся пикселей в каждой клетке поля для каждого
+    рисунка пачки. Возвращает массив n x (HEIGHT // STEP) x (WIDTH // STEP).
+    Границы клеток считаются по каждой оси отдельно, так что размер
+    рисунка не обязан делиться на число клеток (но не меньше его).
+    """
+    height, width = reference.shape[-2:]
+    diff = np.logical_xor(pixels, reference).astype(np.int32)
+    diff = np.add.reduceat(diff, _cell_starts(height, HEIGHT), axis=-2)
+    return np.add.reduceat(diff, _cell_starts(width, WIDTH), axis=-1)
+
+
+def board_equal(boards, reference):
+    """Совпадают ли символы на всех клетках с эталоном, для каждого рисунка пачки."""
+    return (boards == reference).all(axis=(-2, -1))
+
+
+def score(states, reference, width=WIDTH, height=HEIGHT):
+    """
+    Оценивает рисунки states по эталону reference (словари от
+    HeadlessRunner.state()). Возвращает словарь массивов длины len(states):
+    iou, cells - число клеток с отличиями, board - совпадение символов.
+    """
+    pixels, boards = rasterize_batch(states, width, height)
+    ref_pixels, ref_board = rasterize(reference, width, height)
+    return {
+        'iou': iou(pixels, ref_pixels),
+        'cells': (cell_diff(pixels, ref_pixels) > 0).sum(axis=(-2, -1)),
+        'board': board_equal(boards, ref_board),
+    }
+
+
+def run_file(path, max_steps=None, timeout=None):
+    """Исполняет программу из файла. Возвращает (state или None, ошибка или None)."""
+    try:
+        with open(path, encoding='utf-8') as f:
+            runner = run_headless(f.read(), max_steps, timeout)
+    except (IOError, UnicodeDecodeError) as e:
+        return None, str(e)
+    except Exception as e:
+        return None, describe_error(e)[0]
+    return runner.state(), None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Оценка рисунков программ на EPL по эталону.')
+    parser.add_argument('reference', help='программа-эталон')
+    parser.add_argument('paths', nargs='+', help='каталоги или шаблоны файлов с работами')
+    parser.add_argument('--size', type=int, nargs=2, default=(WIDTH, HEIGHT), metavar=('W', 'H'),
+                        help='размер растра')
+    parser.add_argument('--timeout', type=float, default=5.0, help='время на одну программу в секундах')
+    parser.add_argument('--max-steps', type=int, default=1_000_000, help='число шагов на одну программу')
+    args = parser.parse_args(argv)
+
+    reference, error = run_file(args.reference, args.max_steps, args.timeout)
+    if reference is None:
+        print(f'{args.reference}: {error}', file=sys.stderr)
+        return 1
+    files = find_files(args.paths)
+    runs = [(path, *run_file(path, args.max_steps, args.timeout)) for path in files]
+    done = [(path, state) for path, state, _ in runs if state is not None]
+    scores = score([state for _, state in done], reference, *args.size) if done else {}
+    for i, (path, _) in enumerate(done):
+        print(json.dumps({'file': path, 'iou': round(float(scores['iou'][i]), 4),
+                          'cells': int(scores['cells'][i]), 'board': bool(scores['board'][i])},
+                         ensure_ascii=False))
+    for path, state, error in runs:
+        if state is None:
+            print(json.dumps({'file': path, 'error': error}, ensure_ascii=False))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
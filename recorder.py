@@ -0,0 +1,269 @@
+"""
+Запись исполнения программы на EPL и её повтор.
+
+Запись (Trace) хранит все изменения мира, которые получает listener
+у headless.HeadlessRunner: шаги, перо, повороты, надписи, стирание,
+сброс. Каждое изменение - одно или несколько 16-битных слов в array
+типа 'H': в младших 4 битах первого слова код изменения, в остальных
+12 - первый аргумент, каждый следующий аргумент - 32-битное целое со
+знаком в двух словах (младшее слово первым). Так шаг занимает 2 байта,
+а goto(x, y) - 6. Тексты надписей хранятся один раз в списке texts.
+
+Номер первого числа каждого CHECKPOINT-го изменения запоминается,
+поэтому повтор можно начать с любого изменения (шага), не исполняя
+программу и не разбирая запись с начала. Повтор выдаёт изменения в
+том же виде, что и listener, их можно рисовать так же, как при
+исполнении в фоне (interface.Interface.apply).
+
+Пример:
+    python3 recorder.py программа.epl -o запись.trace
+    python3 recorder.py запись.trace --step 1000 --svg рисунок.svg
+"""
+
+import argparse
+import io
+import struct
+import sys
+from array import array
+from xml.sax.saxutils import escape
+
+import compiler
+import functions
+from functions import TEXT_TAG
+from headless import HeadlessCanvas, HeadlessRunner, HeadlessTurtle, describe_error
+
+# Коды изменений.
+RESET, CLEAR, HOME, UP, DOWN, SETHEADING, FORWARD, GOTO, CREATE_TEXT, DELETE, DELETE_TEXTS = range(11)
+NAMES = ('reset', 'clear', 'home', 'up', 'down', 'setheading', 'forward', 'goto',
+         'create_text', 'delete', 'delete')
+CODES = {name: code for code, name in enumerate(NAMES[:-1])}
+# Сколько слов занимает изменение: первое и по два на каждый следующий аргумент.
+SIZES = (1, 1, 1, 1, 1, 1, 1, 3, 7, 3, 1)
+
+# Первый аргумент хранится в 12 битах: шаги, углы и координаты
+# на поле EPL в них помещаются.
+MIN_ARG = -2048
+MAX_ARG = 2047
+
+CHECKPOINT = 1024
+MAGIC = b'EPLT'
+HEADER = struct.Struct('<4sIIII')  # метка, число изменений, длина words, число текстов и их длина
+
+
+class Trace:
+    """
+    Запись изменений мира. record подходит как listener для HeadlessRunner.
+    len(trace) - число изменений (шагов записи).
+    """
+
+    def __init__(self):
+        self.words = array('H')
+        self.checkpoints = array('I')  # номер слова для каждого CHECKPOINT-го изменения
+        self.texts = []
+        self.text_index = {}
+        self.count = 0
+        self.first_item = None  # номер первой надписи на холсте: в записи они нумеруются с 1
+
+    def __len__(self):
+        return self.count
+
+    def record(self, event):
+        """Записывает изменение (имя метода, *аргументы)."""
+        name = event[0]
+        if name == 'forward' or name == 'setheading':
+            # Самые частые изменения записываются без _add.
+            arg = int(event[1])
+            if not MIN_ARG <= arg <= MAX_ARG:
+                raise ValueError(f'Слишком большое значение для записи: {arg}')
+            if not self.count % CHECKPOINT:
+                self.checkpoints.append(len(self.words))
+            self.words.append((arg & 0xFFF) << 4 | (FORWARD if name == 'forward' else SETHEADING))
+            self.count += 1
+        elif name == 'delete':
+            # Один вызов delete с несколькими надписями - несколько изменений.
+            for item in event[1:]:
+                if isinstance(item, str):
+                    self._add(DELETE_TEXTS, 0)
+                else:
+                    self._add(DELETE, 0, item - self.first_item + 1)
+        elif name == 'create_text':
+            _, x, y, text, item = event
+            if self.first_item is None:
+                self.first_item = item
+            if text not in self.text_index:
+                self.text_index[text] = len(self.texts)
+                self.texts.append(text)
+            self._add(CREATE_TEXT, int(x), int(y), self.text_index[text], item - self.first_item + 1)
+        elif len(event) == 1:
+            self._add(CODES[name], 0)
+        else:
+            # Координаты и углы в EPL целые (functions.Performer).
+            self._add(CODES[name], *map(int, event[1:]))
+
+    def _add(self, code, first, *rest):
+        if not MIN_ARG <= first <= MAX_ARG:
+            raise ValueError(f'Слишком большое значение для записи: {first}')
+        if not self.count % CHECKPOINT:
+            self.checkpoints.append(len(self.words))
+        words = self.words
+        words.append((first & 0xFFF) << 4 | code)
+        for value in rest:
+            words.append(value & 0xFFFF)
+            words.append(value >> 16 & 0xFFFF)
+        self.count += 1
+
+    def events(self, start=0, stop=None):
+        """Изменения с номерами от start до stop в том же виде, что и у listener."""
+        stop = self.count if stop is None else min(stop, self.count)
+        if start >= stop:
+            return
+        words = self.words
+        texts = self.texts
+        pos = self.checkpoints[start // CHECKPOINT]
+        for index in range(start - start % CHECKPOINT, stop):
+            word = words[pos]
+            code = word & 15
+            if index >= start:
+                arg = word >> 4
+                if arg > MAX_ARG:
+                    arg -= 4096
+                if code == FORWARD or code == SETHEADING:
+                    yield NAMES[code], arg
+                elif code == GOTO:
+                    yield 'goto', arg, _long(words, pos + 1)
+                elif code == CREATE_TEXT:
+                    yield ('create_text', arg, _long(words, pos + 1),
+                           texts[_long(words, pos + 3)], _long(words, pos + 5))
+                elif code == DELETE:
+                    yield 'delete', _long(words, pos + 1)
+                elif code == DELETE_TEXTS:
+                    yield 'delete', TEXT_TAG
+                else:
+                    yield NAMES[code],
+            pos += SIZES[code]
+
+    def world(self, step=None):
+        """
+        Мир после первых step изменений (все, если step не задан):
+        (HeadlessTurtle, HeadlessCanvas). Программа не исполняется.
+        """
+        turtle = HeadlessTurtle()
+        canvas = HeadlessCanvas()
+        for name, *args in self.events(0, step):
+            if name == 'create_text':
+                x, y, text, _ = args
+                canvas.create_text(x, y, text=text, tags=TEXT_TAG)
+            elif name == 'delete':
+                canvas.delete(*args)
+            else:
+                getattr(turtle, name)(*args)
+        return turtle, canvas
+
+    def svg(self, step=None):
+        """Рисунок после первых step изменений в формате SVG (без Tk)."""
+        turtle, canvas = self.world(step)
+        width, height = functions.WIDTH, functions.HEIGHT
+        parts = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+                 f'viewBox="{-width // 2} {-height // 2} {width} {height}">',
+                 f'<rect x="{-width // 2}" y="{-height // 2}" width="{width}" height="{height}" fill="white"/>']
+        for line in turtle.lines:
+            # У черепашки ось y направлена вверх, у SVG (и холста) - вниз.
+            points = ' '.join(f'{x:g},{-y:g}' for x, y in line)
+            parts.append(f'<polyline points="{points}" fill="none" stroke="black"/>')
+        for x, y, text in canvas.items.values():
+            parts.append(f'<text x="{x:g}" y="{y:g}" text-anchor="middle" '
+                         f'dominant-baseline="central">{escape(text)}</text>')
+        parts.append('</svg>')
+        return '\n'.join(parts) + '\n'
+
+    def save(self, file):
+        """Сохраняет запись в двоичный файл (открытый на запись)."""
+        words = array('H', self.words)
+        if sys.byteorder == 'big':
+            words.byteswap()
+        texts = '\0'.join(self.texts).encode('utf-8')
+        file.write(HEADER.pack(MAGIC, self.count, len(words), len(self.texts), len(texts)))
+        file.write(words.tobytes())
+        file.write(texts)
+
+    @classmethod
+    def load(cls, file):
+        """Читает запись, сохранённую save."""
+        magic, count, size, texts_count, texts_size = HEADER.unpack(file.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError('Это не запись исполнения EPL.')
+        trace = cls()
+        trace.words.frombytes(file.read(size * trace.words.itemsize))
+        if sys.byteorder == 'big':
+            trace.words.byteswap()
+        texts = file.read(texts_size).decode('utf-8')
+        trace.texts = texts.split('\0') if texts_count else []
+        trace.text_index = {text: i for i, text in enumerate(trace.texts)}
+        # Отметки для поиска восстанавливаются одним проходом.
+        pos = 0
+        for index in range(count):
+            if not index % CHECKPOINT:
+                trace.checkpoints.append(pos)
+            pos += SIZES[trace.words[pos] & 15]
+        trace.count = count
+        return trace
+
+
+def _long(words, pos):
+    """Целое со знаком из двух слов, записанное Trace._add."""
+    value = words[pos] | words[pos + 1] << 16
+    return value - (1 << 32) if value >> 31 else value
+
+
+def record_source(source, max_steps=None, timeout=None, optimize=False):
+    """
+    Компилирует и исполняет программу без графики, записывая её.
+    Возвращает (Trace, описание ошибки или None).
+    """
+    code = compiler.compile_program(source, optimize)
+    trace = Trace()
+    error = None
+    try:
+        HeadlessRunner(max_steps, timeout, listener=trace.record).run(code)
+    except Exception as e:
+        message, line = describe_error(e)
+        error = {'error': message, 'line': line}
+    return trace, error
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Запись исполнения программы на EPL и рисунок по ней.')
+    parser.add_argument('path', help='программа (.epl) или запись')
+    parser.add_argument('-o', '--output', help='сохранить запись в файл')
+    parser.add_argument('--svg', help='сохранить рисунок в файл SVG')
+    parser.add_argument('--step', type=int, default=None, help='рисунок после этого числа изменений')
+    parser.add_argument('--timeout', type=float, default=None, help='время в секундах')
+    parser.add_argument('--max-steps', type=int, default=None, help='число шагов')
+    parser.add_argument('-O', dest='optimize', action='store_true',
+                        help='оптимизировать программу')
+    args = parser.parse_args(argv)
+
+    with open(args.path, 'rb') as f:
+        data = f.read()
+    if data.startswith(MAGIC):
+        trace = Trace.load(io.BytesIO(data))
+    else:
+        try:
+            trace, error = record_source(data.decode('utf-8'), args.max_steps, args.timeout, args.optimize)
+        except compiler.EPLException as e:
+            print(f'Строка {e.args[1]}: {e.args[0]}', file=sys.stderr)
+            return 1
+        if error is not None:
+            print(f'Строка {error["line"]}: {error["error"]}', file=sys.stderr)
+    print(f'Изменений: {len(trace)}, байт: {trace.words.itemsize * len(trace.words)}', file=sys.stderr)
+    if args.output:
+        with open(args.output, 'wb') as f:
+            trace.save(f)
+    if args.svg:
+        with open(args.svg, 'w', encoding='utf-8') as f:
+            f.write(trace.svg(args.step))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,178 @@
+"""
+Исполнение нескольких программ на EPL на одном поле.
+
+Каждая программа (агент) - свой исполнитель со своей клеткой,
+направлением и пером, а поле с символами (functions.Board) и холст
+общие: символ, написанный одним агентом, видят проверки других
+(ЕСЛИ 'А', СВОБОДНО). Программы исполняются на явном стеке
+(interpreter.Program.steps) и по очереди: за один круг агент делает
+столько шагов (действий и проверок), каков его вес.
+
+Пример:
+    python3 scheduler.py первый.epl второй.epl --weights 1 2
+"""
+
+import argparse
+import json
+import sys
+
+import compiler
+import interpreter
+from functions import Board, Performer, STEP
+from headless import HeadlessCanvas, HeadlessTurtle, StepLimitError, describe_error
+
+
+class Agent:
+    """
+    Одна программа на общем поле. Для кода программы агент - это self:
+    у него есть свой исполнитель t и общий холст canvas.
+    """
+
+    def __init__(self, name, program, board, canvas, weight=1, start=None):
+        self.name = name
+        self.program = program
+        self.weight = weight
+        self.start = start
+        self.t = Performer(HeadlessTurtle(), board)
+        self.canvas = canvas
+        self.steps = 0
+        self.error = None
+        self.finished = False
+
+    def state(self):
+        state = {
+            'name': self.name,
+            'x': self.t.xcor(),
+            'y': self.t.ycor(),
+            'heading': self.t.angle,
+            'pen': self.t.pen,
+            'steps': self.steps,
+            'finished': self.finished,
+            'error': None,
+            'line': None,
+        }
+        if self.error is not None:
+            state['error'], state['line'] = describe_error(self.error)
+        return state
+
+
+class Scheduler:
+    """
+    Исполняет агентов по очереди на общем поле.
+    max_steps - наибольшее число шагов всех агентов вместе,
+    после которого исполнение прерывается с StepLimitError.
+    """
+
+    def __init__(self, max_steps=None):
+        self.board = Board()
+        self.canvas = HeadlessCanvas()
+        self.agents = []
+        self.max_steps = max_steps
+        self.steps = 0
+
+    def add(self, code, name=None, weight=1, start=None, optimize=False):
+        """
+        Добавляет агента. code - текст на EPL или interpreter.Program,
+        weight - шагов за круг (целое не меньше 1), start - клетка
+        (col, row), с которой агент начинает (по умолчанию - центр поля).
+        """
+        if weight < 1:
+            raise ValueError(f'Вес агента должен быть не меньше 1, а не {weight}')
+        if not isinstance(code, interpreter.Program):
+            code = interpreter.load(code, optimize)
+        agent = Agent(name or str(len(self.agents) + 1), code, self.board, self.canvas, weight, start)
+        self.agents.append(agent)
+        return agent
+
+    def run(self):
+        """
+        Исполняет всех агентов до конца. Ошибка агента (выход за край,
+        рекурсия и любая другая) останавливает только его, она сохраняется
+        в agent.error.
+        """
+        self.board.clear(self.canvas)
+        active = []
+        for agent in self.agents:
+            agent.t.reset()
+            agent.t.up()
+            if agent.start is not None:
+                col, row = agent.start
+                agent.t.goto(col * STEP, row * STEP)
+            active.append((agent, agent.program.steps(agent), range(agent.weight)))
+        try:
+            self._loop(active)
+        finally:
+            for agent in self.agents:
+                agent.t.flush()
+
+    def _loop(self, active):
+        max_steps = self.max_steps
+        while active:
+            for item in list(active):
+                agent, steps, turn = item
+                done = 0
+                try:
+                    for _ in turn:
+                        next(steps)
+                        done += 1
+                except StopIteration:
+                    agent.finished = True
+                    active.remove(item)
+                except Exception as e:
+                    agent.error = e
+                    active.remove(item)
+                agent.steps += done
+                self.steps += done
+                if max_steps is not None and self.steps > max_steps:
+                    raise StepLimitError(f'Превышено число шагов: {max_steps}')
+
+    def state(self):
+        """Состояние всех агентов и символы на поле."""
+        return {
+            'agents': [agent.state() for agent in self.agents],
+            'steps': self.steps,
+            'texts': [[col * STEP, row * STEP, text] for col, row, text in self.board.symbols()],
+        }
+
+
+def _weight(value):
+    """Вес для --weights: целое не меньше 1."""
+    weight = int(value)
+    if weight < 1:
+        raise argparse.ArgumentTypeError(f'вес должен быть не меньше 1: {value}')
+    return weight
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Несколько программ на EPL на одном поле.')
+    parser.add_argument('paths', nargs='+', help='файлы с программами')
+    parser.add_argument('--weights', type=_weight, nargs='*', default=None,
+                        help='шагов за круг для каждой программы')
+    parser.add_argument('--max-steps', type=int, default=1_000_000, help='число шагов всех программ')
+    parser.add_argument('-O', dest='optimize', action='store_true',
+                        help='оптимизировать программы')
+    args = parser.parse_args(argv)
+    weights = args.weights or [1] * len(args.paths)
+    if len(weights) != len(args.paths):
+        parser.error(f'--weights: нужно {len(args.paths)} чисел (по одному на программу), а не {len(weights)}')
+
+    scheduler = Scheduler(args.max_steps)
+    for path, weight in zip(args.paths, weights):
+        with open(path, encoding='utf-8') as f:
+            source = f.read()
+        try:
+            scheduler.add(source, path, weight, optimize=args.optimize)
+        except compiler.EPLException as e:
+            print(f'{path}: строка {e.args[1]}: {e.args[0]}', file=sys.stderr)
+            return 1
+    try:
+        scheduler.run()
+    except StepLimitError as e:
+        print(e.args[0], file=sys.stderr)
+    json.dump(scheduler.state(), sys.stdout, ensure_ascii=False, indent=1)
+    sys.stdout.write('\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
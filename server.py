@@ -0,0 +1,279 @@
+"""
+Сервер для проверки и подсветки программ на EPL (JSON-RPC 2.0).
+
+Долго живущий процесс: модули, кэш скомпилированного кода и подсветка
+загружаются один раз, поэтому запрос к маленькой программе обходится
+без запуска Python и импорта Tk. Слушает сокет Unix или порт TCP на
+localhost; каждый запрос и ответ - одна строка JSON.
+
+Методы:
+    compile(source, optimize=False, python=False) - компилирует программу
+        (объект кода остаётся в кэше), python - вернуть и код на Python;
+    run_headless(source, max_steps, timeout, optimize=False, stack=False) -
+        исполняет без графики, ответ как у batch.check_source; max_steps
+        и timeout не больше, чем задано серверу (--max-steps, --timeout);
+    highlight(source, document=None) - лексемы [строка, столбец, длина, тип],
+        document - имя текста: при следующих запросах с ним же заново
+        разбираются только изменившиеся строки (lexer.LineLexer);
+    diagnostics(source, optimize=False) - ошибки компиляции.
+
+Запросы одного соединения исполняются по очереди, разных соединений -
+вперемешку. run_headless исполняется в отдельных процессах (workers),
+поэтому долгая программа не задерживает ответы на другие запросы,
+а программа, которая не уложилась в timeout, прерывается сигналом
+(batch.hard_limit).
+
+Пример:
+    python3 server.py --socket /tmp/epl.sock
+    echo '{"jsonrpc": "2.0", "id": 1, "method": "diagnostics", "params": {"source": "вверх"}}' \\
+        | nc -U /tmp/epl.sock
+"""
+
+import argparse
+import ast
+import asyncio
+import inspect
+import json
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import compiler
+from batch import KILL_GRACE, check_source, hard_limit
+from cache import CompileCache
+from lexer import EPLLexer, LineLexer
+
+MAX_STEPS = 1_000_000
+TIMEOUT = 5.0
+
+# Коды ошибок JSON-RPC.
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+
+# Наибольшая длина одного запроса в байтах.
+LIMIT = 16 * 2 ** 20
+
+
+class RPCError(Exception):
+    pass
+
+
+# Кэши процесса, который исполняет run_headless (_init_worker).
+_worker_caches = {}
+
+
+def _init_worker(directory):
+    _worker_caches[False] = CompileCache(directory=directory)
+    _worker_caches[True] = CompileCache(directory=directory, optimize=True)
+
+
+def _run_headless(source, max_steps, timeout, optimize, stack):
+    """run_headless в процессе из пула."""
+    with hard_limit(timeout + KILL_GRACE):
+        return check_source(source, max_steps, timeout, stack, _worker_caches[optimize])
+
+
+def _limit(name, value, maximum, kind):
+    """Значение ограничения от клиента: по умолчанию и не больше maximum."""
+    if value is None:
+        return maximum
+    if not isinstance(value, (int, float)) or isinstance(value, bool) or value <= 0 \
+            or isinstance(value, float) and not math.isfinite(value):
+        raise RPCError(INVALID_PARAMS, f'Invalid params: {name} must be a positive number')
+    return kind(min(value, maximum))
+
+
+class Server:
+    """
+    Методы JSON-RPC и тёплое состояние: кэши скомпилированного кода
+    (с -O и без) и подсветка. directory - каталог кэша на диске,
+    max_steps и timeout - наибольшие ограничения для run_headless,
+    workers - число процессов для run_headless.
+    """
+
+    def __init__(self, directory=None, max_steps=MAX_STEPS, timeout=TIMEOUT, workers=None):
+        self.directory = directory
+        self.max_steps = max_steps
+        self.timeout = timeout
+        self.workers = workers
+        self.pool = None  # пул процессов, пока работает serve
+        self.caches = {False: CompileCache(directory=directory),
+                       True: CompileCache(directory=directory, optimize=True)}
+        self.lexer = EPLLexer()
+        self.methods = {
+            'compile': self.compile,
+            'run_headless': self.run_headless,
+            'highlight': self.highlight,
+            'diagnostics': self.diagnostics,
+        }
+
+    def compile(self, documents, source, optimize=False, python=False):
+        cache = self.caches[bool(optimize)]
+        result = {'status': 'ok'}
+        try:
+            if python:
+                # Одно дерево и для кода на Python, и для объекта кода в кэше.
+                comp = compiler.Compiler(bool(optimize))
+                comp.feed_text(source)
+                with compiler.python_limits():
+                    module = comp.module()
+                    cache.put(source, compile(module, '<epl>', 'exec'), comp.libraries)
+                    result['python'] = ast.unparse(module)
+            else:
+                cache.get(source)
+        except compiler.EPLException as e:
+            return {'status': 'compile_error', 'error': e.args[0], 'line': e.args[1]}
+        return result
+
+    async def run_headless(self, documents, source, max_steps=None, timeout=None,
+                           optimize=False, stack=False):
+        max_steps = _limit('max_steps', max_steps, self.max_steps, int)
+        timeout = _limit('timeout', timeout, self.timeout, float)
+        if self.pool is None:
+            return check_source(source, max_steps, timeout, stack, self.caches[bool(optimize)])
+        return await asyncio.get_running_loop().run_in_executor(
+            self.pool, _run_headless, source, max_steps, timeout, bool(optimize), bool(stack))
+
+    def highlight(self, documents, source, document=None):
+        if document is None:
+            lines = LineLexer()
+        else:
+            lines = documents.setdefault(document, LineLexer())
+        lines.update(source)
+        return {'tokens': [[token.line, token.column, len(token.value), str(self.lexer.token_type(token))]
+                           for token in lines.tokens()
+                           if token.type is not compiler.TokenType.SPACE]}
+
+    def diagnostics(self, documents, source, optimize=False):
+        result = self.compile(documents, source, optimize)
+        if result['status'] == 'ok':
+            return {'diagnostics': []}
+        return {'diagnostics': [{'line': result['line'], 'message': result['error'], 'severity': 'error'}]}
+
+    async def call(self, request, documents):
+        """Исполняет один запрос (уже разобранный JSON). Возвращает ответ или None для уведомления."""
+        if not isinstance(request, dict) or request.get('jsonrpc') != '2.0' \
+                or not isinstance(request.get('method'), str):
+            return _error(None, INVALID_REQUEST, 'Invalid Request')
+        id_ = request.get('id')
+        method = self.methods.get(request['method'])
+        params = request.get('params', {})
+        try:
+            if method is None:
+                raise RPCError(METHOD_NOT_FOUND, 'Method not found')
+            try:
+                if isinstance(params, list):
+                    args = inspect.signature(method).bind(documents, *params)
+                elif isinstance(params, dict):
+                    args = inspect.signature(method).bind(documents, **params)
+                else:
+                    raise TypeError('params must be an array or an object')
+            except TypeError as e:
+                raise RPCError(INVALID_PARAMS, f'Invalid params: {e}')
+            result = method(*args.args, **args.kwargs)
+            if inspect.isawaitable(result):
+                result = await result
+        except RPCError as e:
+            response = _error(id_, *e.args)
+        except Exception as e:
+            response = _error(id_, INTERNAL_ERROR, f'{type(e).__name__}: {e}')
+        else:
+            response = {'jsonrpc': '2.0', 'id': id_, 'result': result}
+        return None if 'id' not in request else response
+
+    async def handle_line(self, line, documents):
+        """Разбирает строку запроса (или пачки запросов). Возвращает строку ответа или None."""
+        try:
+            request = json.loads(line)
+        except ValueError:
+            return _dump(_error(None, PARSE_ERROR, 'Parse error'))
+        if isinstance(request, list):
+            if not request:
+                return _dump(_error(None, INVALID_REQUEST, 'Invalid Request'))
+            responses = [r for r in [await self.call(x, documents) for x in request] if r is not None]
+            return _dump(responses) if responses else None
+        response = await self.call(request, documents)
+        return None if response is None else _dump(response)
+
+    async def connection(self, reader, writer):
+        """Обслуживает одно соединение. Тексты для highlight у каждого соединения свои."""
+        documents = {}
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:  # строка длиннее LIMIT
+                    writer.write(_dump(_error(None, INVALID_REQUEST, 'Request too large')).encode() + b'\n')
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                response = await self.handle_line(line, documents)
+                if response is not None:
+                    writer.write(response.encode('utf-8') + b'\n')
+                    await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, socket_path=None, host='127.0.0.1', port=0, ready=None):
+        """
+        Слушает сокет Unix socket_path или порт TCP port на host.
+        ready - функция, которая получает адрес, когда сервер готов.
+        """
+        if socket_path is not None:
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)
+            server = await asyncio.start_unix_server(self.connection, socket_path, limit=LIMIT)
+            address = socket_path
+        else:
+            server = await asyncio.start_server(self.connection, host, port, limit=LIMIT)
+            address = server.sockets[0].getsockname()[:2]
+        self.pool = ProcessPoolExecutor(self.workers, initializer=_init_worker, initargs=(self.directory,))
+        try:
+            if ready is not None:
+                ready(address)
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.pool.shutdown(cancel_futures=True)
+            self.pool = None
+
+
+def _error(id_, code, message):
+    return {'jsonrpc': '2.0', 'id': id_, 'error': {'code': code, 'message': message}}
+
+
+def _dump(response):
+    return json.dumps(response, ensure_ascii=False)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Сервер JSON-RPC для программ на EPL.')
+    parser.add_argument('--socket', help='путь к сокету Unix')
+    parser.add_argument('--host', default='127.0.0.1', help='адрес для TCP')
+    parser.add_argument('--port', type=int, default=8765, help='порт TCP')
+    parser.add_argument('--cache', help='каталог для кэша скомпилированного кода')
+    parser.add_argument('--max-steps', type=int, default=MAX_STEPS,
+                        help='наибольшее число шагов программы в run_headless')
+    parser.add_argument('--timeout', type=float, default=TIMEOUT,
+                        help='наибольшее время программы в run_headless, с')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='число процессов для run_headless')
+    args = parser.parse_args(argv)
+
+    server = Server(args.cache, args.max_steps, args.timeout, args.jobs)
+    try:
+        asyncio.run(server.serve(args.socket, args.host, args.port,
+                                 ready=lambda address: print('Слушаю', address, flush=True)))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,38 @@
+import ast
+import asyncio
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
 import unittest
+import unittest.mock
 
-from compiler import Compiler, EPLSyntaxError, EPLNameError, EPLValueError
+from compiler import (compilation as compile_epl, compile_program, compile_stream, translate_stream,
+                      split_lines, Compiler, EPLSyntaxError, EPLNameError, EPLValueError,
+                      scan, tokenize, lex, TokenType)
+from functions import BoundsError, Board, Performer, move, check_edge
+from headless import (HeadlessCanvas, HeadlessTurtle, HeadlessRunner, BackgroundRun, run_headless, error_line,
+                      describe_error, StepLimitError, TimeLimitError, StopExecution)
+from batch import check_source, hard_limit
+from cache import CompileCache, source_key
+from lexer import EPLLexer, LineLexer
+import compiler
+import interpreter
+from profiler import profile_source, MAIN
+import bench
+import epl
+import library
+from scheduler import Scheduler, main as scheduler_main
+from server import Server, METHOD_NOT_FOUND, PARSE_ERROR, INVALID_PARAMS
+from recorder import Trace, record_source, CHECKPOINT
+try:
+    import raster
+except ImportError:  # нет numpy
+    raster = None
 
 
 class TestCompiler(unittest.TestCase):
@@ -11,10 +43,10 @@ class TestCompiler(unittest.TestCase):
     def test_up_down_right_left(self):
         """Тестирует вверх, вниз, вправо, влево."""
         code = 'вверх вниз вправо влево'
-        good_ans = 'self.t.setheading(90)\nself.t.forward(50)\ncheck_hit_edge(self.t)\n'  # вверх
-        good_ans += 'self.t.setheading(-90)\nself.t.forward(50)\ncheck_hit_edge(self.t)\n'  # вниз
-        good_ans += 'self.t.setheading(0)\nself.t.forward(50)\ncheck_hit_edge(self.t)\n'  # вправо
-        good_ans += 'self.t.setheading(180)\nself.t.forward(50)\ncheck_hit_edge(self.t)'  # влево
+        good_ans = 'move(self.t, 90)\n'  # вверх
+        good_ans += 'move(self.t, 270)\n'  # вниз
+        good_ans += 'move(self.t, 0)\n'  # вправо
+        good_ans += 'move(self.t, 180)'  # влево
         self.assertEqual(self.comp.translate(code), good_ans)
 
     def test_up_down_pen(self):
@@ -32,7 +64,7 @@ class TestCompiler(unittest.TestCase):
     def test_write(self):
         """Тестирует 'пиши а' и комментарий."""
         code = 'пиши а'
-        good_ans = 'write(self.t, "А", self.canvas)'
+        good_ans = "write(self.t, 'А', self.canvas)"
         self.assertEqual(self.comp.translate(code), good_ans)
 
     def test_comment(self):
@@ -42,7 +74,7 @@ class TestCompiler(unittest.TestCase):
         """Тестирует определение функции."""
         code = 'это имя вверх конец имя'
         good_ans = 'def ИМЯ(self):\n'
-        good_ans += '    self.t.setheading(90)\n    self.t.forward(50)\n    check_hit_edge(self.t)\n'
+        good_ans += '    move(self.t, 90)\n'
         good_ans += 'ИМЯ(self)'
         self.assertEqual(self.comp.translate(code), good_ans)
 
@@ -50,97 +82,103 @@ class TestCompiler(unittest.TestCase):
         """Тестирует цикл."""
         code = 'повтори 3 вправо конец'
         good_ans = 'for i in range(3):\n'
-        good_ans += '    self.t.setheading(0)\n    self.t.forward(50)\n    check_hit_edge(self.t)'
+        good_ans += '    move(self.t, 0)'
         self.assertEqual(self.comp.translate(code), good_ans)
 
     # Тесты проверок ----------
     def test_check_edge(self):
         code = 'если край: вниз конец'
-        good_ans = 'if check_edge(self.t) :\n'
-        good_ans += '    self.t.setheading(-90)\n    self.t.forward(50)\n    check_hit_edge(self.t)'
+        good_ans = 'if check_edge(self.t):\n'
+        good_ans += '    move(self.t, 270)'
         self.assertEqual(self.comp.translate(code), good_ans)
 
     def test_not_check_edge(self):
         code = 'если не край: вниз конец'
-        good_ans = 'if not check_edge(self.t) :\n'
-        good_ans += '    self.t.setheading(-90)\n    self.t.forward(50)\n    check_hit_edge(self.t)'
+        good_ans = 'if not check_edge(self.t):\n'
+        good_ans += '    move(self.t, 270)'
         self.assertEqual(self.comp.translate(code), good_ans)
 
     def test_is_symbol(self):
         code = 'если символ: вниз конец'
-        good_ans = 'if is_symbol(self.t, "any") :\n'
-        good_ans += '    self.t.setheading(-90)\n    self.t.forward(50)\n    check_hit_edge(self.t)'
+        good_ans = "if is_symbol(self.t, 'any'):\n"
+        good_ans += '    move(self.t, 270)'
         self.assertEqual(self.comp.translate(code), good_ans)
 
     def test_not_is_symbol(self):
         code = 'если не символ: вниз конец'
-        good_ans = 'if not is_symbol(self.t, "any") :\n'
-        good_ans += '    self.t.setheading(-90)\n    self.t.forward(50)\n    check_hit_edge(self.t)'
+        good_ans = "if not is_symbol(self.t, 'any'):\n"
+        good_ans += '    move(self.t, 270)'
         self.assertEqual(self.comp.translate(code), good_ans)
 
     def test_not_symbol(self):
         code = 'если пусто: вниз конец'
-        good_ans = 'if not_symbol(self.t) :\n'
-        good_ans += '    self.t.setheading(-90)\n    self.t.forward(50)\n    check_hit_edge(self.t)'
+        good_ans = 'if not_symbol(self.t):\n'
+        good_ans += '    move(self.t, 270)'
         self.assertEqual(self.comp.translate(code), good_ans)
 
     def test_not_not_symbol(self):
         code = 'если не пусто: вниз конец'
-        good_ans = 'if not not_symbol(self.t) :\n'
-        good_ans += '    self.t.setheading(-90)\n    self.t.forward(50)\n    check_hit_edge(self.t)'
+        good_ans = 'if not not_symbol(self.t):\n'
+        good_ans += '    move(self.t, 270)'
         self.assertEqual(self.comp.translate(code), good_ans)
 
     def test_empty(self):
         code = 'если свободно: вниз конец'
-        good_ans = 'if empty(self.t) :\n'
-        good_ans += '    self.t.setheading(-90)\n    self.t.forward(50)\n    check_hit_edge(self.t)'
+        good_ans = 'if empty(self.t):\n'
+        good_ans += '    move(self.t, 270)'
         self.assertEqual(self.comp.translate(code), good_ans)
 
     def test_not_empty(self):
         code = 'если не свободно: вниз конец'
-        good_ans = 'if not empty(self.t) :\n'
-        good_ans += '    self.t.setheading(-90)\n    self.t.forward(50)\n    check_hit_edge(self.t)'
+        good_ans = 'if not empty(self.t):\n'
+        good_ans += '    move(self.t, 270)'
         self.assertEqual(self.comp.translate(code), good_ans)
 
     def test_if_else(self):
         code = 'если край: вверх иначе: вниз конец'
-        good_ans = 'if check_edge(self.t) :\n'
-        good_ans += '    self.t.setheading(90)\n    self.t.forward(50)\n    check_hit_edge(self.t)\n'
+        good_ans = 'if check_edge(self.t):\n'
+        good_ans += '    move(self.t, 90)\n'
         good_ans += 'else:\n'
-        good_ans += '    self.t.setheading(-90)\n    self.t.forward(50)\n    check_hit_edge(self.t)'
+        good_ans += '    move(self.t, 270)'
         self.assertEqual(self.comp.translate(code), good_ans)
 
     def test_if_elif(self):
         code = 'если край: вниз иначе если свободно: вниз конец'
-        good_ans = 'if check_edge(self.t) :\n'
-        good_ans += '    self.t.setheading(-90)\n    self.t.forward(50)\n    check_hit_edge(self.t)\n'
-        good_ans += 'elif empty(self.t) :\n'
-        good_ans += '    self.t.setheading(-90)\n    self.t.forward(50)\n    check_hit_edge(self.t)'
+        good_ans = 'if check_edge(self.t):\n'
+        good_ans += '    move(self.t, 270)\n'
+        good_ans += 'elif empty(self.t):\n'
+        good_ans += '    move(self.t, 270)'
         self.assertEqual(self.comp.translate(code), good_ans)
 
     def test_is_letter(self):
         code = 'если а: вверх конец'
-        good_ans = 'if is_symbol(self.t, "А") :\n'
-        good_ans += '    self.t.setheading(90)\n    self.t.forward(50)\n    check_hit_edge(self.t)'
+        good_ans = "if is_symbol(self.t, 'А'):\n"
+        good_ans += '    move(self.t, 90)'
         self.assertEqual(self.comp.translate(code), good_ans)
 
     def test_or(self):
         code = 'если край или пусто: вниз конец'
-        good_ans = 'if check_edge(self.t) or not_symbol(self.t) :\n'
-        good_ans += '    self.t.setheading(-90)\n    self.t.forward(50)\n    check_hit_edge(self.t)'
+        good_ans = 'if check_edge(self.t) or not_symbol(self.t):\n'
+        good_ans += '    move(self.t, 270)'
         self.assertEqual(self.comp.translate(code), good_ans)
 
     def test_while(self):
         """Тестирует цикл пока."""
         code = 'пока не край: вверх конец'
-        good_ans = 'while not check_edge(self.t) :\n'
-        good_ans += '    self.t.setheading(90)\n    self.t.forward(50)\n    check_hit_edge(self.t)'
+        good_ans = 'while not check_edge(self.t):\n'
+        good_ans += '    move(self.t, 90)'
         self.assertEqual(self.comp.translate(code), good_ans)
 
     def test_nested(self):
         code = 'это имя если край: вниз конец конец'
-        good_ans = 'def ИМЯ(self):\n    if check_edge(self.t) :\n'
-        good_ans += '        self.t.setheading(-90)\n        self.t.forward(50)\n        check_hit_edge(self.t)'
+        good_ans = 'def ИМЯ(self):\n    if check_edge(self.t):\n'
+        good_ans += '        move(self.t, 270)'
+        self.assertEqual(self.comp.translate(code), good_ans)
+
+    def test_write_string(self):
+        """Тестирует 'пиши' со строкой в кавычках."""
+        code = "пиши 'привет, мир!' ! комментарий"
+        good_ans = "write(self.t, 'ПРИВЕТ, МИР!', self.canvas)"
         self.assertEqual(self.comp.translate(code), good_ans)
 
     # Тесты ошибок ----------
@@ -162,6 +200,23 @@ class TestCompiler(unittest.TestCase):
         with self.assertRaisesRegex(EPLSyntaxError, 'Синтаксическая ошибка: функция без тела'):
             self.comp.translate(code)
 
+    def test_nested_func(self):
+        """Тестирует ЭТО внутри процедуры или цикла."""
+        for code in ('это а это б вверх конец б конец а б', 'повтори 2 это б вверх конец конец'):
+            with self.assertRaisesRegex(EPLSyntaxError, 'ЭТО может стоять только вне процедур'):
+                self.comp.translate(code)
+
+    def test_built_in_ast(self):
+        """Деревья встроенных команд и проверок совпадают с их кодом в built_in_funcs и checks."""
+        for name, code in compiler.built_in_funcs.items():
+            with self.subTest(name=name):
+                self.assertEqual(ast.unparse(compiler.build_command(name, compiler._location(1))),
+                                 ast.unparse(ast.parse('\n'.join(code))))
+        for name in ('КРАЙ', 'СИМВОЛ', 'ПУСТО', 'СВОБОДНО'):
+            with self.subTest(name=name):
+                self.assertEqual(ast.unparse(compiler.build_condition(name, compiler._location(1))),
+                                 ast.unparse(ast.parse(compiler.checks[name])))
+
     def test_undefined_name(self):
         """Тестирует неверное имя."""
         code = 'h'
@@ -191,10 +246,896 @@ class TestCompiler(unittest.TestCase):
         with self.assertRaisesRegex(EPLValueError, 'Цикл должен принимать целое не отрицательное число'):
             self.comp.translate(code)
 
+    def test_unclosed_string(self):
+        code = "пиши 'а"
+        with self.assertRaisesRegex(EPLSyntaxError, 'Синтаксическая ошибка: незакрытая строка'):
+            self.comp.translate(code)
+
     def test_invalid_check(self):
         code = 'если не: вниз конец'
         with self.assertRaisesRegex(EPLSyntaxError, 'Неверная проверка.'):
             self.comp.translate(code)
 
+    def test_else_without_if(self):
+        code = 'повтори 2 вниз иначе: вверх конец'
+        with self.assertRaisesRegex(EPLSyntaxError, 'Синтаксическая ошибка: иначе без если'):
+            self.comp.translate(code)
+
+    def test_if_without_body(self):
+        code = 'если край: иначе: вверх конец'
+        with self.assertRaisesRegex(EPLSyntaxError, 'Синтаксическая ошибка: проверка без тела'):
+            self.comp.translate(code)
+
+    def test_unexpected_end(self):
+        with self.assertRaisesRegex(EPLSyntaxError, 'Синтаксическая ошибка: неожиданный конец программы'):
+            self.comp.translate('пиши')
+        with self.assertRaisesRegex(EPLSyntaxError, 'Синтаксическая ошибка: цикл без тела'):
+            Compiler().translate('повтори 2')
+
+
+class TestTokenize(unittest.TestCase):
+
+    def test_tokenize(self):
+        self.assertEqual(tokenize('ЕСЛИ А1:ВВЕРХ КОНЕЦ'), ['ЕСЛИ', 'А', '1', ':', 'ВВЕРХ', 'КОНЕЦ'])
+        self.assertEqual(tokenize("ПИШИ 'А Б'"), ['ПИШИ', "'А Б'"])
+
+    def test_scan(self):
+        tokens = list(scan("ПОВТОРИ 2\n  ПИШИ 'А'"))
+        self.assertEqual([(t.type, t.value, t.line, t.column) for t in tokens], [
+            (TokenType.CMD, 'ПОВТОРИ', 1, 0),
+            (TokenType.NUMBER, '2', 1, 8),
+            (TokenType.CMD, 'ПИШИ', 2, 2),
+            (TokenType.STRING, "'А'", 2, 7),
+        ])
+
+    def test_invalid_symbol(self):
+        with self.assertRaisesRegex(EPLSyntaxError, 'неверный символ "_"'):
+            tokenize('А_Б')
+
+    def test_lex(self):
+        """lex покрывает весь текст и не вызывает ошибок."""
+        code = "если а: ! комм\n; пиши 'б"
+        tokens = list(lex(code))
+        self.assertEqual(''.join(t.value for t in tokens), code)
+        self.assertEqual([t.type for t in tokens if t.type is TokenType.ERROR], [TokenType.ERROR] * 2)
+        self.assertEqual([(t.value, t.line, t.column) for t in lex("а \n\n 'б'", 3)],
+                         [('а', 3, 0), (' ', 3, 1), ('\n', 3, 2), ('\n', 4, 0), (' ', 5, 0), ("'б'", 5, 1)])
+
+    def test_translate_tokens(self):
+        code = 'это имя ! комм\n  вверх\nконец\nимя'
+        self.assertEqual(Compiler().translate_tokens(lex(code)), Compiler().translate(code))
+        with self.assertRaises(EPLSyntaxError) as e:
+            Compiler().translate_tokens(lex('вверх\n;'))
+        self.assertEqual(e.exception.args[1], 2)
+
+
+class TestLexer(unittest.TestCase):
+
+    def test_tokens(self):
+        from pygments.token import Keyword, Name, String, Comment, Text, Operator
+        code = 'если не край: вверх ! комм'
+        tokens = [(token, text) for _, token, text in EPLLexer().get_tokens_unprocessed(code)]
+        self.assertEqual(tokens, [
+            (Keyword, 'если'), (Text, ' '), (Keyword, 'не'), (Text, ' '), (String, 'край'),
+            (Operator, ':'), (Text, ' '), (Name.Builtin, 'вверх'), (Text, ' '), (Comment, '! комм'),
+        ])
+
+    def test_line_lexer(self):
+        lexer = LineLexer()
+        first, changed = lexer.update('вверх\nвниз\nвлево')
+        self.assertEqual((first, len(changed)), (1, 3))
+        first, changed = lexer.update('вверх\nвправо вниз\nвлево')
+        self.assertEqual(first, 2)
+        self.assertEqual([t.value for t in changed[0]], ['вправо', ' ', 'вниз'])
+        self.assertEqual(lexer.update('вверх\nвправо вниз\nвлево'), (4, []))
+        lexer.update('пиши а\nвверх\nвправо вниз\nвлево')
+        self.assertEqual([(t.value, t.line) for t in lexer.tokens() if t.value.strip()],
+                         [('пиши', 1), ('а', 1), ('вверх', 2), ('вправо', 3), ('вниз', 3), ('влево', 4)])
+
+
+class TestHeadless(unittest.TestCase):
+
+    def test_moves(self):
+        runner = run_headless('опустить вверх вправо')
+        state = runner.state()
+        self.assertEqual((state['x'], state['y']), (50, 50))
+        self.assertEqual(state['segments'], [((0, 0), (0, 50)), ((0, 50), (50, 50))])
+
+    def test_polyline(self):
+        """Шаги по прямой сливаются в один отрезок, отрезки подряд - в одну ломаную."""
+        runner = run_headless('опустить повтори 4 вправо конец вверх влево влево')
+        self.assertEqual(runner.t.turtle.lines, [[(0, 0), (200, 0), (200, 50), (100, 50)]])
+        runner = run_headless('опустить вправо вправо влево поднять вверх опустить вверх')
+        self.assertEqual(runner.t.turtle.lines, [[(0, 0), (100, 0), (50, 0)], [(50, 50), (50, 100)]])
+
+    def test_pen_up(self):
+        """В начале программы перо поднято."""
+        self.assertEqual(run_headless('вверх').state()['segments'], [])
+
+    def test_write_and_check(self):
+        code = 'пиши а если а: вправо конец'
+        state = run_headless(code).state()
+        self.assertEqual(state['texts'], {(0, 0): 'А'})
+        self.assertEqual(state['x'], 50)
+
+    def test_erase(self):
+        self.assertEqual(run_headless('пиши а стереть').state()['texts'], {})
+
+    def test_bounds(self):
+        with self.assertRaises(BoundsError):
+            run_headless('повтори 5 вверх конец')
+
+    def test_recursion(self):
+        code = 'это имя вверх вниз имя конец имя'
+        with self.assertRaises(RecursionError):
+            run_headless(code)
+
+    def test_step_limit(self):
+        with self.assertRaises(StepLimitError):
+            run_headless('пока не край: поднять конец', max_steps=100)
+
+    def test_step_limit_in_checks(self):
+        """Цикл, который ничего не делает, тоже прерывается."""
+        with self.assertRaises(StepLimitError):
+            run_headless('пока не край: если край: вправо конец конец', max_steps=100)
+
+    def test_time_limit(self):
+        with self.assertRaises(TimeLimitError):
+            run_headless('пока не край: поднять конец', timeout=0.01)
+
+    def test_step_limit_in_actions(self):
+        """СТЕРЕТЬ на пустой клетке и циклы без действий тоже считаются."""
+        for code in ('повтори 100000000 стереть конец',
+                     'повтори 100000000 повтори 0 вверх конец конец',
+                     'это ф повтори 0 вверх конец конец повтори 100000000 ф конец'):
+            for stack in (False, True):
+                with self.subTest(code=code, stack=stack):
+                    with self.assertRaises(StepLimitError):
+                        run_headless(code, max_steps=100, stack=stack)
+        self.assertEqual(run_headless('стереть пиши а стереть').steps - run_headless('').steps, 3)
+
+    def test_background(self):
+        run = BackgroundRun(compile_epl('опустить вверх пиши а'))
+        run.start()
+        run.join()
+        events = []
+        while not run.events.empty():
+            events.append(run.events.get())
+        self.assertTrue(run.finished())
+        self.assertIsNone(run.error)
+        self.assertIn(('forward', 50), events)
+        self.assertEqual(events[-1], ('create_text', 0, -50, 'А', 1))
+
+    def test_background_stop(self):
+        run = BackgroundRun(compile_epl('пока не край: поднять конец'), maxsize=10)
+        run.start()
+        run.stop()
+        run.join(1)
+        self.assertFalse(run.is_alive())
+        self.assertIsInstance(run.error, StopExecution)
+
+    def test_background_error(self):
+        run = BackgroundRun(compile_epl('вверх\nесли край: вниз конец'))
+        with unittest.mock.patch('functions.check_edge', side_effect=ZeroDivisionError('division by zero')):
+            run.start()
+            run.join()
+        self.assertIsInstance(run.error, ZeroDivisionError)
+        self.assertEqual(describe_error(run.error)[0], 'Ошибка исполнения: ZeroDivisionError: division by zero')
+
+
+class TestPerformer(unittest.TestCase):
+
+    def test_shadow_state(self):
+        t = Performer(HeadlessTurtle())
+        for heading in (90, 90, 0, 270):
+            move(t, heading)
+        self.assertEqual((t.col, t.row, t.angle), (1, 1, 270))
+        t.flush()
+        self.assertEqual((t.xcor(), t.ycor()), (t.turtle.xcor(), t.turtle.ycor()))
+
+    def test_edge(self):
+        t = Performer(HeadlessTurtle())
+        for _ in range(3):
+            move(t, 0)
+        self.assertFalse(check_edge(t))
+        move(t, 0)
+        self.assertTrue(check_edge(t))
+        with self.assertRaises(BoundsError):
+            move(t, 0)
+        self.assertEqual(t.col, 4)
+
+
+class TestBoard(unittest.TestCase):
+
+    def test_write_erase(self):
+        board = Board()
+        canvas = HeadlessCanvas()
+        board.write(-4, 3, 'А', canvas)
+        board.write(-4, 3, 'Б', canvas)
+        board.write(4, -4, 'В', canvas)
+        self.assertEqual(board.get(-4, 3), 'Б')
+        self.assertIsNone(board.get(3, -4))
+        self.assertEqual(sorted(board.symbols()), [(-4, 3, 'Б'), (4, -4, 'В')])
+        self.assertEqual(len(canvas.items), 2)
+        board.erase(-4, 3, canvas)
+        self.assertEqual(list(board.symbols()), [(4, -4, 'В')])
+        board.clear(canvas)
+        self.assertEqual((list(board.symbols()), canvas.items), ([], {}))
+
+    def test_clear_by_tag(self):
+        """Поле очищается одним удалением, сколько бы ни было надписей."""
+        events = []
+        canvas = HeadlessCanvas(lambda *event: events.append(event))
+        board = Board()
+        for col in range(-4, 5):
+            board.write(col, 0, 'А', canvas)
+        board.clear(canvas)
+        self.assertEqual(events[-1], ('delete', 'epl_text'))
+        self.assertEqual(len(events), 10)
+        self.assertEqual(canvas.items, {})
+
+    def test_separate_runs(self):
+        """У каждого запуска своё поле."""
+        self.assertEqual(run_headless('пиши а').state()['texts'], {(0, 0): 'А'})
+        self.assertEqual(run_headless('вверх пиши б').state()['texts'], {(0, 50): 'Б'})
+
+
+class TestBatch(unittest.TestCase):
+
+    def test_ok(self):
+        result = check_source('пиши а вправо')
+        self.assertEqual(result['status'], 'ok')
+        self.assertEqual(result['state']['x'], 50)
+        self.assertEqual(result['texts'], [[0, 0, 'А']])
+
+    def test_compile_error(self):
+        result = check_source('вверх\nконец')
+        self.assertEqual(result['status'], 'compile_error')
+        self.assertEqual(result['line'], 2)
+
+    def test_bounds_error(self):
+        result = check_source('повтори 5 вниз конец')
+        self.assertEqual(result['status'], 'bounds_error')
+        self.assertEqual((result['state']['y'], result['state']['heading']), (-200, 270))
+
+    def test_step_limit(self):
+        result = check_source('пока не край: поднять конец', max_steps=1000)
+        self.assertEqual(result['status'], 'step_limit')
+
+    def test_runtime_error(self):
+        """Любая другая ошибка исполнения попадает в отчёт, а не прерывает запуск."""
+        with unittest.mock.patch('functions.check_edge', side_effect=ZeroDivisionError('division by zero')):
+            result = check_source('вверх\nесли край: вниз конец')
+        self.assertEqual((result['status'], result['line']), ('runtime_error', 2))
+        self.assertEqual(result['error'], 'Ошибка исполнения: ZeroDivisionError: division by zero')
+
+    def test_hard_limit(self):
+        with self.assertRaises(TimeLimitError):
+            with hard_limit(0.05):
+                while True:
+                    pass
+        with hard_limit(0.05):
+            pass
+        time.sleep(0.1)
+
+
+class TestCache(unittest.TestCase):
+
+    def test_key(self):
+        """Регистр и комментарии не влияют на ключ."""
+        self.assertEqual(source_key('вверх ! комментарий'), source_key('ВВЕРХ'))
+        self.assertNotEqual(source_key('вверх'), source_key('вниз'))
+
+    def test_memory(self):
+        cache = CompileCache(maxsize=1)
+        code = cache.get('вверх')
+        self.assertIs(cache.get('ВВЕРХ'), code)
+        cache.get('вниз')
+        self.assertIsNot(cache.get('вверх'), code)
+        self.assertEqual((cache.hits, cache.misses), (1, 3))
+
+    def test_disk(self):
+        with tempfile.TemporaryDirectory() as directory:
+            code = CompileCache(directory=directory).get('вверх')
+            cache = CompileCache(directory=directory)
+            self.assertEqual(cache.get('вверх'), code)
+            self.assertEqual((cache.hits, cache.misses), (1, 0))
+
+    def test_error_not_cached(self):
+        cache = CompileCache()
+        with self.assertRaises(EPLSyntaxError):
+            cache.get('конец')
+        self.assertEqual(len(cache.memory), 0)
+
+
+class TestAst(unittest.TestCase):
+
+    def test_line_numbers(self):
+        """Номера строк в объекте кода - строки кода на EPL."""
+        code = compile_program('вверх\n\nэто имя\n  вправо\nконец\nимя')
+        lines = {line for _, _, line in code.co_lines() if line}
+        self.assertEqual(lines, {1, 3, 6})
+
+    def test_runtime_error_line(self):
+        code = 'вверх\nэто имя\n  вправо\n  вправо\nконец\nповтори 3\n  имя\nконец'
+        try:
+            run_headless(code)
+        except BoundsError as e:
+            self.assertEqual(error_line(e), 3)
+        else:
+            self.fail('нет BoundsError')
+        result = check_source('вверх\nэто имя вверх вниз имя конец\nимя')
+        self.assertEqual((result['status'], result['line']), ('recursion_error', 2))
+
+    def test_describe_error(self):
+        for code, expected in (('вверх\nэто имя вверх вниз имя конец\nимя', ('Бесконечная рекурсия.', 2)),
+                               ('\n'.join(['вверх'] * 5), ('Не могу!', 5))):
+            try:
+                run_headless(code)
+            except Exception as e:
+                self.assertEqual(describe_error(e), expected)
+            else:
+                self.fail('нет ошибки')
+        self.assertEqual(describe_error(ZeroDivisionError('division by zero')),
+                         ('Ошибка исполнения: ZeroDivisionError: division by zero', None))
+
+    def test_python_limits(self):
+        """Слишком глубокая для Python вложенность - ошибка EPL, а не Python."""
+        for code, line in ((bench.nested_loops(25), 21), (bench.if_chain(3000), None)):
+            with self.assertRaises(EPLSyntaxError) as e:
+                compile_program(code)
+            self.assertEqual(e.exception.args, ('Синтаксическая ошибка: слишком глубокая вложенность', line))
+            self.assertEqual(check_source(code)['status'], 'compile_error')
+            self.assertNotEqual(check_source(code, max_steps=1000, stack=True)['status'], 'compile_error')
+
+    def test_conditions(self):
+        """НЕ связывает сильнее И, И - сильнее ИЛИ."""
+        code = 'если не край или символ и не пусто: вверх конец'
+        self.assertEqual(compile_epl(code).split('\n')[0],
+                         "if not check_edge(self.t) or (is_symbol(self.t, 'any') and (not not_symbol(self.t))):")
+        for code in ('если край не: вверх конец', 'если и край: вверх конец', 'если край + : вверх конец'):
+            with self.assertRaisesRegex(EPLSyntaxError, 'Неверная проверка.'):
+                compile_epl(code)
+
+
+class TestStream(unittest.TestCase):
+
+    def test_split_lines(self):
+        self.assertEqual(list(split_lines('а\r\nб\n\nв\n')), ['а', 'б', '', 'в'])
+        self.assertEqual(list(split_lines(io.StringIO('а\nб'))), ['а', 'б'])
+
+    def test_chunks(self):
+        """Законченные команды выдаются частями, а не копятся в памяти."""
+        comp = Compiler()
+        lines = ('вверх вниз\n' for _ in range(10))
+        sizes = [len(module.body) for module in comp.chunks(lines, size=4)]
+        self.assertEqual(sizes, [4, 4, 4, 4, 4, 0])
+        lines = iter(['это имя\n', 'вверх\n', 'конец\n', 'имя имя\n'])
+        self.assertEqual([len(m.body) for m in Compiler().chunks(lines, size=1)], [1, 2, 0])
+
+    def test_chunk_nodes(self):
+        """Части считаются по узлам: большие процедуры не копятся в одной части."""
+        comp = Compiler()
+        lines = (f'это п{bench.name(i)}\n' + 'вверх вниз\n' * 3 + 'конец\n' for i in range(6))
+        self.assertEqual([len(m.body) for m in comp.chunks(lines, size=14)], [2, 2, 2, 0])
+        self.assertEqual(len(comp.user_funcs), 6)
+        self.assertTrue(all(isinstance(name, str) for name in comp.user_funcs))
+
+    def test_same_code(self):
+        code = 'это имя\n  если край: вверх иначе: вниз конец\nконец\nповтори 2 имя конец'
+        self.assertEqual(''.join(translate_stream(io.StringIO(code))), compile_epl(code) + '\n')
+
+    def test_errors(self):
+        with self.assertRaises(EPLSyntaxError) as e:
+            list(compile_stream(io.StringIO('вверх\nповтори 2\n')))
+        self.assertEqual(e.exception.args, ('Синтаксическая ошибка: цикл без тела', 2))
+        with self.assertRaises(EPLNameError) as e:
+            list(compile_stream(['вверх\n', 'вниз\n', 'х\n']))
+        self.assertEqual(e.exception.args[1], 3)
+
+    def test_run_file(self):
+        state = run_headless(io.StringIO('опустить\nэто шаг вправо конец\nшаг шаг\n')).state()
+        self.assertEqual(state['x'], 100)
+
+
+class TestInterpreter(unittest.TestCase):
+
+    def test_same_result(self):
+        """На явном стеке программа рисует то же, что и обычно."""
+        for code in ('опустить это ф вправо вверх конец повтори 2 ф конец пиши а',
+                     'пиши а если край: вниз иначе если символ: вверх иначе: влево конец',
+                     'опустить пока не край: вправо конец повтори 0 вверх конец',
+                     'это ф вправо если не край: ф конец влево конец опустить ф'):
+            for optimize in (False, True):
+                self.assertEqual(run_headless(code, optimize=optimize, stack=True).state(),
+                                 run_headless(code, optimize=optimize).state())
+
+    def test_deep_recursion(self):
+        """Глубина рекурсии не ограничена стеком Python."""
+        code = 'это ф вправо влево ф конец ф'
+        with self.assertRaises(StepLimitError):
+            run_headless(code, max_steps=100_000, stack=True)
+        with self.assertRaises(RecursionError):
+            run_headless(code, max_steps=100_000)
+
+    def test_memory(self):
+        program = interpreter.load('это ф вправо влево ф конец ф', memory=100 * interpreter.FRAME_SIZE)
+        try:
+            HeadlessRunner().run(program)
+        except RecursionError as e:
+            self.assertEqual(error_line(e), 1)
+        else:
+            self.fail('нет RecursionError')
+
+    def test_errors(self):
+        result = check_source('вверх\nвверх\nповтори 5 вверх конец', stack=True)
+        self.assertEqual((result['status'], result['line']), ('bounds_error', 3))
+
+
+class TestProfiler(unittest.TestCase):
+
+    def test_counts(self):
+        code = 'это шаг\n  вправо\n  если край: влево конец\nконец\nповтори 3 шаг конец\nвверх'
+        profile, error = profile_source(code)
+        self.assertIsNone(error)
+        lines = profile.lines
+        self.assertEqual((lines[2].hits, lines[2].moves), (3, 3))
+        self.assertEqual((lines[3].checks, lines[3].moves), (3, 0))
+        self.assertEqual(lines[5].calls, 3)
+        self.assertEqual(lines[6].moves, 1)
+        self.assertEqual((profile.procedures['ШАГ'].calls, profile.procedures['ШАГ'].moves), (3, 3))
+        self.assertEqual(profile.procedures[MAIN].moves, 1)
+
+    def test_report(self):
+        code = 'повтори 2 вверх конец\nвниз'
+        profile, _ = profile_source(code, optimize=True)
+        report = profile.report(code, sort='moves')
+        self.assertEqual([(row['line'], row['moves'], row['text']) for row in report['lines']],
+                         [(1, 2, 'повтори 2 вверх конец'), (2, 1, 'вниз')])
+
+    def test_error(self):
+        _, error = profile_source('вверх\nповтори 5 вверх конец')
+        self.assertEqual(error, {'error': 'Не могу!', 'line': 2})
+
+    def test_library(self):
+        """Процедуры библиотеки считаются в строках программы, которые их вызвали."""
+        profile, error = profile_source('используй фигуры\nквадрат\nповтори 2 лесенка конец')
+        self.assertIsNone(error)
+        lines = profile.lines
+        self.assertEqual((lines[2].calls, lines[2].moves), (1, 4))
+        self.assertEqual((lines[3].calls, lines[3].moves), (2, 24))
+        self.assertEqual((profile.procedures['КВАДРАТ'].calls, profile.procedures['КВАДРАТ'].moves), (1, 4))
+        self.assertEqual((profile.procedures['ЛЕСЕНКА'].calls, profile.procedures['ЛЕСЕНКА'].moves), (2, 24))
+        self.assertEqual(set(lines), {1, 2, 3})
+
+
+class TestOptimizer(unittest.TestCase):
+
+    def test_merge_moves(self):
+        code = 'вверх вверх вправо вверх вверх вверх'
+        self.assertEqual(compile_epl(code, optimize=True),
+                         'jump(self.t, 90, 2)\nmove(self.t, 0)\njump(self.t, 90, 3)')
+
+    def test_pen(self):
+        self.assertEqual(compile_epl('поднять поднять опустить', optimize=True), 'self.t.down()')
+        self.assertEqual(compile_epl('поднять сброс', optimize=True), 'self.t.reset()')
+
+    def test_loops(self):
+        self.assertEqual(compile_epl('повтори 4 вправо конец', optimize=True), 'jump(self.t, 0, 4)')
+        self.assertEqual(compile_epl('повтори 3 вправо вверх конец', optimize=True),
+                         'walk(self.t, (0, 90), 3)')
+        self.assertEqual(compile_epl('повтори 0 вправо конец повтори 1 вверх конец', optimize=True),
+                         'move(self.t, 90)')
+        self.assertEqual(compile_epl('повтори 2 пиши а конец', optimize=True),
+                         "for i in range(2):\n    write(self.t, 'А', self.canvas)")
+
+    def test_empty_bodies(self):
+        """Тело, из которого оптимизатор всё убрал, не ломает компиляцию."""
+        for code in ('повтори 3 повтори 0 вверх конец конец',
+                     'если край: повтори 0 вверх конец конец',
+                     'это ф повтори 0 вверх конец конец ф',
+                     'пока край: повтори 0 вверх конец конец',
+                     'пока не край: если край: повтори 0 вверх конец конец вправо конец'):
+            for stack in (False, True):
+                with self.subTest(code=code, stack=stack):
+                    a = run_headless(code, optimize=True, stack=stack).state()
+                    b = run_headless(code, stack=stack).state()
+                    self.assertEqual(a, {**b, 'steps': a['steps']})
+                    self.assertEqual(check_source(code, cache=CompileCache(optimize=True))['status'], 'ok')
+
+    def test_same_result(self):
+        """С оптимизацией программа рисует то же самое."""
+        for code in ('опустить повтори 3 вправо вверх конец',
+                     'повтори 3 вправо вверх конец опустить повтори 2 влево вниз влево конец',
+                     'опустить вверх вверх вправо вверх поднять вниз вниз вниз опустить влево'):
+            a = run_headless(code).state()
+            b = run_headless(code, optimize=True).state()
+            del a['steps'], b['steps']
+            self.assertEqual(a, b)
+
+    def test_bounds(self):
+        """Ошибка случается в той же клетке и на той же строке, что и без оптимизации."""
+        for code in ('повтори 6 вправо конец', 'повтори 3 вправо вверх вверх конец',
+                     'вверх\nвверх\nвверх\nвверх\nвверх', 'повтори 5\n  вверх\nконец',
+                     'вправо\nвверх вверх вверх вверх вверх'):
+            a = HeadlessRunner()
+            b = HeadlessRunner()
+            lines = []
+            for runner, optimize in ((a, False), (b, True)):
+                try:
+                    runner.run(compile_program(code, optimize))
+                except BoundsError as e:
+                    lines.append(error_line(e))
+                else:
+                    self.fail('нет BoundsError')
+            self.assertEqual(a.state(), {**b.state(), 'steps': a.state()['steps']})
+            self.assertEqual(lines[0], lines[1], code)
+
+
+class TestRecorder(unittest.TestCase):
+    code = 'опустить\nповтори 600 вверх вправо вниз влево конец\nпиши А вверх пиши Б стереть\nподнять домой пиши В'
+
+    def test_world(self):
+        """Мир, восстановленный по записи, совпадает с миром после исполнения."""
+        trace, error = record_source(self.code)
+        self.assertIsNone(error)
+        runner = run_headless(self.code)
+        turtle, canvas = trace.world()
+        self.assertEqual(turtle.segments, runner.t.turtle.segments)
+        self.assertEqual(sorted(canvas.items.values()), sorted(runner.canvas.items.values()))
+
+    def test_seek(self):
+        trace, _ = record_source(self.code)
+        self.assertGreater(len(trace), 2 * CHECKPOINT)
+        events = list(trace.events())
+        start = CHECKPOINT + 5
+        self.assertEqual(list(trace.events(start, start + 3)), events[start:start + 3])
+        self.assertEqual(list(trace.events(len(trace) - 4)),
+                         [('up',), ('home',), ('delete', 1), ('create_text', 0, 0, 'В', 3)])
+        turtle, _ = trace.world(4)
+        self.assertEqual((turtle.pen, turtle.segments), (True, []))
+
+    def test_save(self):
+        trace, _ = record_source(self.code)
+        file = io.BytesIO()
+        trace.save(file)
+        file.seek(0)
+        loaded = Trace.load(file)
+        self.assertEqual(list(loaded.events()), list(trace.events()))
+        self.assertEqual(list(loaded.events(CHECKPOINT + 1, CHECKPOINT + 3)),
+                         list(trace.events(CHECKPOINT + 1, CHECKPOINT + 3)))
+        # Шаг - одно слово в 2 байта.
+        self.assertLess(len(file.getvalue()), 3 * len(trace))
+
+    def test_svg(self):
+        trace, _ = record_source('опустить вверх вправо пиши Б')
+        svg = trace.svg()
+        self.assertIn('<polyline points="0,0 0,-50 50,-50"', svg)
+        self.assertIn('>Б</text>', svg)
+        self.assertNotIn('polyline', trace.svg(2))
+
+    def test_error(self):
+        trace, error = record_source('вверх\nповтори 5 вверх конец')
+        self.assertEqual(error, {'error': 'Не могу!', 'line': 2})
+        self.assertEqual(trace.world()[0].position(), (0, 200))
+
+
+@unittest.skipIf(raster is None, 'нужен numpy')
+class TestRaster(unittest.TestCase):
+
+    def state(self, code):
+        return run_headless(code).state()
+
+    def test_rasterize(self):
+        pixels, board = raster.rasterize(self.state('опустить вверх вправо пиши А'), 40, 40)
+        self.assertEqual(pixels.shape, (40, 40))
+        # Вертикаль от центра вверх на клетку и горизонталь вправо.
+        self.assertTrue(pixels[15:21, 20].all())
+        self.assertTrue(pixels[15, 20:26].all())
+        self.assertEqual(pixels.sum(), 11)
+        self.assertEqual(board[raster.MAX_ROW - 1, raster.MAX_COL + 1], 'А')
+        self.assertEqual((board != '').sum(), 1)
+
+    def test_score(self):
+        reference = self.state('опустить вверх вправо пиши А')
+        states = [self.state(code) for code in ('опустить вверх вправо пиши А',
+                                                'опустить вправо вверх пиши А',
+                                                'поднять вверх вправо пиши Б',
+                                                'поднять')]
+        scores = raster.score(states, reference)
+        self.assertEqual(list(scores['iou'][[0, 2, 3]]), [1.0, 0.0, 0.0])
+        self.assertLess(scores['iou'][1], 0.1)
+        self.assertEqual(list(scores['board']), [True, True, False, False])
+        self.assertEqual(list(scores['cells']), [0, 4, 3, 3])
+        # Размер, на который число клеток не делится: клетки те же.
+        for width, height in ((100, 30), (70, 130)):
+            with self.subTest(width=width, height=height):
+                self.assertEqual(list(raster.score(states, reference, width, height)['cells']), [0, 4, 3, 3])
+
+    def test_empty(self):
+        empty = self.state('поднять')
+        self.assertEqual(raster.score([empty], empty)['iou'][0], 1.0)
+
+
+class TestScheduler(unittest.TestCase):
+
+    def positions(self, scheduler):
+        return [(agent['x'], agent['y']) for agent in scheduler.state()['agents']]
+
+    def test_shared_board(self):
+        """Второй агент видит символ, который первый написал на шаг раньше."""
+        scheduler = Scheduler()
+        scheduler.add('вправо пиши А')
+        scheduler.add("вправо если 'А': вверх конец")
+        scheduler.run()
+        self.assertEqual(self.positions(scheduler), [(50, 0), (50, 50)])
+        self.assertEqual(scheduler.state()['texts'], [[50, 0, 'А']])
+
+    def test_weights(self):
+        scheduler = Scheduler()
+        scheduler.add('вправо пиши А')
+        scheduler.add("вправо если 'А': вверх конец", weight=2)
+        scheduler.run()
+        self.assertEqual(self.positions(scheduler), [(50, 0), (50, 0)])
+        self.assertEqual(scheduler.steps, 4)
+
+    def test_start_and_errors(self):
+        scheduler = Scheduler()
+        scheduler.add('повтори 3 вверх конец', start=(0, 2))
+        scheduler.add(interpreter.load('это а а конец а', memory=1000 * interpreter.FRAME_SIZE), start=(1, 0))
+        scheduler.add('повтори 3 вниз конец')
+        scheduler.run()
+        first, second, third = scheduler.state()['agents']
+        self.assertEqual((first['error'], first['line'], first['steps']), ('Не могу!', 1, 2))
+        self.assertEqual(second['error'], 'Бесконечная рекурсия.')
+        self.assertEqual((third['finished'], third['y']), (True, -150))
+
+    def test_step_limit(self):
+        scheduler = Scheduler(max_steps=100)
+        scheduler.add('пока не край: вверх вниз конец')
+        with self.assertRaises(StepLimitError):
+            scheduler.run()
+
+    def test_main_weights(self):
+        """Число весов должно совпадать с числом программ."""
+        with contextlib.redirect_stderr(io.StringIO()), self.assertRaises(SystemExit):
+            scheduler_main(['а.epl', 'б.epl', 'в.epl', '--weights', '2'])
+        for weights in (['1', '0'], ['-1', '1']):
+            with contextlib.redirect_stderr(io.StringIO()), self.assertRaises(SystemExit):
+                scheduler_main(['а.epl', 'б.epl', '--weights', *weights])
+        with self.assertRaises(ValueError):
+            Scheduler().add('вверх', weight=0)
+
+
+class TestServer(unittest.TestCase):
+
+    def call(self, server, method, params, documents=None):
+        line = json.dumps({'jsonrpc': '2.0', 'id': 1, 'method': method, 'params': params})
+        return json.loads(self.handle(server, line, {} if documents is None else documents))
+
+    def handle(self, server, line, documents):
+        return asyncio.run(server.handle_line(line, documents))
+
+    def test_methods(self):
+        server = Server()
+        result = self.call(server, 'compile', {'source': 'вверх', 'python': True})['result']
+        self.assertEqual(result, {'status': 'ok', 'python': 'move(self.t, 90)'})
+        result = self.call(server, 'run_headless', ['опустить вверх пиши А'])['result']
+        self.assertEqual((result['status'], result['state']['y'], result['texts']), ('ok', 50, [[0, 50, 'А']]))
+        self.call(server, 'run_headless', {'source': 'вверх'})
+        self.assertEqual(server.caches[False].hits, 1)
+        result = self.call(server, 'diagnostics', {'source': 'вверх\nповтори вверх конец'})['result']
+        self.assertEqual([d['line'] for d in result['diagnostics']], [2])
+        documents = {}
+        result = self.call(server, 'highlight', {'source': 'вверх\nесли край: вниз конец', 'document': 'a'},
+                           documents)['result']
+        self.assertEqual(result['tokens'][:2], [[1, 0, 5, 'Token.Name.Builtin'], [2, 0, 4, 'Token.Keyword']])
+        self.assertIn('a', documents)
+
+    def test_errors(self):
+        server = Server()
+        self.assertEqual(self.call(server, 'nope', {})['error']['code'], METHOD_NOT_FOUND)
+        self.assertEqual(self.call(server, 'compile', {'src': 'x'})['error']['code'], INVALID_PARAMS)
+        self.assertEqual(json.loads(self.handle(server, '{', {}))['error']['code'], PARSE_ERROR)
+        # Уведомление (без id) остаётся без ответа.
+        self.assertIsNone(self.handle(server, '{"jsonrpc": "2.0", "method": "compile", "params": ["x"]}', {}))
+        for limits in ({'max_steps': 'x'}, {'timeout': -1}, {'timeout': 0}, {'timeout': float('nan')},
+                       {'timeout': float('inf')}, {'max_steps': float('nan')}, {'max_steps': float('-inf')}):
+            response = self.call(server, 'run_headless', {'source': 'вверх', **limits})
+            self.assertEqual(response['error']['code'], INVALID_PARAMS)
+
+    def test_limits(self):
+        """Ограничения клиента не больше ограничений сервера."""
+        server = Server(max_steps=100, timeout=1)
+        for params in ({}, {'max_steps': None, 'timeout': None}, {'max_steps': 10 ** 9}):
+            result = self.call(server, 'run_headless', {'source': 'пока не край: поднять конец', **params})
+            self.assertEqual(result['result']['status'], 'step_limit')
+
+    def test_socket(self):
+        async def request(host, port, requests):
+            reader, writer = await asyncio.open_connection(host, port)
+            writer.write(''.join(json.dumps(r) + '\n' for r in requests).encode())
+            responses = [json.loads(await reader.readline()) for _ in requests]
+            writer.close()
+            await writer.wait_closed()
+            return responses
+
+        async def session():
+            ready = asyncio.get_running_loop().create_future()
+            task = asyncio.create_task(Server(timeout=0.5, workers=1).serve(port=0, ready=ready.set_result))
+            host, port = await ready
+            try:
+                # Долгая программа на одном соединении не задерживает другое.
+                slow = asyncio.create_task(request(host, port, [
+                    {'jsonrpc': '2.0', 'id': 0, 'method': 'run_headless',
+                     'params': {'source': 'пока не край: поднять конец', 'max_steps': None, 'timeout': None}}]))
+                fast = await request(host, port, [
+                    {'jsonrpc': '2.0', 'id': i, 'method': 'diagnostics', 'params': {'source': source}}
+                    for i, source in enumerate(('вверх', 'повтори'))])
+                finished_first = not slow.done()
+                return fast, await slow, finished_first
+            finally:
+                task.cancel()
+                with contextlib.suppress(asyncio.CancelledError):
+                    await task
+
+        (first, second), (slow,), finished_first = asyncio.run(session())
+        self.assertEqual(first['result'], {'diagnostics': []})
+        self.assertEqual(second['id'], 1)
+        self.assertEqual(len(second['result']['diagnostics']), 1)
+        self.assertEqual(slow['result']['status'], 'timeout')
+        self.assertTrue(finished_first)
+
+
+class TestCli(unittest.TestCase):
+
+    def write(self, code):
+        with tempfile.NamedTemporaryFile('w', suffix='.epl', encoding='utf-8', delete=False) as f:
+            f.write(code)
+        self.addCleanup(os.unlink, f.name)
+        return f.name
+
+    def main(self, *args):
+        out = io.StringIO()
+        err = io.StringIO()
+        with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+            status = epl.main(list(args))
+        return status, out.getvalue(), err.getvalue()
+
+    def test_commands(self):
+        path = self.write('опустить вверх\nпиши А')
+        self.assertEqual(self.main('check', path), (0, '', ''))
+        self.assertEqual(self.main('compile', path)[1], compile_epl('опустить вверх\nпиши А') + '\n')
+        status, out, _ = self.main('run', path)
+        self.assertEqual(status, 0)
+        self.assertEqual(json.loads(out)['texts'], [[0, 50, 'А']])
+
+    def test_errors(self):
+        path = self.write('вверх\nповтори вверх конец')
+        status, _, err = self.main('check', path)
+        self.assertEqual((status, err), (1, f'{path}:2: Цикл должен принимать целое не отрицательное число\n'))
+        path = self.write('вверх\nповтори 9 вверх конец')
+        for args in (('run', path), ('run', '--stack', path)):
+            status, _, err = self.main(*args)
+            self.assertEqual((status, err), (1, f'{path}:2: Не могу!\n'))
+
+    def test_lazy_imports(self):
+        """Проверка не загружает графику и подсветку."""
+        path = self.write('вверх')
+        code = ('import sys, epl; epl.main(["check", sys.argv[1]]); '
+                'print(sorted({"tkinter", "turtle", "pygments", "headless"} & set(sys.modules)))')
+        out = subprocess.run([sys.executable, '-c', code, path], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout
+        self.assertEqual(out, '[]\n')
+
+
+class TestLibrary(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        library.PATH.insert(0, self.directory)
+        self.addCleanup(library.PATH.remove, self.directory)
+
+    def write(self, name, code):
+        with open(os.path.join(self.directory, name + '.epl'), 'w', encoding='utf-8') as f:
+            f.write(code)
+
+    def test_use(self):
+        self.write('шаги', 'это двавверх вверх вверх конец\nэто туда двавверх вправо конец')
+        code = 'используй шаги\nопустить туда\nэто обратно влево вниз вниз конец\nобратно'
+        expected = run_headless('это двавверх вверх вверх конец\nэто туда двавверх вправо конец\n'
+                                'опустить туда\nэто обратно влево вниз вниз конец\nобратно').state()
+        for stack in (False, True):
+            for optimize in (False, True):
+                state = run_headless(code, optimize=optimize, stack=stack).state()
+                self.assertEqual(state['segments'], expected['segments'])
+        self.assertEqual(compile_epl(code).split('\n')[0], "use('ШАГИ', False, globals())")
+
+    def test_cache(self):
+        """Библиотека компилируется один раз, пока её файл не изменится."""
+        self.write('один', 'это шаг вверх конец')
+        first = library.load('ОДИН')
+        self.assertIs(library.load('ОДИН'), first)
+        compile_program('используй один шаг')
+        self.assertIs(library.load('ОДИН'), first)
+        self.write('один', 'это шаг вниз вниз конец')
+        second = library.load('ОДИН')
+        self.assertIsNot(second, first)
+        self.assertEqual(run_headless('используй один шаг').state()['y'], -100)
+
+    def test_nested(self):
+        self.write('низ', 'это шаг вверх конец')
+        self.write('верх', 'используй низ\nэто дваша шаг шаг конец')
+        self.assertEqual(run_headless('используй верх\nдваша шаг').state()['y'], 150)
+        self.assertEqual(set(library.load('ВЕРХ').uses), {'НИЗ'})
+        self.write('низ', 'это шаг вниз конец')
+        self.assertEqual(run_headless('используй верх\nдваша шаг').state()['y'], -150)
+
+    def test_compile_cache(self):
+        """Кэш программ компилирует заново, если изменилась библиотека."""
+        self.write('низ', 'это шаг вверх конец')
+        self.write('верх', 'используй низ\nэто дваша шаг шаг конец')
+        code = 'используй верх\nдваша шаг'
+        with tempfile.TemporaryDirectory() as directory:
+            for cache in (CompileCache(), CompileCache(directory=directory)):
+                self.write('низ', 'это шаг вверх конец')
+                self.assertEqual(check_source(code, cache=cache)['status'], 'ok')
+                self.write('низ', 'это ход вверх конец')
+                result = check_source(code, cache=cache)
+                self.assertEqual(result['status'], 'compile_error')
+                self.assertIn('ШАГ', result['error'])
+                self.write('низ', 'это шаг вниз конец')
+                self.assertEqual(check_source(code, cache=cache)['state']['y'], -150)
+            cache = CompileCache(directory=directory)
+            self.assertEqual(check_source(code, cache=cache)['state']['y'], -150)
+            self.assertEqual(cache.hits, 1)
+
+    def test_errors(self):
+        self.write('команды', 'это шаг вверх конец\nвверх')
+        self.write('ошибка', 'это шаг\nповтори вверх конец\nконец')
+        self.write('петля', 'используй петля')
+        cases = {
+            'используй нет': ('Не найдена библиотека "НЕТ"', 1),
+            'вверх\nиспользуй команды': ('Библиотека "КОМАНДЫ", строка 2: '
+                                         'В библиотеке могут быть только процедуры и ИСПОЛЬЗУЙ', 2),
+            'используй ошибка': ('Библиотека "ОШИБКА", строка 2: '
+                                 'Цикл должен принимать целое не отрицательное число', 1),
+            'повтори 2 используй команды конец': ('ИСПОЛЬЗУЙ может стоять только вне процедур и циклов.', 1),
+        }
+        for code, error in cases.items():
+            with self.subTest(code=code):
+                with self.assertRaises(compiler.EPLException) as e:
+                    compile_program(code)
+                self.assertEqual(e.exception.args, error)
+        with self.assertRaises(compiler.EPLNameError) as e:
+            compile_program('используй петля')
+        self.assertIn('использует саму себя', e.exception.args[0])
+
+
+class TestBench(unittest.TestCase):
+
+    def test_programs(self):
+        """Созданные программы компилируются и исполняются без ошибок."""
+        for program, (make, sizes) in bench.PROGRAMS.items():
+            with self.subTest(program=program):
+                compile_program(make(sizes[-1]))
+                run_headless(make(sizes[0]), max_steps=10 ** 6)
+
+    def test_compare(self):
+        baseline = {'a': 0.1, 'b': 0.1, 'c': 0.0001, 'd': 0.1}
+        results = {'a': 0.11, 'b': 0.15, 'c': 0.0009, 'e': 1.0}
+        self.assertEqual(bench.compare(results, baseline, 0.2), [('b', 0.1, 0.15)])
+
+    def test_render_headless(self):
+        import bench_render
+        events = []
+        HeadlessRunner(listener=events.append).run(compile_epl('опустить повтори 21 вверх вниз конец пиши а'))
+        frames = len(events) // 20 + 1
+        self.assertEqual(bench_render.render_headless(events, 'normal')[:2], (frames, len(events) - 1))
+        self.assertEqual(bench_render.render_headless(events, 'frames')[:2], (frames, frames))
+        self.assertEqual(bench_render.render_headless(events, 'instant')[:2], (1, 1))
+
 
 unittest.main()